@@ -1,11 +1,30 @@
+import re
+import time
 import logging
+import numpy as np
 import pandas as pd
 import os
+from scipy import sparse
 
 from matplotlib import pyplot as plt
 
 
 class DemandHeat:
+    """
+    Heat demand of the Berlin building stock.
+
+    The tables of the hdf5 file are read only once and kept in memory. Only
+    the requested columns are kept. Reads of tables in the 'table' format are
+    restricted to these columns. Tables in the 'fixed' format (e.g. all
+    tables written by put or set) can only be read completely, so a later
+    request of further columns reads such a table again.
+    The file is opened on demand or once for several operations if the
+    object is used as a context manager::
+
+        with DemandHeat(time_index) as heat_demand:
+            heat_demand.demand_by(...)
+            heat_demand.dissolve(...)
+    """
     def __init__(self, datetime_index=None, method='oeq', **kwargs):
         self.datetime_index = datetime_index
         self.method = method
@@ -13,6 +32,10 @@ class DemandHeat:
             os.path.expanduser("~"), '.reegis_hp', 'heat_demand'))
         self.filename = kwargs.get('filename')
         self.data = None
+        self.cache = dict()
+        self.complete = set()
+        self.reads = 0
+        self.depth = 0
         if self.data is None:
             self.load_data()
         self.annual_demand = None
@@ -33,6 +56,93 @@ class DemandHeat:
         if self.data:
             self.data.close()
 
+    def open(self):
+        """Open the hdf5 file (nested calls are counted)."""
+        if self.depth == 0:
+            self.data.open()
+        self.depth += 1
+
+    def close(self):
+        """Close the hdf5 file if it was opened by the outermost call."""
+        self.depth -= 1
+        if self.depth == 0:
+            self.data.close()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def table(self, table=None, columns=None):
+        """
+        Cached view of a table of the hdf5 file.
+
+        Parameters
+        ----------
+        table : str
+            Name of the table. The table of the method by default.
+        columns : list
+            Columns to read and keep in the cache. All columns if None.
+
+        Returns
+        -------
+        pandas.DataFrame or pandas.Series : The cached object (do not change
+            it).
+        """
+        if table is None:
+            table = self.method
+        cached = self.cache.get(table)
+        if table in self.complete:
+            pass
+        elif (cached is not None and columns is not None and
+                set(columns) <= set(cached.columns)):
+            pass
+        else:
+            with self:
+                self.reads += 1
+                storer = self.data.get_storer(table)
+                if columns is not None and storer.is_table:
+                    missing = [col for col in columns
+                               if cached is None or col not in cached.columns]
+                    new = self.data.select(table, columns=missing)
+                    if cached is None:
+                        cached = new
+                    else:
+                        cached = pd.concat([cached, new], axis=1)
+                else:
+                    # Fixed format tables can only be read completely. Only
+                    # the requested columns are kept in the cache.
+                    new = self.data[table]
+                    if columns is None or isinstance(new, pd.Series):
+                        cached = new
+                    else:
+                        keep = [] if cached is None else list(cached.columns)
+                        keep += [col for col in columns if col not in keep]
+                        cached = new[keep]
+                    if len(cached.shape) == 1 or len(cached.columns) == len(
+                            new.columns):
+                        self.complete.add(table)
+            self.cache[table] = cached
+
+        if columns is None or isinstance(cached, pd.Series):
+            return cached
+        return cached[columns]
+
+    def clear_cache(self):
+        """Remove all tables from the cache and reset the read counter."""
+        self.cache.clear()
+        self.complete.clear()
+        self.reads = 0
+
+    def put(self, table, value):
+        """Write a table to the hdf5 file and the cache."""
+        with self:
+            self.data[table] = value
+        self.cache[table] = value
+        self.complete.add(table)
+
     def demand_by(self, demand_column, heating_systems=None,
                   building_types=None, remove_string='',
                   percentage=False):
@@ -56,7 +166,7 @@ class DemandHeat:
              should be removed to name the results. If the column is
              name "fraction_of_district_heating" the string could be
              "fraction_of_" to use just "district_heating" for the name
-             of the result column.
+             of the result column (second column level).
         percentage : boolean
             True if the fraction of the heating system columns sums up
             to hundred instead of one.
@@ -69,41 +179,64 @@ class DemandHeat:
         else:
             prz = 1
 
-        self.data.open()
         if building_types is None:
             building_types = {'all': '{0} == {0}'.format(demand_column)}
-        demand_by_building = pd.DataFrame(
-            index=self.data[self.method].index)
-        for btype, condition in building_types.items():
-            demand_by_building.loc[self.data[self.method].query(
-                condition).index, btype] = (
-                self.data[self.method][demand_column][self.data[
-                    self.method].query(condition).index])
-
-        demand = pd.DataFrame(index=self.data[self.method].index)
-        loop_list = demand_by_building.keys()
         if heating_systems is None:
-            loop_list = []
             heating_systems = []
-        blist = list()
-        for btype in loop_list:
-            rename_dict = {
-                col: 'demand_' + btype + '_' + col.replace(
-                    remove_string, '')
-                for col in heating_systems}
-            demand = demand.combine_first(
-                self.data[self.method][heating_systems].multiply(
-                    demand_by_building[btype], axis='index').div(prz))
-            demand = demand.rename(columns=rename_dict)
-            blist.extend(list((btype, )) * len(heating_systems))
-        hlist = heating_systems * len(set(blist))
-        multindex = pd.MultiIndex.from_tuples(list(zip(blist, hlist)),
-                                              names=['first', 'second'])
-        self.data['demand_by'] = pd.DataFrame(
-            data=demand.as_matrix(), columns=multindex,
-            index=self.data[self.method].plr_key)
-        self.data['building_types'] = pd.Series(building_types)
-        self.data.close()
+
+        # Read only the columns used by the conditions and the calculation.
+        names = set(re.findall(r'[A-Za-z_][A-Za-z0-9_]*',
+                               ' '.join(building_types.values())))
+        with self:
+            columns = [col for col in self.columns()
+                       if col in names or col in heating_systems or
+                       col in (demand_column, 'plr_key')]
+            data = self.table(columns=columns)
+
+        # Sparse (building x type) matrix with the demand of the buildings
+        # matching each condition. Each condition is evaluated once.
+        rows = [np.flatnonzero(data.eval(condition).values)
+                for condition in building_types.values()]
+        indptr = np.concatenate([[0], np.cumsum([len(r) for r in rows])])
+        rows = np.concatenate(rows).astype(int)
+        demand_by_type = sparse.csc_matrix(
+            (data[demand_column].values[rows], rows, indptr),
+            shape=(len(data), len(building_types)))
+
+        # The (building x type x system) demand is the demand of the
+        # matching buildings times their fractions of the heating systems.
+        # Buildings not matching a type are NaN.
+        types = np.repeat(np.arange(len(building_types)),
+                          np.diff(demand_by_type.indptr))
+        fractions = data[heating_systems].values / prz
+        demand = np.full((len(data), len(building_types),
+                          len(heating_systems)), np.nan)
+        demand[demand_by_type.indices, types] = (
+            demand_by_type.data[:, np.newaxis] *
+            fractions[demand_by_type.indices])
+
+        multindex = pd.MultiIndex.from_product(
+            [list(building_types),
+             [col.replace(remove_string, '') for col in heating_systems]],
+            names=['first', 'second'])
+        with self:
+            self.put('demand_by', pd.DataFrame(
+                data=demand.reshape(len(data), -1), columns=multindex,
+                index=data.plr_key))
+            self.put('building_types', pd.Series(building_types))
+
+    def columns(self, table=None):
+        """Column names of a table without reading the data."""
+        if table is None:
+            table = self.method
+        if table in self.complete:
+            return list(self.cache[table].columns)
+        with self:
+            storer = self.data.get_storer(table)
+            if storer.is_table:
+                return list(storer.non_index_axes[0][1])
+            # The columns of a fixed format DataFrame are stored as 'axis0'.
+            return list(storer.read_index('axis0'))
 
     def dissolve(self, level, table, column=None,
                  grouping_column='plr_key', index=False):
@@ -128,9 +261,9 @@ class DemandHeat:
             Dissolved Column.
 
         """
-        self.data.open()
+        data = self.table(table)
         if column is None:
-            column = list(self.data[table].columns)
+            column = list(data.columns)
 
         error_level = level
         if isinstance(level, str):
@@ -145,58 +278,78 @@ class DemandHeat:
 
         level *= 2
         if index:
-            results = self.data[table].groupby(
-                self.data[table].index.str[:level])[
-                column].sum()
+            results = data.groupby(data.index.str[:level])[column].sum()
         else:
-            results = self.data[table].groupby(
-                self.data[table][grouping_column].str[:level])[
-                column].sum()
+            results = data.groupby(
+                data[grouping_column].str[:level])[column].sum()
 
-        self.data.close()
         self.annual_demand = results
         return results
 
     def print(self, table=None, show_columns=True):
-        self.data.open()
         if table is None:
-            print(self.data)
+            with self:
+                print(self.data)
         else:
             if show_columns:
-                print(self.data[table].columns)
+                print(self.columns(table))
             else:
-                print(self.data[table])
-        self.data.close()
+                print(self.table(table))
 
     def delete(self, table):
-        self.data.open()
-        del self.data[table]
-        self.data.close()
+        with self:
+            del self.data[table]
+        self.cache.pop(table, None)
+        self.complete.discard(table)
 
     def get(self, table=None, columns=None):
-        self.data.open()
-        if table is None:
-            table = self.method
-        if columns is None:
-            tmp = self.data[table].copy()
-        else:
-            tmp = self.data[table][columns].copy()
-        self.data.close()
-        return tmp
+        return self.table(table, columns).copy()
 
     def set(self, series, column, table=None):
-        self.data.open()
         if table is None:
             table = self.method
-        tmp_df = self.data[table]
+        tmp_df = self.table(table).copy()
         tmp_df[column] = series
-        self.data[table] = tmp_df
-        self.data.close()
+        self.put(table, tmp_df)
 
     def sanierung(self):
         pass
 
 
+def benchmark(building_types=None, demand_column='total_loss_pres',
+              remove_string='frac_', **kwargs):
+    """
+    Measure demand_by and dissolve on the full building stock.
+
+    The first run reads the tables from the hdf5 file, the second run uses
+    the cached tables.
+
+    Returns
+    -------
+    pandas.DataFrame : Duration [s] and number of file reads of each run.
+    """
+    if building_types is None:
+        building_types = {'efh': 'floors < 2', 'mfh': 'floors > 1'}
+    report = pd.DataFrame(columns=['duration', 'reads'])
+    with DemandHeat(**kwargs) as heat_demand:
+        heating_systems = [s for s in heat_demand.columns()
+                           if remove_string in s]
+        # The cold run starts with an empty cache.
+        heat_demand.clear_cache()
+        for run in ('cold', 'cached'):
+            reads = heat_demand.reads
+            start = time.time()
+            heat_demand.demand_by(demand_column, heating_systems,
+                                  building_types, remove_string,
+                                  percentage=True)
+            heat_demand.dissolve('bezirk', 'demand_by', index=True)
+            report.loc[run] = (time.time() - start,
+                               heat_demand.reads - reads)
+    logging.info("DemandHeat benchmark ({0} buildings):\n{1}".format(
+        len(heat_demand.table()), report))
+    return report
+
+
 if __name__ == "__main__":
     my = DemandHeat()
 
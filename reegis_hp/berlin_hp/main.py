@@ -16,12 +16,10 @@ import reegis_hp.berlin_hp.heat as heat
 import reegis_hp.berlin_hp.preferences as preferences
 import reegis_hp.berlin_hp.create_objects as create_objects
 import reegis_hp.berlin_hp.plot as plot
+import reegis_hp.de21.rolling_horizon as rolling_horizon
 
 import os
 
-# Define logger
-logger.define_logging()
-
 
 def initialise_energy_system():
     logging.info("Creating energy system object.")
@@ -30,8 +28,9 @@ def initialise_energy_system():
     return solph.EnergySystem(time_idx=time_index, groupings=solph.GROUPINGS)
 
 
-def berlin_model(berlin_e_system):
+def add_berlin_nodes(berlin_e_system):
     """
+    Add the nodes of the berlin model to the energy system.
 
     Parameters
     ----------
@@ -39,7 +38,7 @@ def berlin_model(berlin_e_system):
 
     Returns
     -------
-
+    solph.EnergySystem
     """
     time_index = berlin_e_system.time_idx
     p = preferences.Basic()
@@ -50,14 +49,15 @@ def berlin_model(berlin_e_system):
     # Electricity
     solph.Bus(label='bus_el')
 
-    heat_demand = heat.DemandHeat(time_index)
-    heating_systems = [s for s in heat_demand.get().columns if "frac_" in s]
+    with heat.DemandHeat(time_index) as heat_demand:
+        heating_systems = [s for s in heat_demand.columns() if "frac_" in s]
 
-    remove_string = 'frac_'
-    heat_demand.demand_by('total_loss_pres', heating_systems, d.bt_dict,
-                          remove_string, percentage=True)
+        remove_string = 'frac_'
+        heat_demand.demand_by('total_loss_pres', heating_systems, d.bt_dict,
+                              remove_string, percentage=True)
 
-    heat_demand.df = heat_demand.dissolve('bezirk', 'demand_by', index=True)
+        heat_demand.df = heat_demand.dissolve('bezirk', 'demand_by',
+                                              index=True)
 
     heat_demand.df = heat_demand.df.rename(
         columns={k: k.replace('frac_', '')
@@ -257,6 +257,40 @@ def berlin_model(berlin_e_system):
 
     # import pprint as pp
     # pp.pprint(berlin_e_system.groups)
+    return berlin_e_system
+
+
+def berlin_energy_system():
+    """Energy system with all nodes of the berlin model."""
+    return add_berlin_nodes(initialise_energy_system())
+
+
+def berlin_model(berlin_e_system, window=None, overlap=24):
+    """
+
+    Parameters
+    ----------
+    berlin_e_system : solph.EnergySystem
+    window : int
+        Number of time steps of each window of the rolling horizon solve
+        (see reegis_hp.de21.rolling_horizon). The full time index is solved
+        at once if None.
+    overlap : int
+        Number of overlapping time steps of the windows.
+
+    Returns
+    -------
+
+    """
+    add_berlin_nodes(berlin_e_system)
+
+    if window is not None:
+        logging.info('Optimise the energy system (rolling horizon)')
+        results, costs = rolling_horizon.solve_rolling_horizon(
+            berlin_e_system, 'gurobi', window, overlap)
+        logging.info('Variable costs: {0}'.format(costs))
+        berlin_e_system.results_table = results
+        return berlin_e_system
 
     logging.info('Optimise the energy system')
 
@@ -273,13 +307,24 @@ def berlin_model(berlin_e_system):
     berlin_e_system.dump('/home/uwe/')
     return berlin_e_system
 
-# **********************************
-restore = False
 
-if not restore:
-    berlin_e_sys = berlin_model(initialise_energy_system())
-else:
-    berlin_e_sys = initialise_energy_system()
-    berlin_e_sys.restore('/home/uwe/')
+if __name__ == "__main__":
+    # Define logger
+    logger.define_logging()
+
+    restore = False
+    benchmark = False
+
+    if benchmark:
+        # Compare a rolling horizon solve (one week, one day overlap) with
+        # the full solve.
+        rolling_horizon.benchmark(berlin_energy_system, 'gurobi',
+                                  window=168, overlap=24)
+
+    if not restore:
+        berlin_e_sys = berlin_model(initialise_energy_system())
+    else:
+        berlin_e_sys = initialise_energy_system()
+        berlin_e_sys.restore('/home/uwe/')
 
-plot.test_plots(berlin_e_sys)
+    plot.test_plots(berlin_e_sys)
@@ -82,7 +82,8 @@ def analyse_pv_types(year, key, orientation):
                          index_col='gid').loc[key]
     location = {'latitude': latlon['st_y'], 'longitude': latlon['st_x']}
 
-    weather = f.adapt_weather_to_pvlib(weather, location)
+    geometry = f.solar_geometry_cell(c, year, key)
+    weather = f.adapt_weather_to_pvlib(weather, location, geometry=geometry)
 
     sandia_modules = pvlib.pvsystem.retrieve_sam('sandiamod')
     sapm_inverters = pvlib.pvsystem.retrieve_sam('sandiainverter')
@@ -109,7 +110,8 @@ def analyse_pv_types(year, key, orientation):
             smodule['module_parameters'].Impo *
             smodule['module_parameters'].Vmpo)
 
-        mc = f.feedin_pvlib_modelchain(location, smodule, weather)
+        mc = f.feedin_pvlib_modelchain(location, smodule, weather,
+                                       geometry=geometry)
         df_ts_ac[name] = mc.ac.clip(0).fillna(0).div(p_peak)
         df.loc[name, 'ac'] = df_ts_ac[name][:8760].sum()
         df.loc[name, 'dc_norm'] = mc.dc.p_mp.clip(0).div(p_peak).sum()
@@ -138,7 +140,8 @@ def analyse_performance_ratio(year, key):
                          index_col='gid').loc[key]
     location = {'latitude': latlon['st_y'], 'longitude': latlon['st_x']}
 
-    weather = f.adapt_weather_to_pvlib(weather, location)
+    geometry = f.solar_geometry_cell(c, year, key)
+    weather = f.adapt_weather_to_pvlib(weather, location, geometry=geometry)
 
     sandia_modules = pvlib.pvsystem.retrieve_sam('sandiamod')
     sapm_inverters = pvlib.pvsystem.retrieve_sam('sandiainverter')
@@ -169,7 +172,8 @@ def analyse_performance_ratio(year, key):
                     smodule['module_parameters'].Vmpo)
                 area = smodule['module_parameters'].Area
 
-                mc = f.feedin_pvlib_modelchain(location, smodule, weather)
+                mc = f.feedin_pvlib_modelchain(location, smodule, weather,
+                                               geometry=geometry)
                 dc = mc.dc.p_mp.clip(0).div(p_peak).sum()
                 ac = mc.ac.clip(0).div(p_peak).sum()
                 i = mc.total_irrad['poa_global'].multiply(area).div(
@@ -223,7 +227,9 @@ def analyse_pv_orientation_region():
                 index_col='gid').loc[key]
             location = {'latitude': latlon['st_y'], 'longitude': latlon['st_x']}
 
-            weather = f.adapt_weather_to_pvlib(weather, location)
+            geometry = f.solar_geometry_cell(c, year, key)
+            weather = f.adapt_weather_to_pvlib(weather, location,
+                                               geometry=geometry)
 
             sandia_modules = pvlib.pvsystem.retrieve_sam('sandiamod')
             sapm_inverters = pvlib.pvsystem.retrieve_sam('sandiainverter')
@@ -257,8 +263,8 @@ def analyse_pv_orientation_region():
                             smodule['module_parameters'].Impo *
                             smodule['module_parameters'].Vmpo)
 
-                        mc = f.feedin_pvlib_modelchain(location, smodule,
-                                                       weather)
+                        mc = f.feedin_pvlib_modelchain(
+                            location, smodule, weather, geometry=geometry)
                         dc.loc[az, tlt] = mc.dc.p_mp.clip(0).div(p_peak).sum()
                         ac.loc[az, tlt] = mc.ac.clip(0).div(p_peak).sum()
                         ir.loc[az, tlt] = mc.total_irrad['poa_global'].clip(
@@ -299,7 +305,8 @@ def analyse_pv_orientation(year, key, module_name):
                          index_col='gid').loc[key]
     location = {'latitude': latlon['st_y'], 'longitude': latlon['st_x']}
 
-    weather = f.adapt_weather_to_pvlib(weather, location)
+    geometry = f.solar_geometry_cell(c, year, key)
+    weather = f.adapt_weather_to_pvlib(weather, location, geometry=geometry)
 
     sandia_modules = pvlib.pvsystem.retrieve_sam('sandiamod')
     sapm_inverters = pvlib.pvsystem.retrieve_sam('sandiainverter')
@@ -330,7 +337,8 @@ def analyse_pv_orientation(year, key, module_name):
                 smodule['module_parameters'].Impo *
                 smodule['module_parameters'].Vmpo)
 
-            mc = f.feedin_pvlib_modelchain(location, smodule, weather)
+            mc = f.feedin_pvlib_modelchain(location, smodule, weather,
+                                           geometry=geometry)
             df_dc.loc[az, tlt] = mc.dc.p_mp.clip(0).div(p_peak).sum()
             df_ac.loc[az, tlt] = mc.ac.clip(0).div(p_peak).sum()
             # print(mc.total_irrad.columns)
@@ -350,7 +358,8 @@ def analyse_inverter(year, key, module_name, orientation):
                                       c.files['grid_centroid']),
                          index_col='gid').loc[key]
     location = {'latitude': latlon['st_y'], 'longitude': latlon['st_x']}
-    weather = f.adapt_weather_to_pvlib(weather, location)
+    geometry = f.solar_geometry_cell(c, year, key)
+    weather = f.adapt_weather_to_pvlib(weather, location, geometry=geometry)
     sandia_modules = pvlib.pvsystem.retrieve_sam('sandiamod')
     sapm_inverters = pvlib.pvsystem.retrieve_sam('sandiainverter')
 
@@ -371,7 +380,8 @@ def analyse_inverter(year, key, module_name, orientation):
                 smodule['module_parameters'].Impo *
                 smodule['module_parameters'].Vmpo)
         try:
-            mc = f.feedin_pvlib_modelchain(location, smodule, weather)
+            mc = f.feedin_pvlib_modelchain(location, smodule, weather,
+                                           geometry=geometry)
             inv.loc[name, 'ac'] = mc.ac.clip(0).fillna(0).div(p_peak).sum()
             inv.loc[name, 'dc'] = mc.dc.p_mp.clip(0).fillna(0).div(p_peak).sum()
         except ValueError:
@@ -391,7 +401,8 @@ def single_pv_set(year, key, module_name, inverter_name, orientation):
                                       c.files['grid_centroid']),
                          index_col='gid').loc[key]
     location = {'latitude': latlon['st_y'], 'longitude': latlon['st_x']}
-    weather = f.adapt_weather_to_pvlib(weather, location)
+    geometry = f.solar_geometry_cell(c, year, key)
+    weather = f.adapt_weather_to_pvlib(weather, location, geometry=geometry)
     sandia_modules = pvlib.pvsystem.retrieve_sam('sandiamod')
     sapm_inverters = pvlib.pvsystem.retrieve_sam('sandiainverter')
 
@@ -405,7 +416,8 @@ def single_pv_set(year, key, module_name, inverter_name, orientation):
             smodule['module_parameters'].Impo *
             smodule['module_parameters'].Vmpo)
 
-    mc = f.feedin_pvlib_modelchain(location, smodule, weather)
+    mc = f.feedin_pvlib_modelchain(location, smodule, weather,
+                                   geometry=geometry)
     ac = mc.ac  # .clip(0).fillna(0).div(p_peak)
     dc = mc.dc.p_mp  # .clip(0).fillna(0).div(p_peak)
 
@@ -118,6 +118,25 @@ def get(section, key):
                     return cfg.get(section, key)
 
 
+def get_default(section, key, default=None):
+    """
+    returns the value of a given key of a given section of the main
+    config file or the default value if the section or the key does not
+    exist.
+
+    :param section: the section.
+    :type section: str.
+    :param key: the key.
+    :type key: str.
+    :param default: the value that is returned if the key does not exist.
+
+    """
+    try:
+        return get(section, key)
+    except (cp.NoSectionError, cp.NoOptionError):
+        return default
+
+
 def get_list(section, parameter):
     try:
         my_list = cfg.get(section, parameter).split(',')
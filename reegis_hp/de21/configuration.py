@@ -300,6 +300,8 @@ def get_configuration():
     c.files['grid_geometry'] = cfg.get('weather', 'grid_polygons')
     c.files['region_geometry'] = cfg.get('weather', 'clip_geometry')
     c.pattern['weather'] = cfg.get('weather', 'file_pattern')
+    c.pattern['weather_columns'] = cfg.get_default(
+        'weather', 'column_file_pattern', 'coastDat2_de_columns_{year}.h5')
     c.files['average_wind_speed'] = cfg.get('weather', 'avg_wind_speed_file')
 
     # ********* geometry *****************************************************
@@ -352,12 +354,19 @@ def get_configuration():
     c.pattern['feedin'] = cfg.get('feedin', 'feedin_file_pattern')
     c.pattern['feedin_de21'] = cfg.get('feedin', 'feedin_de21_pattern')
     c.general['solar_set'] = cfg.get('solar', 'solar_set')
+    c.general['feedin_workers'] = cfg.get_default('feedin', 'workers', 1)
+    c.general['feedin_chunk_size'] = cfg.get_default('feedin', 'chunk_size',
+                                                     100)
 
     # ******** scenario ******************************************************
     c.general['name'] = cfg.get('general', 'name')
     c.general['year'] = cfg.get('general', 'year')
     c.general['weather_year'] = cfg.get('general', 'weather_year')
     c.general['demand_year'] = cfg.get('general', 'demand_year')
+    c.general['demand_kind'] = cfg.get_default('general', 'demand_kind',
+                                               'openego')
+    c.general['annual_demand'] = cfg.get_default('general', 'annual_demand',
+                                                 None)
     c.general['optimisation_target'] = cfg.get('general', 'optimisation_target')
     c.general['local_sources'] = get_list('general', 'local_commodity_sources')
 
@@ -1,6 +1,7 @@
 import pandas as pd
 import scenario_tools as sc
 import os
+import calendar
 import logging
 from oemof.tools import logger
 import configuration as config
@@ -11,11 +12,13 @@ from shapely.wkt import loads as wkt_loads
 import powerplants as pp
 
 
-def commodity_sources(round_nominal_value=True):
+def commodity_sources(c, de21, round_nominal_value=True):
     """
 
     Parameters
     ----------
+    c : ConfigurationDe21
+    de21 : scenario_tools.SolphScenario
     round_nominal_value : boolean
         Will round the nominal_value entry to integer. Should be set to False
         if the nominal_values are small.
@@ -54,7 +57,7 @@ def commodity_sources(round_nominal_value=True):
             val.summed_max = 1.0
 
         values = [val.limit, val.summed_max, val.costs, '{0}_1'.format(region)]
-        de21.add_parameters(idx, columns, values)
+        de21.stage_parameters(idx, columns, values)
 
     # global commodity sources
     globalfile = os.path.join(c.paths['scenario_path'],
@@ -88,7 +91,7 @@ def commodity_sources(round_nominal_value=True):
     return commoditybuses
 
 
-def transformer(com_buses, round_nominal_value=True):
+def transformer(c, de21, com_buses, round_nominal_value=True):
     """
     Add transformer and connect them to their source bus.
 
@@ -122,11 +125,45 @@ def transformer(com_buses, round_nominal_value=True):
                        '{0}_1_{1}a'.format(reg, fuel_type[:5])]
             values2 = '{0}_1_{1}b'.format(reg, fuel_type[:5])
             if values['capacity'] > 0:
-                de21.add_parameters(idx1, cols1, values1)
-                de21.add_parameters(idx2, cols2, values2)
+                de21.stage_parameters(idx1, cols1, values1)
+                de21.stage_parameters(idx2, cols2, values2)
 
 
-def renewable_sources(round_nominal_value=True):
+def move_to_year(df, year):
+    """
+    Move hourly sequences of another year (e.g. the weather or demand year)
+    to the given year. The time steps keep their month, day and hour. The
+    29th of February is dropped or copied from the 28th of February if only
+    one of the years is a leap year.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Sequences with a naive DatetimeIndex.
+    year : int
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    shift = year - df.index.year.value_counts().idxmax()
+    if shift == 0:
+        return df
+    logging.info("Moving sequences from {0} to {1}.".format(year - shift,
+                                                            year))
+    feb29 = (df.index.month == 2) & (df.index.day == 29)
+    df = df.loc[~feb29].copy()
+    df.index = pd.DatetimeIndex([t.replace(year=t.year + shift)
+                                 for t in df.index])
+    if calendar.isleap(year):
+        added = df.loc[(df.index.month == 2) & (df.index.day == 28) &
+                       (df.index.year == year)].copy()
+        added.index = added.index + pd.Timedelta(days=1)
+        df = pd.concat([df, added]).sort_index()
+    return df
+
+
+def renewable_sources(c, de21, round_nominal_value=True):
     """
     Add renewable sources.
 
@@ -136,6 +173,7 @@ def renewable_sources(round_nominal_value=True):
     seq = pd.read_csv(os.path.join(c.paths['scenario_path'],
                                    'sources_timeseries.csv'),
                       index_col=[0], header=[0, 1], parse_dates=True)
+    seq = move_to_year(seq, c.general['year'])
     seq.index = seq.index.tz_localize('UTC').tz_convert('Europe/Berlin')
 
     cap = pd.read_csv(os.path.join(c.paths['scenario_path'],
@@ -154,12 +192,12 @@ def renewable_sources(round_nominal_value=True):
             cols = ['nominal_value', 'actual_value', 'fixed', 'sort_index']
             values = [capacity, 'seq', 1, '{0}_2'.format(reg)]
             if capacity > 0:
-                de21.add_parameters(idx, cols, values)
+                de21.stage_parameters(idx, cols, values)
                 idx = ['Source', label, label, target, 'actual_value']
-                de21.add_sequences(idx, seq[reg, vtype])
+                de21.stage_sequences(idx, seq[reg, vtype])
 
 
-def demand_sinks(round_nominal_value=True):
+def demand_sinks(c, de21, round_nominal_value=True):
     """
     Add demand sinks.
 
@@ -167,6 +205,7 @@ def demand_sinks(round_nominal_value=True):
     """
     df = pd.read_csv(os.path.join(c.paths['scenario_path'], 'demand.csv'),
                      index_col=[0], parse_dates=True)
+    df = move_to_year(df, c.general['year'])
     df.index = df.index.tz_localize('UTC').tz_convert('Europe/Berlin')
 
     for reg in df.columns:
@@ -179,12 +218,12 @@ def demand_sinks(round_nominal_value=True):
         cols = ['nominal_value', 'actual_value', 'fixed', 'sort_index']
         values = [max_demand, 'seq', 1, '{0}_3'.format(reg)]
         if max_demand > 0:
-            de21.add_parameters(idx, cols, values)
+            de21.stage_parameters(idx, cols, values)
             idx = ['Sink', label, source, label, 'actual_value']
-            de21.add_sequences(idx, df[reg] / max_demand)
+            de21.stage_sequences(idx, df[reg] / max_demand)
 
 
-def storages(round_nominal_value=True):
+def storages(c, de21, round_nominal_value=True):
     """Storages """
     df = pd.read_csv(os.path.join(c.paths['scenario_path'], 'storages.csv'),
                      index_col=[0], parse_dates=True)
@@ -207,38 +246,38 @@ def storages(round_nominal_value=True):
                    '{0}_4a'.format(reg)]
         values2 = [values.max_out, '{0}_4b'.format(reg)]
         if values.capacity > 0:
-            de21.add_parameters(idx1, cols1, values1)
-            de21.add_parameters(idx2, cols2, values2)
+            de21.stage_parameters(idx1, cols1, values1)
+            de21.stage_parameters(idx2, cols2, values2)
 
 
-def shortage_sources(shortage_regions, var_costs=1000):
+def shortage_sources(de21, shortage_regions, var_costs=1000):
     """Shortage sources"""
     for reg in shortage_regions:
         label = '{0}_{1}'.format(reg, 'shortage')
         idx = ('Source', label, label, '{0}_bus_el'.format(reg))
         cols = ['variable_costs', 'sort_index']
         values = [var_costs, '{0}_5a'.format(reg)]
-        de21.add_parameters(idx, cols, values)
+        de21.stage_parameters(idx, cols, values)
 
 
-def excess_sinks(excess_regions):
+def excess_sinks(de21, excess_regions):
     """Shortage sources"""
     for reg in excess_regions:
         label = '{0}_{1}'.format(reg, 'excess')
         idx = ('Sink', label, '{0}_bus_el'.format(reg), label)
         cols = ['sort_index']
         values = '{0}_5b'.format(reg)
-        de21.add_parameters(idx, cols, values)
+        de21.stage_parameters(idx, cols, values)
 
 
-def powerlines(round_nominal_value=True):
+def powerlines(c, de21, round_nominal_value=True):
     """Grid"""
     powerlinefile = os.path.join(c.paths['scenario_path'], 'transmission.csv')
 
     if os.path.isfile(powerlinefile):
         df = pd.read_csv(powerlinefile, index_col=[0])
 
-        de21.add_comment_line('POWERLINES', 'P_DE00_DE00_0')
+        de21.stage_comment_line('POWERLINES', 'P_DE00_DE00_0')
         for line, value in df.iterrows():
             if round_nominal_value:
                 value['capacity'] = round(value['capacity'])
@@ -257,225 +296,281 @@ def powerlines(round_nominal_value=True):
                            'P_{0}_1a'.format(line)]
                 values2 = 'P_{0}_1b'.format(line)
                 if value['capacity'] > 0:
-                    de21.add_parameters(idx1, cols1, values1)
-                    de21.add_parameters(idx2, cols2, values2)
+                    de21.stage_parameters(idx1, cols1, values1)
+                    de21.stage_parameters(idx2, cols2, values2)
 
 
-def create_objects_from_dataframe_collection():
+def create_objects_from_dataframe_collection(c, de21, regions,
+                                             write_table=True):
     # Add objects to scenario tables
     de21.create_tables()
     logging.info("Add objects to scenario tables.")
 
     # Add comment lines to get a better overview
-    de21.add_comment_line('GLOBAL RESOURCES', '0000_0')
+    de21.stage_comment_line('GLOBAL RESOURCES', '0000_0')
     for r in regions:  # One comment line for every region
-        de21.add_comment_line('{0}'.format(r), '{0}_0'.format(r))
+        de21.stage_comment_line('{0}'.format(r), '{0}_0'.format(r))
 
     # Add objects
-    commodity_buses = commodity_sources()
-    transformer(commodity_buses)
-    renewable_sources()
-    demand_sinks()
-    storages()
-    shortage_sources(regions)
-    excess_sinks(regions)
-    powerlines()
+    commodity_buses = commodity_sources(c, de21)
+    transformer(c, de21, commodity_buses)
+    renewable_sources(c, de21)
+    demand_sinks(c, de21)
+    storages(c, de21)
+    shortage_sources(de21, regions)
+    excess_sinks(de21, regions)
+    powerlines(c, de21)
     # Sort table and store it.
     logging.info("Sort and store files.")
+    de21.commit()
     if write_table:
         de21.write_tables()
 
 
-# Define default logger
-logger.define_logging()
-c = config.get_configuration()
-read_only = cfg.get('csv', 'read_only')
-write_table = cfg.get('csv', 'write_table')
-solver = cfg.get('general', 'solver')
-
-# neu = pd.read_csv('/home/uwe/express/reegis/oep_demand.ego_dp_loadarea_v0.2.10.csv',
-#                   index_col=[0])
-# print(len(neu))
-# exit(0)
-# del neu['geom_centre']
-# del neu['geom']
-# neu = neu.groupby('rs_0').sum()
-# neu.to_csv('/home/uwe/express/reegis/oep_demand.ego_dp_loadarea_v0.2.10b.csv')
-f = ('/home/uwe/express/reegis/' +
-     'oedb.demand.ego_dp_loadarea_v0.2.10_WGS84_170721.csv')
-# neu = pd.read_csv(f, index_col=[0])
-# print(neu.sum())
-# neu['consumption_per_ha'] = neu['sector_consumption_sum'] / neu['area_ha']
-# neu['consumption_per_ew'] = neu['sector_consumption_sum'] / neu['zensus_sum']
-#
-# neu['geom'] = neu.st_astext.apply(wkt_loads)
-# gneu = pp.create_geo_df(neu)
-#
-# # Add column with region id
-# gneu = pp.add_spatial_name(
-#     c, gneu, os.path.join(c.paths['geometry'],
-#                           c.files['region_polygons']),
-#     'region', 'ego_load')
-# gneu.to_file('/home/uwe/test2.shp')
-# neu['region'] = gneu['region']
-# del neu['geom']
-# neu.to_csv('/home/uwe/express/reegis/oep_demand_de21.csv')
-# bla = pd.read_csv('/home/uwe/express/reegis/oep_demand_de21.csv',
-#                   index_col=[0])
-# del bla['st_astext']
-# bla.to_csv('/home/uwe/express/reegis/oep_demand_de21.csv')
-
-print(bla.groupby('region').sum())
-
-# print(neu)
-exit(0)
-# neu['rs_0_str'] = neu['rs_0'].apply(lambda x: str(x).zfill(12))
-# neu.to_csv('/home/uwe/express/reegis/oep_demand.ego_dp_loadarea_v0.2.10b.csv')
-print(neu.sum())
-
-exit(0)
-eb = pd.read_excel(os.path.join(c.paths['static'],
-                                'energybalance_states_2012_to_2014.xlsx'),
-                   index_col=[0, 1, 2])
-
-column_translation = {
-    'Steinkohle, roh': 'hard coal, raw',
-    'Steinkohle, Briketts': 'hard coal, brick',
-    'Steinkohle, Koks': 'hard coal, coke',
-    'Steinkohle, andere': 'hard coal, other',
-    'Braunkohle, roh': 'lignite, raw',
-    'Braunkohle, Briketts': 'lignite, brick',
-    'Braunkohle, andere': 'lignite, other',
-    'Erdöl': 'oil, raw',
-    'Rohbenzin': 'petroleum',
-    'Ottokraftstoffe': 'gasoline',
-    'Dieselkraftstoffe': 'diesel',
-    'Flugturbinenkraftstoffe': 'jet fuel',
-    'Heizöl leicht': 'light heating oil',
-    'Heizöl schwer': 'heavy heating oil',
-    'Petrolkoks': 'petroleum coke',
-    'Mineralölprodukte, andere': 'mineral oil products',
-    'Flüssiggas': 'liquid gas',
-    'Raffineriegas': 'refinery gas',
-    'Kokereigas, Stadtgas': 'coke oven gas',
-    'Gichtgas, Konvertergas': 'furnace/converter gas',
-    'Erdgas': 'natural gas',
-    'Grubengas': 'mine gas',
-    'Klärgas, Deponiegas': 'sewer/landfill gas',
-    'Wasserkraft': 'hydro power',
-    'Windkraft': 'wind power',
-    'Solarenergie': 'solar power',
-    'Biomasse': 'biomass',
-    'Biotreibstoff': 'biofuel',
-    'sonstige': 'other renewable',
-    'Strom': 'electricity',
-    'Kernenergie': 'nuclear energy',
-    'Fernwärme': 'district heating',
-    'Abfälle nicht biogen': 'waste, fossil',
-    'andere Energieträger': 'other',
-    'Insgesamt': 'total'}
-
-fuel_groups = {
-    'hard coal raw': 'hard coal',
-    'hard coal brick': 'hard coal',
-    'hard coal coke': 'hard coal',
-    'hard coal other': 'hard coal',
-    'lignite, raw': 'lignite',
-    'lignite, brick': 'lignite',
-    'lignite, other': 'lignite',
-    'oil, raw': 'oil',
-    'petroleum': 'oil',
-    'gasoline': 'oil',
-    'diesel': 'oil',
-    'jet fuel': 'oil',
-    'light heating oil': 'oil',
-    'heavy heating oil': 'oil',
-    'petroleum coke': 'oil',
-    'mineral oil products': 'oil',
-    'liquid gas': 'gas',
-    'refinery gas': 'gas',
-    'coke oven gas': 'gas',
-    'furnace/converter gas': 'gas',
-    'natural gas': 'gas',
-    'mine gas': 'gas',
-    'sewer/landfill gas': 'gas',
-    'hydro power': 're',
-    'wind power': 're',
-    'solar power': 're',
-    'biomass': 're',
-    'biofuel': 're',
-    'other renewable': 're',
-    'electricity': 'electricity',
-    'district heating': 'district heating',
-    'waste, fossil': 'other',
-    'other': 'other',
-    'total': 'total'
-}
-
-eb.sort_index(0, inplace=True)
-eb.rename(columns=column_translation, inplace=True)
-print(eb.columns)
-eb = eb.apply(lambda x: pd.to_numeric(x, errors='coerce')).fillna(0)
-eb_grp = eb.groupby(by=fuel_groups, axis=1).sum()
-# print(eb_grp.loc[2014, :, 'Endenergieverbrauch']['hard coal'])
-# exit(0)
-eb_grp.loc[2014, :, 'Endenergieverbrauch'].to_excel('/home/uwe/test.xls')
-
-exit(0)
-c.paths['scenario_path'] = os.path.join(
-    c.paths['scenario_data'], c.general['name']).replace(' ', '_').lower()
-
-# Set path name and year for the basic scenario
-my_path = os.path.join(os.path.dirname(os.path.realpath(__file__)),
-                       'my_scenarios')
-
-my_name = 'de21_basic_uwe'
-year = c.general['year']
-datetime_index = pd.date_range('{0}-01-01 00:00:00'.format(year),
-                               '{0}-12-31 23:00:00'.format(year),
-                               freq='60min', tz='Europe/Berlin')
-logging.info("Creating basic scenario '{0}' for {1} in {2}".format(
-    my_name, year, my_path))
-
-# Get list of regions from csv-file
-regions = pd.read_csv(os.path.join(c.paths['geometry'],
-                                   c.files['region_polygons_simple'])).gid
-
-# Initialise scenario add empty tables
-de21 = sc.SolphScenario(path=my_path, name=my_name, timeindex=datetime_index)
-
-if read_only:
-    logging.info("Reading scenario tables.")
-else:
-    create_objects_from_dataframe_collection()
-
-logging.info("Creating nodes.")
-
-de21.create_nodes()
-
-logging.info("Creating OperationalModel")
-
-om = OperationalModel(de21)
-
-logging.info('OM created. Starting optimisation using {0}'.format(solver))
-
-om.receive_duals()
-
-om.solve(solver=solver, solve_kwargs={'tee': True})
-
-logging.info('Optimisation done.')
-
-results = ResultsDataFrame(energy_system=de21)
-
-if not os.path.isdir('results'):
-    os.mkdir('results')
-date = '2017_03_21'
-file_name = ('scenario_' + de21.name + date + '_' +
-             'results_complete.csv')
-
-results_path = 'results'
-
-results.to_csv(os.path.join(results_path, file_name))
-logging.info("Results stored to {0}".format(
-    os.path.join(results_path, file_name)))
-logging.info("Done")
+def create_scenario_tables(c, name, path, write=True):
+    """
+    Create the tables of a basic de21 scenario from the scenario input files
+    in c.paths['scenario_path'] (see scenario_data_generation). The path is
+    derived from the scenario name if it is not set.
+
+    Parameters
+    ----------
+    c : ConfigurationDe21
+        Configuration (the general entry 'year' is used).
+    name : str
+        Name of the scenario.
+    path : str
+        Path of the scenario tables.
+    write : boolean
+        Write the tables to csv files.
+
+    Returns
+    -------
+    SolphScenario
+    """
+    if 'scenario_path' not in c.paths:
+        c.paths['scenario_path'] = os.path.join(
+            c.paths['scenario_data'],
+            c.general['name']).replace(' ', '_').lower()
+
+    year = c.general['year']
+    datetime_index = pd.date_range('{0}-01-01 00:00:00'.format(year),
+                                   '{0}-12-31 23:00:00'.format(year),
+                                   freq='60min', tz='Europe/Berlin')
+    logging.info("Creating scenario '{0}' for {1} in {2}".format(
+        name, year, path))
+
+    # Get list of regions from csv-file
+    regions = pd.read_csv(os.path.join(c.paths['geometry'],
+                                       c.files['region_polygons_simple'])).gid
+
+    de21 = sc.SolphScenario(path=path, name=name, timeindex=datetime_index)
+    create_objects_from_dataframe_collection(c, de21, regions,
+                                             write_table=False)
+
+    # Sequences of another year are moved to the year (see move_to_year).
+    empty = de21.s.columns[de21.s.isnull().all().values]
+    if len(empty) > 0:
+        raise ValueError(
+            "The sequences of {0} do not cover the year {1}. Check the "
+            "scenario data.".format(list(empty), year))
+    if write:
+        de21.write_tables()
+    return de21
+
+
+if __name__ == "__main__":
+    # Define default logger
+    logger.define_logging()
+    c = config.get_configuration()
+    read_only = cfg.get('csv', 'read_only')
+    write_table = cfg.get('csv', 'write_table')
+    solver = cfg.get('general', 'solver')
+
+    # neu = pd.read_csv('/home/uwe/express/reegis/oep_demand.ego_dp_loadarea_v0.2.10.csv',
+    #                   index_col=[0])
+    # print(len(neu))
+    # exit(0)
+    # del neu['geom_centre']
+    # del neu['geom']
+    # neu = neu.groupby('rs_0').sum()
+    # neu.to_csv('/home/uwe/express/reegis/oep_demand.ego_dp_loadarea_v0.2.10b.csv')
+    f = ('/home/uwe/express/reegis/' +
+         'oedb.demand.ego_dp_loadarea_v0.2.10_WGS84_170721.csv')
+    # neu = pd.read_csv(f, index_col=[0])
+    # print(neu.sum())
+    # neu['consumption_per_ha'] = neu['sector_consumption_sum'] / neu['area_ha']
+    # neu['consumption_per_ew'] = neu['sector_consumption_sum'] / neu['zensus_sum']
+    #
+    # neu['geom'] = neu.st_astext.apply(wkt_loads)
+    # gneu = pp.create_geo_df(neu)
+    #
+    # # Add column with region id
+    # gneu = pp.add_spatial_name(
+    #     c, gneu, os.path.join(c.paths['geometry'],
+    #                           c.files['region_polygons']),
+    #     'region', 'ego_load')
+    # gneu.to_file('/home/uwe/test2.shp')
+    # neu['region'] = gneu['region']
+    # del neu['geom']
+    # neu.to_csv('/home/uwe/express/reegis/oep_demand_de21.csv')
+    # bla = pd.read_csv('/home/uwe/express/reegis/oep_demand_de21.csv',
+    #                   index_col=[0])
+    # del bla['st_astext']
+    # bla.to_csv('/home/uwe/express/reegis/oep_demand_de21.csv')
+
+    print(bla.groupby('region').sum())
+
+    # print(neu)
+    exit(0)
+    # neu['rs_0_str'] = neu['rs_0'].apply(lambda x: str(x).zfill(12))
+    # neu.to_csv('/home/uwe/express/reegis/oep_demand.ego_dp_loadarea_v0.2.10b.csv')
+    print(neu.sum())
+
+    exit(0)
+    eb = pd.read_excel(os.path.join(c.paths['static'],
+                                    'energybalance_states_2012_to_2014.xlsx'),
+                       index_col=[0, 1, 2])
+
+    column_translation = {
+        'Steinkohle, roh': 'hard coal, raw',
+        'Steinkohle, Briketts': 'hard coal, brick',
+        'Steinkohle, Koks': 'hard coal, coke',
+        'Steinkohle, andere': 'hard coal, other',
+        'Braunkohle, roh': 'lignite, raw',
+        'Braunkohle, Briketts': 'lignite, brick',
+        'Braunkohle, andere': 'lignite, other',
+        'Erdöl': 'oil, raw',
+        'Rohbenzin': 'petroleum',
+        'Ottokraftstoffe': 'gasoline',
+        'Dieselkraftstoffe': 'diesel',
+        'Flugturbinenkraftstoffe': 'jet fuel',
+        'Heizöl leicht': 'light heating oil',
+        'Heizöl schwer': 'heavy heating oil',
+        'Petrolkoks': 'petroleum coke',
+        'Mineralölprodukte, andere': 'mineral oil products',
+        'Flüssiggas': 'liquid gas',
+        'Raffineriegas': 'refinery gas',
+        'Kokereigas, Stadtgas': 'coke oven gas',
+        'Gichtgas, Konvertergas': 'furnace/converter gas',
+        'Erdgas': 'natural gas',
+        'Grubengas': 'mine gas',
+        'Klärgas, Deponiegas': 'sewer/landfill gas',
+        'Wasserkraft': 'hydro power',
+        'Windkraft': 'wind power',
+        'Solarenergie': 'solar power',
+        'Biomasse': 'biomass',
+        'Biotreibstoff': 'biofuel',
+        'sonstige': 'other renewable',
+        'Strom': 'electricity',
+        'Kernenergie': 'nuclear energy',
+        'Fernwärme': 'district heating',
+        'Abfälle nicht biogen': 'waste, fossil',
+        'andere Energieträger': 'other',
+        'Insgesamt': 'total'}
+
+    fuel_groups = {
+        'hard coal raw': 'hard coal',
+        'hard coal brick': 'hard coal',
+        'hard coal coke': 'hard coal',
+        'hard coal other': 'hard coal',
+        'lignite, raw': 'lignite',
+        'lignite, brick': 'lignite',
+        'lignite, other': 'lignite',
+        'oil, raw': 'oil',
+        'petroleum': 'oil',
+        'gasoline': 'oil',
+        'diesel': 'oil',
+        'jet fuel': 'oil',
+        'light heating oil': 'oil',
+        'heavy heating oil': 'oil',
+        'petroleum coke': 'oil',
+        'mineral oil products': 'oil',
+        'liquid gas': 'gas',
+        'refinery gas': 'gas',
+        'coke oven gas': 'gas',
+        'furnace/converter gas': 'gas',
+        'natural gas': 'gas',
+        'mine gas': 'gas',
+        'sewer/landfill gas': 'gas',
+        'hydro power': 're',
+        'wind power': 're',
+        'solar power': 're',
+        'biomass': 're',
+        'biofuel': 're',
+        'other renewable': 're',
+        'electricity': 'electricity',
+        'district heating': 'district heating',
+        'waste, fossil': 'other',
+        'other': 'other',
+        'total': 'total'
+    }
+
+    eb.sort_index(0, inplace=True)
+    eb.rename(columns=column_translation, inplace=True)
+    print(eb.columns)
+    eb = eb.apply(lambda x: pd.to_numeric(x, errors='coerce')).fillna(0)
+    eb_grp = eb.groupby(by=fuel_groups, axis=1).sum()
+    # print(eb_grp.loc[2014, :, 'Endenergieverbrauch']['hard coal'])
+    # exit(0)
+    eb_grp.loc[2014, :, 'Endenergieverbrauch'].to_excel('/home/uwe/test.xls')
+
+    exit(0)
+    c.paths['scenario_path'] = os.path.join(
+        c.paths['scenario_data'], c.general['name']).replace(' ', '_').lower()
+
+    # Set path name and year for the basic scenario
+    my_path = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                           'my_scenarios')
+
+    my_name = 'de21_basic_uwe'
+    year = c.general['year']
+    datetime_index = pd.date_range('{0}-01-01 00:00:00'.format(year),
+                                   '{0}-12-31 23:00:00'.format(year),
+                                   freq='60min', tz='Europe/Berlin')
+    logging.info("Creating basic scenario '{0}' for {1} in {2}".format(
+        my_name, year, my_path))
+
+    # Get list of regions from csv-file
+    regions = pd.read_csv(os.path.join(c.paths['geometry'],
+                                       c.files['region_polygons_simple'])).gid
+
+    # Initialise scenario add empty tables
+    de21 = sc.SolphScenario(path=my_path, name=my_name, timeindex=datetime_index)
+
+    if read_only:
+        logging.info("Reading scenario tables.")
+    else:
+        create_objects_from_dataframe_collection(c, de21, regions,
+                                                 write_table)
+
+    logging.info("Creating nodes.")
+
+    de21.create_nodes()
+
+    logging.info("Creating OperationalModel")
+
+    om = OperationalModel(de21)
+
+    logging.info('OM created. Starting optimisation using {0}'.format(solver))
+
+    om.receive_duals()
+
+    om.solve(solver=solver, solve_kwargs={'tee': True})
+
+    logging.info('Optimisation done.')
+
+    results = ResultsDataFrame(energy_system=de21)
+
+    if not os.path.isdir('results'):
+        os.mkdir('results')
+    date = '2017_03_21'
+    file_name = ('scenario_' + de21.name + date + '_' +
+                 'results_complete.csv')
+
+    results_path = 'results'
+
+    results.to_csv(os.path.join(results_path, file_name))
+    logging.info("Results stored to {0}".format(
+        os.path.join(results_path, file_name)))
+    logging.info("Done")
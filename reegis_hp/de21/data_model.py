@@ -2,46 +2,155 @@ __copyright__ = "Uwe Krien"
 __license__ = "GPLv3"
 
 
+import os
 import weather
 import powerplants as pp
 import feedin
 import time_series
+import pipeline
+import config as cfg
 import configuration as config
 from oemof.tools import logger
 
 
-def run():
-    """pass"""
-    c = config.get_configuration()
+def fetch_weather(c, overwrite=False):
+    weather.fetch_coastdat2_year_from_db(c.paths['weather'],
+                                         c.paths['geometry'],
+                                         c.pattern['weather'],
+                                         c.files['region_geometry'],
+                                         overwrite=overwrite)
+
+
+def convert_weather(c, overwrite=False):
+    # Convert the weather data to the columnar format.
+    weather.convert_coastdat2_to_columns(c.paths['weather'],
+                                         c.pattern['weather'],
+                                         c.pattern['weather_columns'],
+                                         overwrite=overwrite)
+
+
+def average_wind_speed(c, overwrite=False):
+    # Calculate the average wind speed for all available weather data sets.
+    weather.get_average_wind_speed(c.paths['weather'],
+                                   c.files['grid_geometry'],
+                                   c.paths['geometry'],
+                                   c.pattern['weather'],
+                                   c.files['average_wind_speed'],
+                                   overwrite=overwrite,
+                                   columns_pattern=c.pattern[
+                                       'weather_columns'])
+
+
+def time_series_stage(c, overwrite=False):
+    time_series.get_timeseries(overwrite=overwrite)
+
 
-    # Store weather data
+def stages(c):
+    """Define the stages of the data model with their inputs, outputs and
+    dependencies. Stages switched off by the skip flags are left out."""
+    weather_files = [pipeline.file_pattern(c.paths['weather'],
+                                           c.pattern['weather'])]
+    feedin_files = [pipeline.file_pattern(
+        c.paths['feedin'], os.path.join('{type}', '{sub}', c.pattern['feedin']))]
+    grouped = {cat: [os.path.join(c.paths[cat],
+                                  c.pattern['grouped'].format(cat=cat))]
+               for cat in ('conventional', 'renewable')}
+
+    stage_list = list()
     if not c.general['skip_weather']:
-        weather.fetch_coastdat2_year_from_db(c.paths['weather'],
-                                             c.paths['geometry'],
-                                             c.pattern['weather'],
-                                             c.files['region_geometry'],
-                                             overwrite=c.general['overwrite'])
-
-        # Calculate the average wind speed for all available weather data sets.
-        weather.get_average_wind_speed(c.paths['weather'],
-                                       c.files['grid_geometry'],
-                                       c.paths['geometry'],
-                                       c.pattern['weather'],
-                                       c.files['average_wind_speed'])
+        stage_list.extend([
+            pipeline.Stage(
+                'weather', fetch_weather,
+                inputs=lambda c: [os.path.join(c.paths['geometry'],
+                                               c.files['region_geometry'])],
+                outputs=lambda c: weather_files,
+                config=[('weather', 'file_pattern')]),
+            pipeline.Stage(
+                'weather_columns', convert_weather,
+                inputs=lambda c: weather_files,
+                outputs=lambda c: [pipeline.file_pattern(
+                    c.paths['weather'], c.pattern['weather_columns'])],
+                config=[('weather', 'column_file_pattern')],
+                depends=['weather']),
+            pipeline.Stage(
+                'average_wind_speed', average_wind_speed,
+                inputs=lambda c: [os.path.join(c.paths['geometry'],
+                                               c.files['grid_geometry'])],
+                outputs=lambda c: [os.path.join(
+                    c.paths['weather'], c.files['average_wind_speed'])],
+                config=[('weather', 'avg_wind_speed_file')],
+                depends=['weather_columns'])])
 
     if not c.general['skip_conv_power_plants']:
-        pp.prepare_conventional_power_plants(
-            c, overwrite=c.general['overwrite'])
+        stage_list.append(pipeline.Stage(
+            'conventional_power_plants', pp.prepare_conventional_power_plants,
+            inputs=lambda c: [os.path.join(
+                c.paths['conventional'],
+                c.pattern['original'].format(cat='conventional'))],
+            outputs=lambda c: grouped['conventional'],
+            config=[('powerplants', 'prepared_csv_file_pattern'),
+                    ('powerplants', 'grouped_file_pattern')]))
 
     if not c.general['skip_re_power_plants']:
-        pp.prepare_re_power_plants(c, overwrite=c.general['overwrite'])
+        stage_list.append(pipeline.Stage(
+            're_power_plants', pp.prepare_re_power_plants,
+            inputs=lambda c: [os.path.join(
+                c.paths['renewable'],
+                c.pattern['original'].format(cat='renewable'))],
+            outputs=lambda c: grouped['renewable'],
+            config=[('powerplants', 'prepared_csv_file_pattern'),
+                    ('powerplants', 'grouped_file_pattern')]))
 
+    names = [stage.name for stage in stage_list]
     if not c.general['skip_feedin_weather']:
-        feedin.normalised_feedin_by_weather(c, overwrite=c.general['overwrite'])
+        stage_list.append(pipeline.Stage(
+            'feedin_weather', feedin.normalised_feedin_by_weather,
+            outputs=lambda c: feedin_files,
+            config=[('feedin', 'feedin_file_pattern')],
+            depends=[n for n in names if n in ('weather_columns',
+                                               'average_wind_speed')]))
+        names.append('feedin_weather')
+
     if not c.general['skip_feedin_region']:
-        feedin.normalised_feedin_by_region(c, overwrite=c.general['overwrite'])
+        stage_list.append(pipeline.Stage(
+            'feedin_region', feedin.normalised_feedin_by_region,
+            inputs=lambda c: feedin_files + grouped['renewable'],
+            outputs=lambda c: [os.path.join(
+                c.paths['feedin'], '*', 'de21',
+                pipeline.file_pattern('', c.pattern['feedin_de21']))],
+            config=[('feedin', 'feedin_de21_pattern')],
+            depends=[n for n in names if n in ('feedin_weather',
+                                               're_power_plants')]))
+
     if not c.general['skip_time_series']:
-        time_series.get_timeseries(overwrite=c.general['overwrite'])
+        stage_list.append(pipeline.Stage(
+            'time_series', time_series_stage,
+            outputs=lambda c: [time_series.store_file()] + [os.path.join(
+                c.paths['time_series'], cfg.get('time_series', key))
+                for key in ('load_file', 'renewables_file')],
+            config=[('time_series', 'original_file'),
+                    ('time_series', 'store_file'),
+                    ('download', 'url_timeseries_data')]))
+    return stage_list
+
+
+def run(workers=None, force=None):
+    """Run all outdated stages of the data model (see pipeline.Pipeline).
+
+    Parameters
+    ----------
+    workers : int
+        Number of processes for independent stages. Taken from the
+        configuration ([pipeline] workers) if None.
+    force : list of str
+        Names of stages to rerun anyway.
+    """
+    c = config.get_configuration()
+    if workers is None:
+        workers = cfg.get_default('pipeline', 'workers', 1)
+    if c.general['overwrite']:
+        force = [stage.name for stage in stages(c)]
+    return pipeline.Pipeline(c, stages(c)).run(workers=workers, force=force)
 
 
 if __name__ == "__main__":
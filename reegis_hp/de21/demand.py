@@ -2,17 +2,34 @@
 
 import os
 import logging
+import hashlib
 import time_series
 import pandas as pd
-import datetime
 # from oemof.tools import logger
 import config as cfg
 from reegis_hp.de21 import tools
 import demandlib.bdew as bdew
 import demandlib.particular_profiles as profiles
+from collections import OrderedDict
 from workalendar.europe import Germany
 
 
+# Column of the annual demand of each standardised load profile (sector).
+SLP_SECTORS = OrderedDict([('g0', 'sector_consumption_retail'),
+                           ('h0', 'sector_consumption_residential'),
+                           ('l0', 'sector_consumption_agricultural'),
+                           ('i0', 'sector_consumption_industrial')])
+
+# Methods to create the regional profiles (see get_de21_profile).
+PROFILE_KINDS = ('openego', 'renpass', 'openego_entsoe')
+
+# In-process cache of the unscaled profiles (least recently used last) and
+# of the prepared ego demand.
+PROFILE_CACHE = OrderedDict()
+EGO_DEMAND_CACHE = dict()
+CACHE_STATS = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+
+
 def renpass_demand_share():
     demand_share = os.path.join(cfg.get('paths', 'static'),
                                 cfg.get('static_sources',
@@ -28,18 +45,11 @@ def openego_demand_share():
 
 
 def de21_profile_from_entsoe(year, share, annual_demand=None, overwrite=False):
-    load_file = os.path.join(cfg.get('paths', 'time_series'),
-                             cfg.get('time_series', 'load_file'))
-
-    if not os.path.isfile(load_file) or overwrite:
-        time_series.split_timeseries_file(overwrite)
-
-    start = datetime.datetime(year, 1, 1, 0, 0)
-    end = datetime.datetime(year, 12, 31, 23, 0)
-
-    entsoe = pd.read_csv(load_file, index_col='cet', parse_dates=True)
-    entsoe = entsoe.tz_localize('UTC').tz_convert('Europe/Berlin')
-    de_load_profile = entsoe.ix[start:end].DE_load_
+    share = share.copy()
+    # Read only the given year from the time series store.
+    de_load_profile = time_series.get_year(
+        year, ['DE_load_'], overwrite=overwrite).DE_load_.dropna().astype(
+        float)
     load_profile = pd.DataFrame(index=de_load_profile.index)
     for i in range(21):
         region = 'DE{:02.0f}'.format(i + 1)
@@ -58,7 +68,13 @@ def prepare_ego_demand(overwrite=False):
                            cfg.get('demand', 'ego_file'))
 
     if os.path.isfile(egofile) and not overwrite:
-        ego_demand = pd.read_csv(egofile, index_col=[0])
+        stat = os.stat(egofile)
+        key = (egofile, stat.st_size, stat.st_mtime)
+        if key not in EGO_DEMAND_CACHE:
+            EGO_DEMAND_CACHE.clear()
+            EGO_DEMAND_CACHE[key] = pd.read_csv(
+                egofile, index_col=[0]).groupby('region').sum()
+        return EGO_DEMAND_CACHE[key].copy()
     else:
         # Read basic file (check oedb-API)
         load_file = os.path.join(cfg.get('paths', 'static'),
@@ -81,41 +97,82 @@ def prepare_ego_demand(overwrite=False):
     return ego_demand.groupby('region').sum()
 
 
-def create_de21_slp_profile(year, outfile):
-    demand_de21 = prepare_ego_demand()
+def slp_shape_file(year):
+    """File of the sector shapes of the given year (see slp_sector_shapes).
+    """
+    return os.path.join(
+        cfg.get('paths', 'demand'),
+        cfg.get_default('demand', 'slp_shape_pattern',
+                        'slp_sector_shapes_{year}.csv').format(year=year))
+
+
+def slp_sector_shapes(year, overwrite=False):
+    """
+    Normalised standardised load profiles of the sectors (g0, h0, l0, i0).
+
+    The shapes are the hourly means of the quarter-hourly profiles with an
+    annual demand of one, so each column sums up to 0.25 (as the hourly
+    means of the original regional profiles). They are the same for all
+    regions and are therefore calculated only once per year and stored in
+    the demand folder.
+
+    Parameters
+    ----------
+    year : int
+    overwrite : bool
+        Recalculate the shapes even if the file exists.
+
+    Returns
+    -------
+    pandas.DataFrame : Hourly shapes with one column per sector.
+    """
+    shape_file = slp_shape_file(year)
+    if os.path.isfile(shape_file) and not overwrite:
+        return pd.read_csv(shape_file, index_col=[0], parse_dates=True)
 
     cal = Germany()
     holidays = dict(cal.holidays(year))
 
-    de21_profile = pd.DataFrame()
+    e_slp = bdew.ElecSlp(year, holidays=holidays)
+    shapes = e_slp.get_profile({sector: 1 for sector in SLP_SECTORS
+                                if sector != 'i0'})
+
+    # Add the slp for the industrial group
+    ilp = profiles.IndustrialLoadProfile(e_slp.date_time_index,
+                                         holidays=holidays)
+    shapes['i0'] = ilp.simple_profile(1)
+
+    shapes = shapes[list(SLP_SECTORS)].resample('H').mean()
+    shapes.to_csv(shape_file)
+    return shapes
 
-    for region in demand_de21.index:
-        annual_demand = demand_de21.loc[region]
 
-        annual_electrical_demand_per_sector = {
-            'g0': annual_demand.sector_consumption_retail,
-            'h0': annual_demand.sector_consumption_residential,
-            'l0': annual_demand.sector_consumption_agricultural,
-            'i0': annual_demand.sector_consumption_industrial}
-        e_slp = bdew.ElecSlp(year, holidays=holidays)
-        elec_demand = e_slp.get_profile(annual_electrical_demand_per_sector)
+def create_de21_slp_profile(year, outfile, overwrite=False):
+    """Create the hourly slp profile of each region as the product of the
+    sector shapes and the annual demand of the sectors in the regions."""
+    demand_de21 = prepare_ego_demand()
+    shapes = slp_sector_shapes(year, overwrite=overwrite)
 
-        # Add the slp for the industrial group
-        ilp = profiles.IndustrialLoadProfile(e_slp.date_time_index,
-                                             holidays=holidays)
-        elec_demand['i0'] = ilp.simple_profile(
-            annual_electrical_demand_per_sector['i0'])
+    # (sector x region) matrix of the annual demand
+    sector_demand = demand_de21[list(SLP_SECTORS.values())].transpose()
 
-        de21_profile[region] = elec_demand.sum(1).resample('H').mean()
+    de21_profile = pd.DataFrame(shapes.values.dot(sector_demand.values),
+                                index=shapes.index,
+                                columns=demand_de21.index)
     de21_profile.to_csv(outfile)
 
 
-def get_de21_slp_profile(year, annual_demand=None, overwrite=False):
-    outfile = os.path.join(
+def ego_profile_file(year):
+    """File of the slp profile of the regions (see get_de21_slp_profile)."""
+    return os.path.join(
         cfg.get('paths', 'demand'),
         cfg.get('demand', 'ego_profile_pattern').format(year=year))
+
+
+def get_de21_slp_profile(year, annual_demand=None, overwrite=False):
+    outfile = ego_profile_file(year)
     if not os.path.isfile(outfile) or overwrite:
-        create_de21_slp_profile(year, outfile)
+        create_de21_slp_profile(year, outfile, overwrite=overwrite)
 
     de21_profile = pd.read_csv(
         outfile, index_col=[0], parse_dates=True).multiply(1000)
@@ -127,6 +184,139 @@ def get_de21_slp_profile(year, annual_demand=None, overwrite=False):
     return de21_profile
 
 
+def profile_source_files(year, kind):
+    """Files the unscaled profile of the given year and kind is created or
+    read from."""
+    ego_files = [os.path.join(cfg.get('paths', 'demand'),
+                              cfg.get('demand', 'ego_file')),
+                 os.path.join(cfg.get('paths', 'static'),
+                              cfg.get('demand', 'ego_input_file'))]
+    if kind == 'openego':
+        return ego_files + [slp_shape_file(year), ego_profile_file(year)]
+    elif kind == 'renpass':
+        return [os.path.join(cfg.get('paths', 'static'),
+                             cfg.get('static_sources', 'renpass_demand_share')),
+                time_series.store_file()]
+    elif kind == 'openego_entsoe':
+        return ego_files + [time_series.store_file()]
+    else:
+        raise ValueError('Method "{0}" not found.'.format(kind))
+
+
+def source_hash(files):
+    """Hash of the names, sizes and modification times of the files."""
+    md5 = hashlib.md5()
+    for filename in files:
+        md5.update(filename.encode())
+        if os.path.isfile(filename):
+            stat = os.stat(filename)
+            md5.update('{0}:{1}'.format(stat.st_size, stat.st_mtime).encode())
+        else:
+            md5.update(b'missing')
+    return md5.hexdigest()
+
+
+def create_de21_profile(year, kind, overwrite=False):
+    """Create the unscaled profile of the given kind (see get_de21_profile).
+    """
+    # Use the openEgo proposal to calculate annual demand and standardised
+    # load profiles to create profiles.
+    if kind == 'openego':
+        return get_de21_slp_profile(year, overwrite=overwrite)
+
+    # Use the renpass demand share values to divide the national entsoe profile
+    # into 18 regional profiles.
+    elif kind == 'renpass':
+        return de21_profile_from_entsoe(year, renpass_demand_share(),
+                                        overwrite=overwrite)
+
+    # Use the openEgo proposal to calculate the demand share values and use them
+    # to divide the national entsoe profile.
+    elif kind == 'openego_entsoe':
+        return de21_profile_from_entsoe(year, openego_demand_share(),
+                                        overwrite=overwrite)
+
+    else:
+        raise ValueError('Method "{0}" not found.'.format(kind))
+
+
+def get_unscaled_profile(year, kind, overwrite=False):
+    """
+    Unscaled profile of the given year and kind.
+
+    The profiles are cached in the process (least recently used) and in an
+    hdf5 file in the demand folder. The key of both caches contains a hash
+    of the source files, so that a changed source file leads to a new
+    profile. Older entries of the same year and kind are removed from the
+    hdf5 file. The cache hits and misses are counted in CACHE_STATS (see
+    cache_info).
+
+    Parameters
+    ----------
+    year : int
+    kind : str
+    overwrite : bool
+        Recreate the profile and all stored files it depends on.
+
+    Returns
+    -------
+    pandas.DataFrame : The cached profile (do not change it).
+    """
+    if not overwrite:
+        key = (year, kind, source_hash(profile_source_files(year, kind)))
+        store_key = '/{1}/y{0}_{2}'.format(*key)
+        profile = PROFILE_CACHE.pop(key, None)
+        if profile is not None:
+            CACHE_STATS['hits'] += 1
+            PROFILE_CACHE[key] = profile
+            return profile
+    cache_file = os.path.join(
+        cfg.get('paths', 'demand'),
+        cfg.get_default('demand', 'profile_cache_file',
+                        'demand_profile_cache.h5'))
+
+    with pd.HDFStore(cache_file, mode='a') as store:
+        if not overwrite and store_key in store:
+            CACHE_STATS['disk_hits'] += 1
+            profile = store[store_key]
+        else:
+            if not overwrite:
+                CACHE_STATS['misses'] += 1
+            profile = create_de21_profile(year, kind, overwrite=overwrite)
+
+            # The source files may have been created or replaced by
+            # create_de21_profile, so the key is calculated afterwards.
+            key = (year, kind, source_hash(profile_source_files(year, kind)))
+            store_key = '/{1}/y{0}_{2}'.format(*key)
+            for stale in store.keys():
+                if (stale.startswith('/{1}/y{0}_'.format(*key)) and
+                        stale != store_key):
+                    store.remove(stale)
+            store[store_key] = profile
+
+    PROFILE_CACHE[key] = profile
+    while len(PROFILE_CACHE) > cfg.get_default('demand', 'profile_cache_size',
+                                               8):
+        PROFILE_CACHE.popitem(last=False)
+    return profile
+
+
+def cache_info():
+    """Hits (in process and on disk) and misses of the profile cache and the
+    number of profiles in the process."""
+    info = dict(CACHE_STATS)
+    info['size'] = len(PROFILE_CACHE)
+    return info
+
+
+def clear_profile_cache():
+    """Clear the in-process caches and reset the counters."""
+    PROFILE_CACHE.clear()
+    EGO_DEMAND_CACHE.clear()
+    for key in CACHE_STATS:
+        CACHE_STATS[key] = 0
+
+
 def get_de21_profile(year, kind, annual_demand=None, overwrite=False):
     """
 
@@ -148,25 +338,15 @@ def get_de21_profile(year, kind, annual_demand=None, overwrite=False):
     -------
 
     """
-    # Use the openEgo proposal to calculate annual demand and standardised
-    # load profiles to create profiles.
-    if kind == 'openego':
-        return get_de21_slp_profile(year, annual_demand, overwrite)
-
-    # Use the renpass demand share values to divide the national entsoe profile
-    # into 18 regional profiles.
-    elif kind == 'renpass':
-        return de21_profile_from_entsoe(year, renpass_demand_share(),
-                                        annual_demand, overwrite)
+    if kind not in PROFILE_KINDS:
+        logging.error('Method "{0}" not found.'.format(kind))
+        return None
 
-    # Use the openEgo proposal to calculate the demand share values and use them
-    # to divide the national entsoe profile.
-    elif kind == 'openego_entsoe':
-        return de21_profile_from_entsoe(year, openego_demand_share(),
-                                        annual_demand, overwrite)
+    profile = get_unscaled_profile(year, kind, overwrite)
 
-    else:
-        logging.error('Method "{0}" not found.'.format(kind))
+    if annual_demand is None:
+        return profile.copy()
+    return profile * (annual_demand / profile.values.sum())
 
 
 if __name__ == "__main__":
@@ -184,3 +364,4 @@ if __name__ == "__main__":
     print(' oe:', round(oe.sum().sum()), oe_s.sum().sum())
     print(' rp:', round(rp.sum().sum()), rp_s.sum().sum())
     print('ege:', round(ege.sum().sum()), ege_s.sum().sum())
+    print(cache_info())
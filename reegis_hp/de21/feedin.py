@@ -2,26 +2,145 @@ __copyright__ = "Uwe Krien"
 __license__ = "GPLv3"
 
 import pandas as pd
+import numpy as np
+from scipy import sparse
 from datetime import datetime as time
 import os
 from windpowerlib import wind_turbine as wt
 from windpowerlib import modelchain
 import pvlib
+from pvlib import spa
 from pvlib.pvsystem import PVSystem
 from pvlib.location import Location
 from pvlib.modelchain import ModelChain
 import bisect
+import hashlib
+import json
+from concurrent import futures
 try:
     import oemof.db as db
 except ImportError:
     db = None
 import logging
 from oemof.tools import logger
+import config as cfg
 import configuration as config
 
 
+SOLAR_GEOMETRY = ['apparent_zenith', 'zenith', 'azimuth', 'clearsky_dni',
+                  'dni']
+
+# Height of the coastDat2 weather data
+COASTDAT2_HEIGHTS = {
+    'dhi': 0,
+    'dirhi': 0,
+    'pressure': 0,
+    'temp_air': 2,
+    'v_wind': 10,
+    'Z0': 0}
+
+WIND_POWER_PLANTS = {
+    1: {'hub_height': 135,
+        'd_rotor': 127,
+        'turbine_name': 'ENERCON E 126 7500',
+        'nominal_power': 7500000},
+    2: {'hub_height': 78,
+        'd_rotor': 82,
+        'turbine_name': 'ENERCON E 82 3000',
+        'nominal_power': 3000000},
+    3: {'hub_height': 98,
+        'd_rotor': 82,
+        'turbine_name': 'ENERCON E 82 2300',
+        'nominal_power': 2300000},
+    4: {'hub_height': 138,
+        'd_rotor': 82,
+        'turbine_name': 'ENERCON E 82 2300',
+        'nominal_power': 2300000},
+}
+
+# Turbine class by the upper limit of the average wind speed
+AVG_WIND2TYPE = pd.Series({
+    1.5: 4,
+    2.5: 3,
+    3.5: 2,
+    4.5: 1,
+    5.5: 1,
+    100: 1,
+})
+
+WIND_MODELCHAIN = {
+    'obstacle_height': 0,
+    'wind_model': 'logarithmic',
+    'rho_model': 'ideal_gas',
+    'power_output_model': 'p_values',
+    'density_corr': True,
+    'hellman_exp': None}
+
+
+def capacity_weights(pp, vtype, year):
+    """
+    Create a sparse (cell x region) matrix with the share of each coastDat2
+    cell on the installed capacity of a region.
+
+    Parameters
+    ----------
+    pp : pandas.DataFrame
+        Grouped renewable power plants (source, year, region, coastdat).
+    vtype : str
+        Type of the power plants ('Wind', 'Solar').
+    year : int
+
+    Returns
+    -------
+    tuple : Cell ids (array), regions (sorted list) and the weight matrix
+        (scipy.sparse.csr_matrix).
+    """
+    capacity = pp.loc[(vtype, year)].iloc[:, 0].astype(float)
+    region_codes, regions = pd.factorize(
+        capacity.index.get_level_values(0).fillna('nan'), sort=True)
+    cell_codes, cells = pd.factorize(
+        capacity.index.get_level_values(1).astype(float).astype(int),
+        sort=True)
+    region_sum = np.bincount(region_codes, weights=capacity.values)
+    weights = sparse.csr_matrix(
+        (capacity.values / region_sum[region_codes],
+         (cell_codes, region_codes)), shape=(len(cells), len(regions)))
+    return np.asarray(cells), list(regions), weights
+
+
+def capacity_weights_years(pp, vtype, years):
+    """
+    Create one block diagonal weight matrix for several years (see
+    capacity_weights). Each year is one block of cells (rows) and regions
+    (columns).
+
+    Returns
+    -------
+    tuple : Cell ids and regions of each year (lists) and the block diagonal
+        weight matrix (scipy.sparse.csr_matrix).
+    """
+    blocks = [capacity_weights(pp, vtype, year) for year in years]
+    return ([block[0] for block in blocks], [block[1] for block in blocks],
+            sparse.block_diag([block[2] for block in blocks], format='csr'))
+
+
 def normalised_feedin_by_region_wind(pp, feedin_de21, feedin_coastdat,
-                                     overwrite):
+                                     overwrite, block_size=None):
+    """
+    Aggregate the normalised wind feedin of the coastDat2 cells to the
+    regions weighted by the installed capacity.
+
+    The cell time series of several years are stacked side by side (time x
+    cell of all years) and multiplied with one block diagonal weight matrix
+    (see capacity_weights_years). Shorter years are padded with zeros and
+    cut again afterwards.
+
+    Parameters
+    ----------
+    block_size : int
+        Number of years of one product. All years at once if None. Use a
+        smaller number to limit the memory.
+    """
     vtype = 'Wind'
 
     # Check for existing in-files and non-existing out-files
@@ -41,44 +160,50 @@ def normalised_feedin_by_region_wind(pp, feedin_de21, feedin_coastdat,
         "Will create {0} time series for the following years: {1}".format(
             vtype.lower(), years))
 
-    # Loop over all years according to the file check above
-    for year in years:
-        logging.info("Processing {0}...".format(year))
-        pwr = pd.HDFStore(feedin_coastdat.format(year=year,
-                                                 type=vtype.lower(),
-                                                 sub='coastdat'))
-        my_index = pwr[pwr.keys()[0]].index
-        feedin = pd.DataFrame(index=my_index)
-
-        # Loop over all aggregation regions
-        for region in sorted(
-                pp.loc[(vtype, year)].index.get_level_values(0).unique()):
-
-            # Create an temporary DataFrame to collect the results
-            temp = pd.DataFrame(index=my_index)
-            logging.debug("{0} - {1}".format(year, region))
-
-            # Multiply normalised time series (normalised to 1kW_peak) with peak
-            # capacity(kW).
-            for coastdat in pp.loc[(vtype, year, region)].index:
-                tmp = pwr['/A' + str(int(coastdat))].multiply(
-                    float(pp.loc[(vtype, year, region, coastdat)]))
-                temp[coastdat] = tmp
-            if str(region) == 'nan':
-                region = 'unknown'
-
-            # Sum up time series for one region and divide it by the
-            # capacity of the region to get a normalised time series.
-            feedin[region] = temp.sum(axis=1).divide(
-                    float(pp.loc[(vtype, year, region)].sum()))
-
-        # Write table into a csv-file
-        feedin.to_csv(feedin_de21.format(year=year, type=vtype.lower()))
-        pwr.close()
+    if block_size is None:
+        block_size = max(len(years), 1)
+
+    # Loop over the blocks of years according to the file check above
+    for n in range(0, len(years), block_size):
+        block = years[n:n + block_size]
+        logging.info("Processing {0}...".format(block))
+        cells, regions, weights = capacity_weights_years(pp, vtype, block)
+        infiles = [feedin_coastdat.format(year=year, type=vtype.lower(),
+                                          sub='coastdat') for year in block]
+        indexes = list()
+        for infile in infiles:
+            pwr = pd.HDFStore(infile, mode='r')
+            indexes.append(pwr[pwr.keys()[0]].index)
+            pwr.close()
+
+        # Load the normalised time series of all cells of all years (time x
+        # cell) and multiply it with the weight matrix (cell x region).
+        cell_feedin = np.zeros((max(len(idx) for idx in indexes),
+                                weights.shape[0]))
+        col = 0
+        for infile, my_index, year_cells in zip(infiles, indexes, cells):
+            pwr = pd.HDFStore(infile, mode='r')
+            for cell in year_cells:
+                cell_feedin[:len(my_index), col] = np.nan_to_num(
+                    pwr['/A' + str(cell)].reindex(my_index).values)
+                col += 1
+            pwr.close()
+        feedin = weights.T.dot(cell_feedin.T).T
+
+        # Write the columns of each year into a csv-file
+        start = 0
+        for year, my_index, year_regions in zip(block, indexes, regions):
+            year_regions = ['unknown' if str(region) == 'nan' else region
+                            for region in year_regions]
+            pd.DataFrame(
+                feedin[:len(my_index), start:start + len(year_regions)],
+                index=my_index, columns=year_regions).to_csv(
+                feedin_de21.format(year=year, type=vtype.lower()))
+            start += len(year_regions)
 
 
 def normalised_feedin_by_region_solar(pp, feedin_de21, feedin_coastdat,
-                                      overwrite):
+                                      overwrite, chunk_size=100):
     vtype = 'Solar'
     de21_dir = os.path.dirname(feedin_de21.format(type=vtype.lower(),
                                                   year=2000))
@@ -114,52 +239,49 @@ def normalised_feedin_by_region_solar(pp, feedin_de21, feedin_coastdat,
         "Will create {0} time series for the following years: {1}".format(
             vtype.lower(), years))
 
-    pwr = dict()
-    columns = dict()
     for year in years:
         logging.info("Processing {0}...".format(year))
-        name_of_set = None
-        for name_of_set in set_names:
-            pwr[name_of_set] = pd.HDFStore(
-                feedin_coastdat.format(year=year, sub=name_of_set,
-                                       type=vtype.lower()))
-            columns[name_of_set] = pwr[name_of_set]['/A1129087'].columns
-
-        # Create DataFrame with MultiColumns to take the results
-        my_index = pwr[name_of_set]['/A1129087'].index
-        my_cols = pd.MultiIndex(levels=[[], [], []], labels=[[], [], []],
-                                names=[u'region', u'set', u'subset'])
-        feedin = pd.DataFrame(index=my_index, columns=my_cols)
-
-        # Loop over all aggregation regions
-        for region in sorted(
-                pp.loc[(vtype, year)].index.get_level_values(0).unique()):
-            coastdat_ids = pp.loc[(vtype, year, region)].index
-            logging.info("{0} - {1} ({2})".format(
-                year, region, len(coastdat_ids)))
-            logging.debug("{0}".format(pp.loc[(vtype, year, region)].index))
-
-            # Loop over all coastdat ids, that intersect with the region
-            for name in set_names:
-                for col in columns[name]:
-                    temp = pd.DataFrame(index=my_index)
-                    for coastdat in pp.loc[(vtype, year, region)].index:
-                        coastdat_id = '/A{0}'.format(int(coastdat))
-                        pp_inst = float(pp.loc[(vtype, year, region, coastdat)])
-                        temp[coastdat_id] = (
-                            pwr[name][coastdat_id][col][:8760].multiply(
-                                pp_inst))
-                    colname = '_'.join(col.split('_')[-3:])
-                    feedin[region, name, colname] = (
-                        temp.sum(axis=1).divide(float(
-                            pp.loc[(vtype, year, region)].sum())))
-
-            # Sum up time series for one region and divide it by the
-            # capacity of the region to get a normalised time series.
+        cells, regions, weights = capacity_weights(pp, vtype, year)
+        logging.info("{0}: {1} regions, {2} cells".format(
+            year, len(regions), len(cells)))
+
+        results = dict()
+        subsets = dict()
+        my_index = None
+        for name in set_names:
+            pwr = pd.HDFStore(feedin_coastdat.format(year=year, sub=name,
+                                                     type=vtype.lower()))
+            columns = pwr['/A1129087'].columns
+            my_index = pwr['/A1129087'].index
+            n_rows = min(8760, len(my_index))
+            subsets[name] = ['_'.join(col.split('_')[-3:]) for col in columns]
+
+            # Read the full set matrix of each cell once and contract the
+            # (time x cell x subset) block with the weights (cell x region)
+            # chunk by chunk.
+            results[name] = np.zeros((n_rows, len(regions), len(columns)))
+            for n in range(0, len(cells), chunk_size):
+                chunk = cells[n:n + chunk_size]
+                block = np.stack(
+                    [pwr['/A{0}'.format(cell)][columns].values[:n_rows]
+                     for cell in chunk], axis=1)
+                results[name] += np.einsum(
+                    'tcs,cr->trs', np.nan_to_num(block),
+                    weights[n:n + chunk_size].toarray())
+            pwr.close()
+
+        # Create DataFrame with MultiColumns (region, set, subset)
+        my_cols = pd.MultiIndex.from_tuples(
+            [(region, name, subset) for region in regions
+             for name in set_names for subset in subsets[name]],
+            names=[u'region', u'set', u'subset'])
+        data = np.concatenate(
+            [np.concatenate([results[name][:, r, :] for name in set_names],
+                            axis=1) for r in range(len(regions))], axis=1)
+        feedin = pd.DataFrame(data, index=my_index[:len(data)],
+                              columns=my_cols).reindex(my_index)
 
         feedin.to_csv(feedin_de21.format(year=year, type=vtype.lower()))
-        for name_of_set in set_names:
-            pwr[name_of_set].close()
 
 
 def normalised_feedin_by_region_hydro(c, feedin_de21, regions, overwrite=False):
@@ -224,67 +346,218 @@ def normalised_feedin_by_region(c, overwrite=False):
 
 
 def normalised_feedin_wind_single(polygons, key, weather):
-    coastdat2 = {
-        'dhi': 0,
-        'dirhi': 0,
-        'pressure': 0,
-        'temp_air': 2,
-        'v_wind': 10,
-        'Z0': 0}
-
-    wind_power_plants = {
-        1: {'hub_height': 135,
-            'd_rotor': 127,
-            'turbine_name': 'ENERCON E 126 7500',
-            'nominal_power': 7500000},
-        2: {'hub_height': 78,
-            'd_rotor': 82,
-            'turbine_name': 'ENERCON E 82 3000',
-            'nominal_power': 3000000},
-        3: {'hub_height': 98,
-            'd_rotor': 82,
-            'turbine_name': 'ENERCON E 82 2300',
-            'nominal_power': 2300000},
-        4: {'hub_height': 138,
-            'd_rotor': 82,
-            'turbine_name': 'ENERCON E 82 2300',
-            'nominal_power': 2300000},
-    }
-
-    avg_wind2type = pd.Series({
-        1.5: 4,
-        2.5: 3,
-        3.5: 2,
-        4.5: 1,
-        5.5: 1,
-        100: 1,
-    })
-
     avg_wind_speed = polygons.loc[int(key[2:]), 'v_wind_avg']
-    wka_class = avg_wind2type.iloc[
-        bisect.bisect_right(list(avg_wind2type.index), avg_wind_speed)]
-    wpp = wt.WindTurbine(**wind_power_plants[wka_class])
+    wka_class = AVG_WIND2TYPE.iloc[
+        bisect.bisect_right(list(AVG_WIND2TYPE.index), avg_wind_speed)]
+    wpp = wt.WindTurbine(**WIND_POWER_PLANTS[wka_class])
 
     # add information about converter type and class to the polygons table
-    polygons.loc[int(key[2:]), 'turbine_name'] = wind_power_plants[wka_class][
+    polygons.loc[int(key[2:]), 'turbine_name'] = WIND_POWER_PLANTS[wka_class][
         'turbine_name']
     polygons.loc[int(key[2:]), 'wind_conv_class'] = wka_class
 
-    modelchain_data = {
-        'obstacle_height': 0,
-        'wind_model': 'logarithmic',
-        'rho_model': 'ideal_gas',
-        'power_output_model': 'p_values',
-        'density_corr': True,
-        'hellman_exp': None}
+    mcwpp = modelchain.ModelChain(wpp, **WIND_MODELCHAIN).run_model(
+        weather, COASTDAT2_HEIGHTS)
+    return mcwpp.power_output.div(
+        WIND_POWER_PLANTS[wka_class]['nominal_power'])
+
+
+def wind_power_curves():
+    """
+    Tabulate the power curve and the exponents of the density correction of
+    each wind turbine type once.
+
+    Returns
+    -------
+    dict : Wind speeds ('v'), power values ('p') and density correction
+        exponents ('exponent') of the power curve as well as the hub height
+        and the nominal power for each turbine type.
+    """
+    curves = dict()
+    for wka_class, turbine in WIND_POWER_PLANTS.items():
+        p_values = wt.WindTurbine(**turbine).p_values
+        v_curve = np.asarray(p_values.index, dtype=float)
+        curves[wka_class] = {
+            'v': v_curve,
+            'p': np.asarray(p_values.p, dtype=float),
+            'exponent': np.interp(v_curve, [7.5, 12.5], [1 / 3, 2 / 3]),
+            'hub_height': turbine['hub_height'],
+            'nominal_power': turbine['nominal_power']}
+    return curves
+
+
+def p_curve_density_corr_array(v_wind, rho_hub, curve, block_size=200000):
+    """
+    Array version of windpowerlib's p_curve_density_corr.
+
+    The wind speeds of the power curve are corrected by the density of each
+    time step, (1.225 / rho) ** exponent, and the power is interpolated
+    linearly on the corrected curve (0 outside of the curve). The rows are
+    processed in blocks to limit the memory usage.
+
+    Parameters
+    ----------
+    v_wind : numpy.array
+        Wind speed at hub height.
+    rho_hub : numpy.array
+        Air density at hub height (same shape as v_wind).
+    curve : dict
+        Power curve of one turbine type (see wind_power_curves).
+    block_size : int
+        Number of values processed at once.
+
+    Returns
+    -------
+    numpy.array : Power output (same shape as v_wind).
+    """
+    v_all = np.asarray(v_wind, dtype=float).ravel()
+    rho_all = np.asarray(rho_hub, dtype=float).ravel()
+    p_curve = curve['p']
+    m = len(p_curve)
+    power = np.empty_like(v_all)
+    for n in range(0, len(v_all), block_size):
+        v = v_all[n:n + block_size]
+        rows = np.arange(len(v))
+        xp = curve['v'][np.newaxis, :] * (
+            1.225 / rho_all[n:n + block_size, np.newaxis]) ** curve[
+                'exponent'][np.newaxis, :]
+        k = (xp <= v[:, np.newaxis]).sum(axis=1)
+        i = np.clip(k - 1, 0, m - 2)
+        x0 = xp[rows, i]
+        x1 = xp[rows, i + 1]
+        p = p_curve[i] + (v - x0) * (p_curve[i + 1] - p_curve[i]) / (x1 - x0)
+        p = np.where((k > 0) & (k < m), p, 0)
+        p = np.where((k == m) & (v == xp[:, -1]), p_curve[-1], p)
+        power[n:n + block_size] = np.where(np.isnan(v), np.nan, p)
+    return power.reshape(np.shape(v_wind))
+
+
+def feedin_wind_array(weather, curve, data_height=None, obstacle_height=0):
+    """
+    Calculate the normalised wind feedin of many locations with the same
+    turbine type at once.
+
+    The steps follow windpowerlib's ModelChain as used in
+    normalised_feedin_wind_single (logarithmic wind profile, ideal gas
+    density with a linear temperature gradient and the density corrected
+    power curve).
+
+    Parameters
+    ----------
+    weather : dict
+        Arrays (time x location) of 'v_wind', 'Z0', 'pressure' and
+        'temp_air' as stored in the coastDat2 files.
+    curve : dict
+        Power curve of one turbine type (see wind_power_curves).
+    data_height : dict
+        Height of the weather data. The heights of the coastDat2 data set are
+        used by default.
+    obstacle_height : float
+        Height of obstacles around the turbine.
+
+    Returns
+    -------
+    numpy.array : Feedin (time x location) normalised to the nominal power.
+    """
+    if data_height is None:
+        data_height = COASTDAT2_HEIGHTS
+    hub_height = curve['hub_height']
+    z0 = weather['Z0']
+
+    v_wind_hub = (weather['v_wind'] *
+                  np.log((hub_height - 0.7 * obstacle_height) / z0) /
+                  np.log((data_height['v_wind'] - 0.7 * obstacle_height) / z0))
+    temp_hub = weather['temp_air'] - 0.0065 * (
+        hub_height - data_height['temp_air'])
+    rho_hub = ((weather['pressure'] / 100 -
+                (hub_height - data_height['pressure']) * 1 / 8) * 100 /
+               (287.058 * temp_hub))
+    return (p_curve_density_corr_array(v_wind_hub, rho_hub, curve) /
+            curve['nominal_power'])
+
+
+def normalised_feedin_wind_cells(weather_frames, polygons, curves=None):
+    """
+    Calculate the normalised wind feedin for a collection of coastDat2 cells.
+    The cells are grouped by their turbine class and all cells of one class
+    are calculated in one array operation.
+
+    Parameters
+    ----------
+    weather_frames : dict
+        Weather DataFrames with the hdf5 key ('/A<gid>') as dictionary key.
+    polygons : pandas.DataFrame
+        Table with the average wind speed ('v_wind_avg') indexed by gid. The
+        turbine name and class of each cell are added to this table.
+    curves : dict
+        Power curves of the turbine types (see wind_power_curves). Will be
+        created if None.
+
+    Returns
+    -------
+    dict : One Series (time) for each key.
+    """
+    if curves is None:
+        curves = wind_power_curves()
+
+    keys = list(weather_frames.keys())
+    gids = [int(key[2:]) for key in keys]
+    wka_classes = AVG_WIND2TYPE.values[np.searchsorted(
+        AVG_WIND2TYPE.index.values, polygons.loc[gids, 'v_wind_avg'].values,
+        side='right')]
 
-    mcwpp = modelchain.ModelChain(wpp, **modelchain_data).run_model(
-        weather, coastdat2)
-    return mcwpp.power_output.div(wind_power_plants[wka_class]['nominal_power'])
+    # add information about converter type and class to the polygons table
+    polygons.loc[gids, 'turbine_name'] = [
+        WIND_POWER_PLANTS[wka_class]['turbine_name']
+        for wka_class in wka_classes]
+    polygons.loc[gids, 'wind_conv_class'] = wka_classes
+
+    # Cells are stacked only if their time index and class are identical.
+    groups = dict()
+    for key, wka_class in zip(keys, wka_classes):
+        w = weather_frames[key]
+        idx = (wka_class, w.index[0], w.index[-1], len(w.index))
+        groups.setdefault(idx, list()).append(key)
+
+    results = dict()
+    for idx, group in groups.items():
+        times = weather_frames[group[0]].index
+        w = {col: np.column_stack([weather_frames[key][col].values
+                                   for key in group])
+             for col in ('v_wind', 'Z0', 'pressure', 'temp_air')}
+        feedin = feedin_wind_array(w, curves[idx[0]])
+        for n, key in enumerate(group):
+            results[key] = pd.Series(feedin[:, n], index=times)
+    return results
+
+
+class CachedLocation(Location):
+    """
+    Location that returns a given solar position instead of calculating it
+    (e.g. from the solar geometry cache, see solar_geometry_cell).
+
+    Parameters
+    ----------
+    solar_position : pandas.DataFrame
+        Solar position with the columns 'apparent_zenith', 'zenith' and
+        'azimuth' for all time steps.
+    """
+    def __init__(self, solar_position, **kwargs):
+        super().__init__(**kwargs)
+        self.solar_position = solar_position.copy()
+        self.solar_position['apparent_elevation'] = (
+            90 - self.solar_position['apparent_zenith'])
+        self.solar_position['elevation'] = 90 - self.solar_position['zenith']
+
+    def get_solarposition(self, times, pressure=None, temperature=12,
+                          **kwargs):
+        return self.solar_position.loc[times]
 
 
 def feedin_pvlib_modelchain(location, system, weather, tilt=None,
-                            orientation_strategy=None):
+                            orientation_strategy=None, geometry=None):
+    """pvlib's ModelChain of one pv system. The solar position is taken
+    from the geometry table (see solar_geometry_cell) if it is passed."""
     if tilt is None:
         tilt = system['surface_tilt']
 
@@ -295,8 +568,12 @@ def feedin_pvlib_modelchain(location, system, weather, tilt=None,
                      surface_azimuth=system['surface_azimuth'],
                      albedo=system['albedo'])
 
-    mc = ModelChain(pvsys, Location(**location),
-                    orientation_strategy=orientation_strategy)
+    if geometry is None:
+        loc = Location(**location)
+    else:
+        loc = CachedLocation(
+            geometry[['apparent_zenith', 'zenith', 'azimuth']], **location)
+    mc = ModelChain(pvsys, loc, orientation_strategy=orientation_strategy)
     mc.run_model(weather.index, weather=weather)
     return mc
 
@@ -356,10 +633,15 @@ def create_pv_sets(set_name):
     return pv_systems
 
 
-def adapt_weather_to_pvlib(w, location):
-    loc = Location(**location)
+def adapt_weather_to_pvlib(w, location, geometry=None):
+    """Adapt a coastDat2 weather DataFrame to pvlib. The dni will be taken
+    from the geometry table (see solar_geometry_cell) if it is passed."""
     w['temp_air'] = w.temp_air - 273.15
     w['ghi'] = w.dirhi + w.dhi
+    if geometry is not None:
+        w['dni'] = geometry['dni']
+        return w
+    loc = Location(**location)
     clearskydni = loc.get_clearsky(w.index).dni
     w['dni'] = pvlib.irradiance.dni(
         w['ghi'], w['dhi'], pvlib.solarposition.get_solarposition(
@@ -368,8 +650,523 @@ def adapt_weather_to_pvlib(w, location):
     return w
 
 
-def normalised_feedin_pv(c, weather, year, feedin_file):
-    """pass"""
+def normalised_feedin_pv_single(w, location, pv_systems):
+    """Calculate the normalised feedin of all pv sets for one location using
+    pvlib's ModelChain. The weather DataFrame has to be adapted to pvlib
+    before (see adapt_weather_to_pvlib)."""
+    one_region = pd.DataFrame()
+    for pv_system in pv_systems.values():
+        if pv_system['surface_tilt'] == 'optimal':
+            tilt = get_optimal_pv_angle(location['latitude'])
+        else:
+            tilt = float(pv_system['surface_tilt'])
+        mc = feedin_pvlib_modelchain(location, pv_system, w, tilt=tilt)
+        one_region[pv_system['name']] = mc.ac.fillna(0).clip(0).div(
+            pv_system['p_peak'])
+    return one_region
+
+
+def solar_position_array(times, latitude, longitude, pressure=None,
+                         temperature=12, delta_t=67.0, atmos_refract=0.5667):
+    """
+    Calculate the solar position for many locations at once.
+
+    The location independent part of the NREL SPA algorithm is calculated
+    once for the whole time index. The location dependent part is broadcasted
+    over all locations. The results equal the 'nrel_numpy' method of
+    pvlib.solarposition.get_solarposition for each single location.
+
+    Parameters
+    ----------
+    times : pandas.DatetimeIndex
+        Time index. A naive index is treated as UTC.
+    latitude : numpy.array
+        Latitude of each location.
+    longitude : numpy.array
+        Longitude of each location.
+    pressure : float
+        Air pressure in Pa. By default the pressure at altitude 0 is used.
+    temperature : float
+        Air temperature in degrees C.
+    delta_t : float
+        Difference between terrestrial time and UT1.
+    atmos_refract : float
+        Approximate atmospheric refraction at sunrise and sunset in degrees.
+
+    Returns
+    -------
+    dict : Arrays (time x location) of 'apparent_zenith', 'zenith' and
+        'azimuth'.
+    """
+    if pressure is None:
+        pressure = pvlib.atmosphere.alt2pres(0)
+    if times.tz is None:
+        utc = times.tz_localize('UTC')
+    else:
+        utc = times.tz_convert('UTC')
+    unixtime = np.array(utc.astype(np.int64) / 10 ** 9)
+
+    # Location independent part (time only).
+    v, alpha, delta = spa.solar_position_numpy(
+        unixtime, 0, 0, 0, 0, 0, delta_t, 0, 1, sst=True)
+    jme = spa.julian_ephemeris_millennium(spa.julian_ephemeris_century(
+        spa.julian_ephemeris_day(spa.julian_day(unixtime), delta_t)))
+    radius = spa.heliocentric_radius_vector(jme)
+
+    # Location dependent part (time x location).
+    lat = np.asarray(latitude, dtype=float)[np.newaxis, :]
+    lon = np.asarray(longitude, dtype=float)[np.newaxis, :]
+    v = v[:, np.newaxis]
+    alpha = alpha[:, np.newaxis]
+    delta = delta[:, np.newaxis]
+    radius = radius[:, np.newaxis]
+
+    h = spa.local_hour_angle(v, lon, alpha)
+    xi = spa.equatorial_horizontal_parallax(radius)
+    u = spa.uterm(lat)
+    x = spa.xterm(u, lat, 0)
+    y = spa.yterm(u, lat, 0)
+    delta_alpha = spa.parallax_sun_right_ascension(x, xi, h, delta)
+    delta_prime = spa.topocentric_sun_declination(delta, x, y, xi,
+                                                  delta_alpha, h)
+    h_prime = spa.topocentric_local_hour_angle(h, delta_alpha)
+    e0 = spa.topocentric_elevation_angle_without_atmosphere(
+        lat, delta_prime, h_prime)
+    delta_e = spa.atmospheric_refraction_correction(
+        pressure / 100, temperature, e0, atmos_refract)
+    e = spa.topocentric_elevation_angle(e0, delta_e)
+    gamma = spa.topocentric_astronomers_azimuth(h_prime, delta_prime, lat)
+
+    return {'apparent_zenith': spa.topocentric_zenith_angle(e),
+            'zenith': spa.topocentric_zenith_angle(e0),
+            'azimuth': spa.topocentric_azimuth_angle(gamma)}
+
+
+def dni_array(ghi, dhi, zenith, clearsky_dni, clearsky_tolerance=1.1,
+              zenith_threshold_for_zero_dni=88.0,
+              zenith_threshold_for_clearsky_limit=80.0):
+    """Array version of pvlib.irradiance.dni (time x location)."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dni = (ghi - dhi) / np.cos(np.radians(zenith))
+        dni[dni < 0] = np.nan
+        dni[(zenith >= zenith_threshold_for_zero_dni) & (dni != 0)] = np.nan
+        max_dni = clearsky_dni * clearsky_tolerance
+        limit = ((zenith >= zenith_threshold_for_clearsky_limit) &
+                 (zenith < zenith_threshold_for_zero_dni) &
+                 (dni > max_dni))
+    dni[limit] = max_dni[limit]
+    return dni
+
+
+def sapm_celltemp_array(poa_global, wind_speed, temp_air,
+                        model='open_rack_cell_glassback'):
+    """Array version of pvlib.pvsystem.sapm_celltemp. Returns the cell
+    temperature only."""
+    a, b, delta_t = pvlib.pvsystem.TEMP_MODEL_PARAMS['sapm'][model]
+    temp_module = poa_global * np.exp(a + b * wind_speed) + temp_air
+    return temp_module + poa_global / 1000. * delta_t
+
+
+def solar_geometry_array(times, ghi, dhi, latitude, longitude):
+    """
+    Calculate the solar geometry and the derived dni for many locations.
+
+    Parameters
+    ----------
+    times : pandas.DatetimeIndex
+        Common time index of all locations.
+    ghi : numpy.array
+        Global horizontal irradiance (time x location).
+    dhi : numpy.array
+        Diffuse horizontal irradiance (time x location).
+    latitude : numpy.array
+        Latitude of each location.
+    longitude : numpy.array
+        Longitude of each location.
+
+    Returns
+    -------
+    dict : Arrays (time x location) of 'apparent_zenith', 'zenith',
+        'azimuth', 'clearsky_dni' and 'dni'.
+    """
+    geometry = solar_position_array(times, latitude, longitude)
+    dni_extra = np.asarray(
+        pvlib.irradiance.extraradiation(times))[:, np.newaxis]
+    am_rel = pvlib.atmosphere.relativeairmass(geometry['apparent_zenith'],
+                                              model='kastenyoung1989')
+    am_abs = pvlib.atmosphere.absoluteairmass(am_rel,
+                                              pvlib.atmosphere.alt2pres(0))
+
+    # Derive the dni with the clear sky dni as upper limit.
+    linke_turbidity = np.column_stack([
+        np.asarray(pvlib.clearsky.lookup_linke_turbidity(times, lat, lon))
+        for lat, lon in zip(latitude, longitude)])
+    geometry['clearsky_dni'] = pvlib.clearsky.ineichen(
+        geometry['apparent_zenith'], am_abs, linke_turbidity, altitude=0,
+        dni_extra=dni_extra)['dni']
+    geometry['dni'] = dni_array(ghi, dhi, geometry['zenith'],
+                                geometry['clearsky_dni'],
+                                clearsky_tolerance=1.1)
+    return geometry
+
+
+def feedin_pv_array(times, weather, latitude, longitude, pv_systems,
+                    geometry=None):
+    """
+    Calculate the normalised ac feedin of all pv sets for many locations.
+
+    The steps follow pvlib's ModelChain as used in feedin_pvlib_modelchain
+    (haydavies transposition, kastenyoung1989 airmass, sapm aoi/spectral
+    losses, sapm dc and snlinverter ac model) but all steps are calculated on
+    (time x location) arrays. The weather adaption (adapt_weather_to_pvlib)
+    is done within this function.
+
+    Parameters
+    ----------
+    times : pandas.DatetimeIndex
+        Common time index of all locations.
+    weather : dict
+        Arrays (time x location) of 'dhi', 'dirhi' and 'temp_air' (Kelvin)
+        as stored in the coastDat2 files.
+    latitude : numpy.array
+        Latitude of each location.
+    longitude : numpy.array
+        Longitude of each location.
+    pv_systems : dict
+        PV sets as created by create_pv_sets.
+    geometry : dict
+        Precalculated solar geometry of the locations (see
+        solar_geometry_array). Will be calculated if None.
+
+    Returns
+    -------
+    dict : Normalised ac feedin (time x location) for each pv set name.
+    """
+    latitude = np.asarray(latitude, dtype=float)
+    longitude = np.asarray(longitude, dtype=float)
+
+    # The coastDat2 set does not contain 'wind_speed' so ModelChain uses 0.
+    wind_speed = 0
+    temp_air = weather['temp_air'] - 273.15
+    dhi = weather['dhi']
+    ghi = weather['dirhi'] + dhi
+
+    if geometry is None:
+        geometry = solar_geometry_array(times, ghi, dhi, latitude, longitude)
+    dni = geometry['dni']
+    dni_extra = np.asarray(
+        pvlib.irradiance.extraradiation(times))[:, np.newaxis]
+    am_rel = pvlib.atmosphere.relativeairmass(geometry['apparent_zenith'],
+                                              model='kastenyoung1989')
+    am_abs = pvlib.atmosphere.absoluteairmass(am_rel,
+                                              pvlib.atmosphere.alt2pres(0))
+
+    feedin = dict()
+    for pv_system in pv_systems.values():
+        module = pv_system['module_parameters']
+        if pv_system['surface_tilt'] == 'optimal':
+            tilt = get_optimal_pv_angle(latitude)[np.newaxis, :]
+        else:
+            tilt = float(pv_system['surface_tilt'])
+        azimuth = pv_system['surface_azimuth']
+
+        aoi = pvlib.irradiance.aoi(tilt, azimuth,
+                                   geometry['apparent_zenith'],
+                                   geometry['azimuth'])
+        irrad = pvlib.irradiance.total_irrad(
+            tilt, azimuth, geometry['apparent_zenith'], geometry['azimuth'],
+            dni, ghi, dhi, dni_extra=dni_extra, airmass=am_rel,
+            albedo=pv_system['albedo'], model='haydavies')
+
+        effective_irradiance = (
+            pvlib.pvsystem.sapm_spectral_loss(am_abs, module) *
+            (irrad['poa_direct'] * pvlib.pvsystem.sapm_aoi_loss(aoi, module) +
+             module.get('FD', 1.) * irrad['poa_diffuse']))
+        temp_cell = sapm_celltemp_array(irrad['poa_global'], wind_speed,
+                                        temp_air)
+        dc = pvlib.pvsystem.sapm(
+            effective_irradiance=effective_irradiance / 1000.,
+            temp_cell=temp_cell, module=module)
+        ac = pvlib.pvsystem.snlinverter(
+            v_dc=dc['v_mp'], p_dc=dc['p_mp'],
+            inverter=pv_system['inverter_parameters'])
+        ac = np.where(np.isnan(ac), 0, ac).clip(0)
+        feedin[pv_system['name']] = ac / pv_system['p_peak']
+    return feedin
+
+
+def weather_file_checksum(filename, blocksize=2 ** 20):
+    """Return the md5 checksum of a weather file."""
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def solar_geometry_path(c, year):
+    """Return the path of the solar geometry cache of the given year."""
+    return os.path.join(c.paths['weather'], 'solar_geometry', str(year))
+
+
+def solar_geometry_is_valid(c, year):
+    """
+    Check if the solar geometry cache of the given year fits to the weather
+    file. The checksum is only recalculated if the size or the modification
+    time of the weather file changed. If the checksum still fits, the new
+    size and modification time are stored.
+    """
+    weather_file = os.path.join(c.paths['weather'],
+                                c.pattern['weather'].format(year=year))
+    meta_file = os.path.join(solar_geometry_path(c, year), 'meta.json')
+    if not os.path.isfile(meta_file) or not os.path.isfile(weather_file):
+        return False
+    with open(meta_file) as f:
+        meta = json.load(f)
+    stat = os.stat(weather_file)
+    if stat.st_size == meta['size'] and stat.st_mtime == meta['mtime']:
+        return True
+    if weather_file_checksum(weather_file) != meta['checksum']:
+        return False
+    meta['size'] = stat.st_size
+    meta['mtime'] = stat.st_mtime
+    with open(meta_file + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_file + '.tmp', meta_file)
+    return True
+
+
+def create_solar_geometry_cache(c, year, chunk_size=100):
+    """
+    Calculate the solar geometry of all coastDat2 cells of one year and store
+    it as memory mappable numpy files (time x cell) next to the weather file.
+
+    The arrays 'apparent_zenith', 'zenith', 'azimuth', 'clearsky_dni' and
+    'dni' (derived from the weather data) are stored. The cache is bound to
+    the checksum of the weather file.
+    """
+    start = time.now()
+    weather_file = os.path.join(c.paths['weather'],
+                                c.pattern['weather'].format(year=year))
+    path = solar_geometry_path(c, year)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    latlon = pd.read_csv(os.path.join(c.paths['geometry'],
+                                      c.files['grid_centroid']),
+                         index_col='gid')
+
+    weather = pd.HDFStore(weather_file, mode='r')
+    keys = weather.keys()
+    times = weather[keys[0]].index
+    gids = [int(key[2:]) for key in keys]
+    logging.info("Creating solar geometry cache for {0} ({1} cells).".format(
+        year, len(keys)))
+
+    arrays = dict()
+    for name in SOLAR_GEOMETRY:
+        arrays[name] = np.lib.format.open_memmap(
+            os.path.join(path, name + '.npy'), mode='w+', dtype=np.float64,
+            shape=(len(times), len(keys)))
+
+    for n in range(0, len(keys), chunk_size):
+        chunk = keys[n:n + chunk_size]
+        frames = [weather[key] for key in chunk]
+        for w in frames:
+            if not w.index.equals(times):
+                raise ValueError(
+                    "Time index of the cells differ in {0}.".format(year))
+        dhi = np.column_stack([w['dhi'].values for w in frames])
+        ghi = np.column_stack([w['dirhi'].values for w in frames]) + dhi
+        geometry = solar_geometry_array(
+            times, ghi, dhi, latlon.loc[gids[n:n + chunk_size], 'st_y'].values,
+            latlon.loc[gids[n:n + chunk_size], 'st_x'].values)
+        for name in SOLAR_GEOMETRY:
+            arrays[name][:, n:n + chunk_size] = geometry[name]
+    weather.close()
+
+    for array in arrays.values():
+        array.flush()
+    np.save(os.path.join(path, 'times.npy'), times.asi8)
+
+    stat = os.stat(weather_file)
+    meta = {'year': year,
+            'tz': str(times.tz),
+            'cells': gids,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'checksum': weather_file_checksum(weather_file)}
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    logging.info("Solar geometry cache created: {0} - {1}".format(
+        year, time.now() - start))
+
+
+def load_solar_geometry(c, year, create=True):
+    """
+    Load the solar geometry cache of the given year as memory mapped arrays.
+
+    Parameters
+    ----------
+    c : ConfigurationDe21
+    year : int
+        Year of the weather file.
+    create : boolean
+        Create (or replace) the cache if it does not exist or if it does not
+        fit to the weather file. Returns None in that case if set to False.
+
+    Returns
+    -------
+    dict : Memory mapped arrays (time x cell) of the solar geometry, the
+        'times' (DatetimeIndex) and the column number of each gid ('cells').
+    """
+    if not solar_geometry_is_valid(c, year):
+        if not create:
+            return None
+        create_solar_geometry_cache(c, year)
+    path = solar_geometry_path(c, year)
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    times = pd.DatetimeIndex(np.load(os.path.join(path, 'times.npy')))
+    if meta['tz'] != 'None':
+        times = times.tz_localize('UTC').tz_convert(meta['tz'])
+    geometry = {name: np.load(os.path.join(path, name + '.npy'),
+                              mmap_mode='r')
+                for name in SOLAR_GEOMETRY}
+    geometry['times'] = times
+    geometry['cells'] = pd.Series(range(len(meta['cells'])),
+                                  index=meta['cells'])
+    return geometry
+
+
+def select_solar_geometry(geometry, gids, times):
+    """Select the columns of the given gids from the solar geometry cache.
+    Returns None if the cache does not cover the cells or the time index."""
+    if geometry is None or not geometry['times'].equals(times):
+        return None
+    if not pd.Index(gids).isin(geometry['cells'].index).all():
+        return None
+    columns = geometry['cells'].loc[gids].values
+    return {name: np.asarray(geometry[name][:, columns])
+            for name in SOLAR_GEOMETRY}
+
+
+def solar_geometry_cell(c, year, key, create=False):
+    """
+    Get the cached solar geometry of one coastDat2 cell as DataFrame.
+
+    Parameters
+    ----------
+    c : ConfigurationDe21
+    year : int
+        Year of the weather file.
+    key : int or str
+        Gid of the cell or the hdf5 key ('/A<gid>' or 'A<gid>').
+    create : boolean
+        Create the cache of the year (all cells) if it does not exist.
+
+    Returns
+    -------
+    pandas.DataFrame : Solar geometry or None if no valid cache exists.
+    """
+    geometry = load_solar_geometry(c, year, create=create)
+    if geometry is None:
+        return None
+    gid = int(str(key).lstrip('/A'))
+    column = geometry['cells'].loc[gid]
+    return pd.DataFrame({name: geometry[name][:, column]
+                         for name in SOLAR_GEOMETRY},
+                        index=geometry['times'], columns=SOLAR_GEOMETRY)
+
+
+def normalised_feedin_pv_cells(weather_frames, latlon, pv_systems,
+                               geometry=None):
+    """
+    Calculate the normalised pv feedin for a collection of coastDat2 cells
+    using the array engine (feedin_pv_array).
+
+    Parameters
+    ----------
+    weather_frames : dict
+        Weather DataFrames with the hdf5 key ('/A<gid>') as dictionary key.
+    latlon : pandas.DataFrame
+        Table with the columns 'st_x' (lon) and 'st_y' (lat) indexed by gid.
+    pv_systems : dict
+        PV sets as created by create_pv_sets.
+    geometry : dict
+        Cached solar geometry of the year (see load_solar_geometry). Cells
+        that are not in the cache are calculated.
+
+    Returns
+    -------
+    dict : One DataFrame (time x pv set) for each key.
+    """
+    names = [pv_system['name'] for pv_system in pv_systems.values()]
+
+    # Cells are stacked only if their time index is identical.
+    groups = dict()
+    for key, w in weather_frames.items():
+        idx = (w.index[0], w.index[-1], len(w.index))
+        groups.setdefault(idx, list()).append(key)
+
+    results = dict()
+    for keys in groups.values():
+        times = weather_frames[keys[0]].index
+        gids = [int(key[2:]) for key in keys]
+        w = {col: np.column_stack([weather_frames[key][col].values
+                                   for key in keys])
+             for col in ('dhi', 'dirhi', 'temp_air')}
+        feedin = feedin_pv_array(
+            times, w, latlon.loc[gids, 'st_y'].values,
+            latlon.loc[gids, 'st_x'].values, pv_systems,
+            geometry=select_solar_geometry(geometry, gids, times))
+        for n, key in enumerate(keys):
+            results[key] = pd.DataFrame(
+                {name: feedin[name][:, n] for name in names},
+                index=times, columns=names)
+    return results
+
+
+def normalised_feedin_pv(c, weather, year, feedin_file, chunk_size=100):
+    """
+    Create the normalised pv feedin for all coastDat2 cells of one year.
+
+    The cells are processed in chunks using the array engine. The layout of
+    the hdf5 file is the same as with normalised_feedin_pv_modelchain: one
+    table (time x pv set) per cell key.
+    """
+    if not os.path.isdir(os.path.dirname(feedin_file)):
+        os.mkdir(os.path.dirname(feedin_file))
+    pv_systems = create_pv_sets(c.general['solar_set'])
+
+    pwr = pd.HDFStore(feedin_file.format(year, 'solar'), mode='w')
+
+    latlon = pd.read_csv(os.path.join(c.paths['geometry'],
+                                      c.files['grid_centroid']),
+                         index_col='gid')
+
+    geometry = load_solar_geometry(c, year, create=False)
+
+    keys = weather.keys()
+    length = len(keys)
+    logging.info('Remaining polygons for {0}: {1}'.format(year, length))
+
+    for n in range(0, len(keys), chunk_size):
+        chunk = keys[n:n + chunk_size]
+        frames = {key: weather[key] for key in chunk}
+        feedin = normalised_feedin_pv_cells(frames, latlon, pv_systems,
+                                            geometry)
+        for key in chunk:
+            pwr[key] = feedin[key]
+        length -= len(chunk)
+        logging.info('Remaining polygons for {0}: {1}'.format(year, length))
+    pwr.close()
+
+
+def normalised_feedin_pv_modelchain(c, weather, year, feedin_file):
+    """Create the normalised pv feedin for all coastDat2 cells of one year
+    using one pvlib ModelChain per cell and pv set. This is much slower than
+    normalised_feedin_pv but it is kept as a reference."""
     if not os.path.isdir(os.path.dirname(feedin_file)):
         os.mkdir(os.path.dirname(feedin_file))
     pv_systems = create_pv_sets(c.general['solar_set'])
@@ -385,7 +1182,6 @@ def normalised_feedin_pv(c, weather, year, feedin_file):
     logging.info('Remaining polygons for {0}: {1}'.format(year, length))
 
     for key in keys:
-        one_region = pd.DataFrame()
         length -= 1
         # if length % 100 == 0:
         logging.info('Remaining polygons for {0}: {1}'.format(year, length))
@@ -396,20 +1192,75 @@ def normalised_feedin_pv(c, weather, year, feedin_file):
             }
 
         w = adapt_weather_to_pvlib(weather[key], location)
-
-        for pv_system in pv_systems.values():
-            if pv_system['surface_tilt'] == 'optimal':
-                tilt = get_optimal_pv_angle(location['latitude'])
-            else:
-                tilt = float(pv_system['surface_tilt'])
-            mc = feedin_pvlib_modelchain(location, pv_system, w, tilt=tilt)
-            one_region[pv_system['name']] = mc.ac.fillna(0).clip(0).div(
-                pv_system['p_peak'])
-        pwr[key] = one_region
+        pwr[key] = normalised_feedin_pv_single(w, location, pv_systems)
     pwr.close()
 
 
-def normalised_feedin_wind(c, weather, year, feedin_file):
+def compare_pv_feedin_engines(c, year, keys=None, number=5, tolerance=1e-4):
+    """
+    Regression check of the array engine against the per cell ModelChain.
+
+    Raises an AssertionError if the normalised feedin of any cell and pv set
+    deviates by more than the tolerance.
+
+    Parameters
+    ----------
+    c : ConfigurationDe21
+    year : int
+        Year of the weather file.
+    keys : list
+        Keys of the cells to compare. By default 'number' cells are picked
+        evenly from the weather file.
+    number : int
+        Number of cells if no keys are given.
+    tolerance : float
+        Maximal absolute deviation of the normalised feedin (fraction of the
+        peak power).
+
+    Returns
+    -------
+    pandas.DataFrame : Maximal absolute deviation (cell x pv set).
+    """
+    weather = pd.HDFStore(os.path.join(
+        c.paths['weather'], c.pattern['weather'].format(year=year)), mode='r')
+    if keys is None:
+        all_keys = weather.keys()
+        keys = all_keys[::max(len(all_keys) // number, 1)][:number]
+
+    pv_systems = create_pv_sets(c.general['solar_set'])
+    latlon = pd.read_csv(os.path.join(c.paths['geometry'],
+                                      c.files['grid_centroid']),
+                         index_col='gid')
+    frames = {key: weather[key] for key in keys}
+    weather.close()
+
+    start = time.now()
+    array_feedin = normalised_feedin_pv_cells(frames, latlon, pv_systems)
+    logging.info("Array engine: {0}".format(time.now() - start))
+
+    start = time.now()
+    deviation = pd.DataFrame()
+    for key in keys:
+        location = {'latitude': latlon.loc[int(key[2:]), 'st_y'],
+                    'longitude': latlon.loc[int(key[2:]), 'st_x']}
+        w = adapt_weather_to_pvlib(frames[key].copy(), location)
+        single = normalised_feedin_pv_single(w, location, pv_systems)
+        for col in single.columns:
+            deviation.loc[key, col] = (
+                single[col] - array_feedin[key][col]).abs().max()
+    logging.info("ModelChain: {0}".format(time.now() - start))
+    logging.info("Maximal deviation: {0}".format(deviation.max().max()))
+    # NaN (e.g. a missing pv set) fails as well.
+    failed = deviation.stack(dropna=False)[
+        ~(deviation <= tolerance).stack(dropna=False)]
+    if len(failed) > 0:
+        raise AssertionError(
+            "The array engine deviates by more than {0} from the ModelChain "
+            "(cell, pv set):\n{1}".format(tolerance, failed))
+    return deviation
+
+
+def normalised_feedin_wind(c, weather, year, feedin_file, chunk_size=100):
     """pass"""
     if not os.path.isdir(os.path.dirname(feedin_file)):
         os.mkdir(os.path.dirname(feedin_file))
@@ -418,16 +1269,20 @@ def normalised_feedin_wind(c, weather, year, feedin_file):
         os.path.join(c.paths['weather'], c.files['average_wind_speed']),
         index_col='gid')
 
+    curves = wind_power_curves()
+
     keys = weather.keys()
     length = len(keys)
     logging.info('Remaining polygons for {0}: {1}'.format(year, length))
-    for key in keys:
-        length -= 1
-        if length % 100 == 0:
-            logging.info('Remaining polygons for {0}: {1}'.format(year, length))
-        weather_df = weather[key]
-        pwr[key] = normalised_feedin_wind_single(average_wind_speed, key,
-                                                 weather_df)
+    for n in range(0, len(keys), chunk_size):
+        chunk = keys[n:n + chunk_size]
+        frames = {key: weather[key] for key in chunk}
+        feedin = normalised_feedin_wind_cells(frames, average_wind_speed,
+                                              curves)
+        for key in chunk:
+            pwr[key] = feedin[key]
+        length -= len(chunk)
+        logging.info('Remaining polygons for {0}: {1}'.format(year, length))
     pwr.close()
 
 
@@ -470,7 +1325,173 @@ def normalised_feedin_one_year(c, year, overwrite):
             year, time.now() - start))
 
 
-def normalised_feedin_by_weather(c, years=None, overwrite=False):
+def normalised_feedin_shard(c, year, vtype, keys, shard_file):
+    """
+    Calculate the normalised feedin of a chunk of coastDat2 cells and store
+    it in a shard file. This is the worker function of
+    normalised_feedin_parallel.
+
+    Parameters
+    ----------
+    c : ConfigurationDe21
+    year : int
+        Year of the weather file.
+    vtype : str
+        Type of the feedin ('wind' or 'solar').
+    keys : list
+        Keys of the cells ('/A<gid>').
+    shard_file : str
+        Full file name of the shard file.
+
+    Returns
+    -------
+    str : Name of the shard file.
+    """
+    weather = pd.HDFStore(os.path.join(
+        c.paths['weather'], c.pattern['weather'].format(year=year)), mode='r')
+    frames = {key: weather[key] for key in keys}
+    weather.close()
+
+    if vtype == 'wind':
+        average_wind_speed = pd.read_csv(
+            os.path.join(c.paths['weather'], c.files['average_wind_speed']),
+            index_col='gid')
+        feedin = normalised_feedin_wind_cells(frames, average_wind_speed)
+    else:
+        pv_systems = create_pv_sets(c.general['solar_set'])
+        latlon = pd.read_csv(os.path.join(c.paths['geometry'],
+                                          c.files['grid_centroid']),
+                             index_col='gid')
+        geometry = load_solar_geometry(c, year, create=False)
+        feedin = normalised_feedin_pv_cells(frames, latlon, pv_systems,
+                                            geometry)
+
+    # Write to a temporary file, so that only complete shards exist.
+    shard = pd.HDFStore(shard_file + '.tmp', mode='w')
+    for key in keys:
+        shard[key] = feedin[key]
+    shard.close()
+    os.replace(shard_file + '.tmp', shard_file)
+    return shard_file
+
+
+def merge_feedin_shards(shard_files, outfile):
+    """
+    Merge shard files into one feedin file. The shards are written to a
+    temporary file first, which replaces the feedin file in one step. The
+    shard files are removed afterwards.
+    """
+    tmp_file = outfile + '.tmp'
+    store = pd.HDFStore(tmp_file, mode='w')
+    for shard_file in shard_files:
+        shard = pd.HDFStore(shard_file, mode='r')
+        for key in shard.keys():
+            store[key] = shard[key]
+        shard.close()
+    store.close()
+    os.replace(tmp_file, outfile)
+    for shard_file in shard_files:
+        os.remove(shard_file)
+
+
+def normalised_feedin_parallel(c, years, overwrite=False, workers=None,
+                               chunk_size=None):
+    """
+    Create the normalised feedin files of all given years using a pool of
+    processes.
+
+    The work is split by year, type and chunks of cell keys. Every worker
+    writes a shard file. The shards of one year and type are merged into the
+    feedin file as soon as all of them are finished. If a worker fails, the
+    remaining shards are cancelled and all shard files are removed.
+
+    Parameters
+    ----------
+    c : ConfigurationDe21
+    years : list
+        Years of the existing weather files.
+    overwrite : boolean
+        Existing feedin files are skipped if False.
+    workers : int
+        Number of processes. Uses the 'workers' key of the [feedin] section
+        of the ini file by default.
+    chunk_size : int
+        Number of cells per shard. Uses the 'chunk_size' key of the [feedin]
+        section of the ini file by default.
+    """
+    if workers is None:
+        workers = c.general['feedin_workers']
+    if chunk_size is None:
+        chunk_size = c.general['feedin_chunk_size']
+
+    start = time.now()
+    tasks = dict()
+    shard_files = list()
+    try:
+        with futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            submit_feedin_shards(c, years, overwrite, chunk_size, executor,
+                                 tasks, shard_files)
+            logging.info("{0} shards submitted to {1} workers.".format(
+                sum(len(f) for f in tasks.values()), workers))
+
+            try:
+                for (year, vtype, outfile), shards in tasks.items():
+                    merge_feedin_shards([shard.result() for shard in shards],
+                                        outfile)
+                    logging.info(
+                        "Normalised {0} feedin created: {1} - {2}".format(
+                            vtype, year, time.now() - start))
+            except Exception:
+                for shards in tasks.values():
+                    for shard in shards:
+                        shard.cancel()
+                raise
+    finally:
+        # Remove the shards (complete or not) of failed or cancelled tasks
+        # and unfinished merges.
+        tmp_files = [outfile + '.tmp' for (_, _, outfile) in tasks]
+        for shard_file in shard_files:
+            tmp_files.extend([shard_file, shard_file + '.tmp'])
+        for filename in tmp_files:
+            if os.path.isfile(filename):
+                os.remove(filename)
+
+
+def submit_feedin_shards(c, years, overwrite, chunk_size, executor, tasks,
+                         shard_files):
+    """Submit the shards of all missing feedin files (see
+    normalised_feedin_parallel). The futures are added to the tasks and the
+    names of the shard files to shard_files."""
+    set_name = cfg.get(c.general['solar_set'], 'pv_set_name')
+    feedin_pattern = os.path.join(c.paths['feedin'], '{type}', '{sub}',
+                                  c.pattern['feedin'])
+    subs = {'wind': 'coastdat', 'solar': set_name}
+
+    for year in years:
+        keys = None
+        for vtype, sub in subs.items():
+            outfile = feedin_pattern.format(year=year, type=vtype, sub=sub)
+            if os.path.isfile(outfile) and not overwrite:
+                logging.info("File '{0}' exists. Skipped. ".format(outfile))
+                continue
+            if not os.path.isdir(os.path.dirname(outfile)):
+                os.makedirs(os.path.dirname(outfile))
+            if keys is None:
+                weather = pd.HDFStore(os.path.join(
+                    c.paths['weather'],
+                    c.pattern['weather'].format(year=year)), mode='r')
+                keys = weather.keys()
+                weather.close()
+            tasks[(year, vtype, outfile)] = list()
+            for n in range(0, len(keys), chunk_size):
+                shard_file = '{0}.part{1}'.format(outfile, n)
+                shard_files.append(shard_file)
+                tasks[(year, vtype, outfile)].append(executor.submit(
+                    normalised_feedin_shard, c, year, vtype,
+                    keys[n:n + chunk_size], shard_file))
+
+
+def normalised_feedin_by_weather(c, years=None, overwrite=False, workers=None):
     """pass"""
     # Finding existing weather files.
     if years is None:
@@ -480,11 +1501,28 @@ def normalised_feedin_by_weather(c, years=None, overwrite=False):
             if c.pattern['weather'].format(year=y) in filelist:
                 years.append(y)
 
+    if workers is None:
+        workers = c.general['feedin_workers']
+
+    # Create the solar geometry cache of every year with a missing solar
+    # feedin file, so that the pv feedin does not recalculate it.
+    set_name = cfg.get(c.general['solar_set'], 'pv_set_name')
+    f_solar = os.path.join(c.paths['feedin'], '{type}', '{sub}',
+                           c.pattern['feedin'])
     for year in years:
-        normalised_feedin_one_year(c, year, overwrite)
+        if overwrite or not os.path.isfile(
+                f_solar.format(year=year, type='solar', sub=set_name)):
+            if not solar_geometry_is_valid(c, year):
+                create_solar_geometry_cache(c, year)
+
+    if workers > 1:
+        normalised_feedin_parallel(c, years, overwrite, workers)
+    else:
+        for year in years:
+            normalised_feedin_one_year(c, year, overwrite)
 
 
 if __name__ == "__main__":
     logger.define_logging()
-    cfg = config.get_configuration()
-    normalised_feedin_by_region(cfg, overwrite=True)
+    cfg_de21 = config.get_configuration()
+    normalised_feedin_by_region(cfg_de21, overwrite=True)
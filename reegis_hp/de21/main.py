@@ -10,6 +10,8 @@ from oemof.solph import OperationalModel, EnergySystem
 from oemof.solph import NodesFromCSV
 from oemof.outputlib import ResultsDataFrame
 
+import rolling_horizon
+
 
 def stopwatch():
     if not hasattr(stopwatch, 'now'):
@@ -20,7 +22,20 @@ def stopwatch():
     return str(stopwatch.now-last)[0:-4]
 
 
-def main(date_from, date_to, scenario_path, nodes_flows, nodes_flows_sequences):
+def main(date_from, date_to, scenario_path, nodes_flows, nodes_flows_sequences,
+         window=None, overlap=24):
+    """
+    Create the energy system from the csv files and solve it.
+
+    Parameters
+    ----------
+    window : int
+        Number of time steps of each window of the rolling horizon solve
+        (see rolling_horizon.solve_rolling_horizon). The full time index is
+        solved at once if None.
+    overlap : int
+        Number of overlapping time steps of the windows.
+    """
     logger.define_logging()
     datetime_index = pd.date_range(date_from, date_to, freq='60min')
 
@@ -32,19 +47,25 @@ def main(date_from, date_to, scenario_path, nodes_flows, nodes_flows_sequences):
 
     stopwatch()
 
-    om = OperationalModel(es)
+    if window is None:
+        om = OperationalModel(es)
+
+        logging.info('OM creation time: ' + stopwatch())
 
-    logging.info('OM creation time: ' + stopwatch())
+        om.receive_duals()
 
-    om.receive_duals()
+        om.solve(solver='gurobi', solve_kwargs={'tee': True})
 
-    om.solve(solver='gurobi', solve_kwargs={'tee': True})
+        logging.info('Optimisation done.')
 
-    logging.info('Optimisation done.')
+        logging.info('Optimisation time: ' + stopwatch())
 
-    logging.info('Optimisation time: ' + stopwatch())
+        results = ResultsDataFrame(energy_system=es)
+    else:
+        results, _ = rolling_horizon.solve_rolling_horizon(
+            es, 'gurobi', window, overlap, solve_kwargs={'tee': True})
 
-    results = ResultsDataFrame(energy_system=es)
+        logging.info('Rolling horizon optimisation time: ' + stopwatch())
 
     if not os.path.isdir('results'):
         os.mkdir('results')
@@ -65,6 +86,8 @@ if __name__ == "__main__":
               'date_from': '2015-01-01 00:00:00',
               'date_to': '2015-01-01 23:00:00',
               'nodes_flows': 'reegis_de_3_short.csv',
-              'nodes_flows_sequences': 'reegis_de_3_short_seq.csv'}
+              'nodes_flows_sequences': 'reegis_de_3_short_seq.csv',
+              'window': None,
+              'overlap': 24}
 
     main(**config)
@@ -0,0 +1,291 @@
+__copyright__ = "Uwe Krien"
+__license__ = "GPLv3"
+
+import os
+import re
+import glob
+import json
+import hashlib
+import logging
+import datetime
+from concurrent import futures
+
+import pandas as pd
+
+import config as cfg
+
+
+def file_pattern(path, pattern):
+    """Full path of a file pattern with all wildcards ({year}, {type},...)
+    replaced by '*'."""
+    return os.path.join(path, re.sub(r'\{[^}]*\}', '*', pattern))
+
+
+class Stage(object):
+    """A step of the data pipeline.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage.
+    function : callable
+        Function of the stage. It is called with the configuration object and
+        overwrite=True if the stage has to be rerun.
+    inputs : callable
+        Function that returns a list of files (or glob patterns) read by the
+        stage, called with the configuration object.
+    outputs : callable
+        Function that returns a list of files (or glob patterns) written by
+        the stage, called with the configuration object.
+    config : list of tuples
+        Configuration keys (section, key) used by the stage.
+    depends : list of str
+        Names of the stages that have to be finished before this stage.
+    """
+    def __init__(self, name, function, inputs=None, outputs=None,
+                 config=None, depends=None):
+        self.name = name
+        self.function = function
+        self.inputs = inputs
+        self.outputs = outputs
+        self.config = config or list()
+        self.depends = depends or list()
+
+    def files(self, c, what):
+        """Existing files of the inputs or outputs."""
+        func = getattr(self, what)
+        if func is None:
+            return list()
+        files = list()
+        for pattern in func(c):
+            files.extend(sorted(glob.glob(pattern)))
+        return files
+
+    def missing_outputs(self, c):
+        """True if any output (pattern) does not match an existing file."""
+        if self.outputs is None:
+            return False
+        return any(len(glob.glob(pattern)) == 0
+                   for pattern in self.outputs(c))
+
+
+class Pipeline(object):
+    """Run the stages of the data model in the order of their dependencies.
+
+    A stage is only rerun if the hash of its inputs, its configuration keys
+    or the outputs of the stages it depends on changed or if an output is
+    missing. Existing outputs are only overwritten if the hash changed or
+    the stage is forced. The state of the last run is stored in a json file.
+
+    Parameters
+    ----------
+    c : ConfigurationDe21
+    stages : list of Stage
+    state_file : str
+        Full path of the json file with the state of the last run.
+    """
+    def __init__(self, c, stages, state_file=None):
+        self.c = c
+        self.stages = {stage.name: stage for stage in stages}
+        if state_file is None:
+            state_file = os.path.join(
+                c.paths['messages'],
+                cfg.get_default('pipeline', 'state_file',
+                                'pipeline_state.json'))
+        self.state_file = state_file
+        self.state = self.load_state()
+        self.report = pd.DataFrame(
+            columns=['status', 'start', 'duration', 'hash'])
+
+        for stage in stages:
+            for dep in stage.depends:
+                if dep not in self.stages:
+                    raise ValueError("Unknown dependency of {0}: {1}".format(
+                        stage.name, dep))
+
+    def load_state(self):
+        if os.path.isfile(self.state_file):
+            with open(self.state_file) as f:
+                return json.load(f)
+        return {'stages': dict(), 'checksums': dict()}
+
+    def save_state(self):
+        with open(self.state_file + '.tmp', 'w') as f:
+            json.dump(self.state, f, indent=1, sort_keys=True)
+        os.replace(self.state_file + '.tmp', self.state_file)
+
+    def checksum(self, filename):
+        """md5 checksum of a file. The checksum is reused as long as size and
+        modification time of the file did not change."""
+        stat = os.stat(filename)
+        known = self.state['checksums'].get(filename)
+        if (known is not None and known['size'] == stat.st_size and
+                known['mtime'] == stat.st_mtime):
+            return known['md5']
+        md5 = hashlib.md5()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(2 ** 20), b''):
+                md5.update(block)
+        self.state['checksums'][filename] = {
+            'size': stat.st_size, 'mtime': stat.st_mtime,
+            'md5': md5.hexdigest()}
+        return md5.hexdigest()
+
+    def files_hash(self, files):
+        md5 = hashlib.md5()
+        for filename in files:
+            md5.update(filename.encode())
+            md5.update(self.checksum(filename).encode())
+        return md5.hexdigest()
+
+    def stage_hash(self, stage):
+        """Hash of the inputs, the configuration keys and the outputs of the
+        stages the given stage depends on."""
+        md5 = hashlib.md5()
+        md5.update(self.files_hash(stage.files(self.c, 'inputs')).encode())
+        for section, key in sorted(stage.config):
+            md5.update('{0}:{1}={2}'.format(
+                section, key, cfg.get_default(section, key)).encode())
+        for dep in sorted(stage.depends):
+            md5.update(self.state['stages'].get(dep, dict()).get(
+                'outputs', '').encode())
+        return md5.hexdigest()
+
+    def outdated(self, stage, stage_hash):
+        """Reason to rerun the stage: 'changed' if the hash differs from the
+        last run, 'new' if the stage has never been finished, 'missing' if an
+        output is missing. None if the stage is up to date."""
+        last = self.state['stages'].get(stage.name)
+        if last is not None and last['hash'] != stage_hash:
+            return 'changed'
+        if last is None:
+            return 'new'
+        if stage.missing_outputs(self.c):
+            return 'missing'
+        return None
+
+    def finish(self, stage, stage_hash, status, start):
+        self.report.loc[stage.name] = (status, start,
+                                       datetime.datetime.now() - start,
+                                       stage_hash)
+        if status == 'done':
+            self.state['stages'][stage.name] = {
+                'hash': stage_hash,
+                'outputs': self.files_hash(stage.files(self.c, 'outputs')),
+                'finished': str(datetime.datetime.now())}
+        elif status == 'failed':
+            self.state['stages'].pop(stage.name, None)
+        self.save_state()
+
+    def cancel(self, waiting, failed):
+        """Remove all waiting stages that depend on failed stages (also
+        indirectly) and add them to the failed stages."""
+        cancelled = True
+        while cancelled:
+            cancelled = False
+            for name in list(waiting):
+                if set(waiting[name].depends) & set(failed):
+                    del waiting[name]
+                    failed.append(name)
+                    self.report.loc[name] = ('cancelled', None, None, None)
+                    cancelled = True
+
+    def run(self, workers=1, force=None):
+        """Run all outdated stages.
+
+        Parameters
+        ----------
+        workers : int
+            Number of processes. Stages without dependencies between each
+            other are run in parallel if workers > 1.
+        force : list of str
+            Names of stages to rerun anyway.
+
+        Returns
+        -------
+        pandas.DataFrame : Timing report of the run.
+        """
+        force = force or list()
+        waiting = dict(self.stages)
+        finished = set()
+        running = dict()
+        failed = list()
+
+        if workers > 1:
+            executor = futures.ProcessPoolExecutor(max_workers=workers)
+        else:
+            executor = None
+
+        while waiting or running:
+            # Start or skip all stages whose dependencies are finished.
+            for name in list(waiting):
+                stage = waiting[name]
+                if not set(stage.depends) <= finished:
+                    continue
+                del waiting[name]
+                start = datetime.datetime.now()
+                stage_hash = self.stage_hash(stage)
+                reason = self.outdated(stage, stage_hash)
+                if name in force:
+                    reason = 'forced'
+                # Existing outputs are only replaced if the inputs changed.
+                overwrite = reason in ('changed', 'forced')
+                if reason is None:
+                    logging.info("Pipeline: {0} is up to date.".format(name))
+                    self.finish(stage, stage_hash, 'skipped', start)
+                    finished.add(name)
+                elif executor is None:
+                    logging.info("Pipeline: running {0} ({1}).".format(
+                        name, reason))
+                    try:
+                        stage.function(self.c, overwrite=overwrite)
+                    except Exception as e:
+                        logging.error("Pipeline: {0} failed: {1}".format(
+                            name, e))
+                        self.finish(stage, stage_hash, 'failed', start)
+                        failed.append(name)
+                    else:
+                        self.finish(stage, stage_hash, 'done', start)
+                        finished.add(name)
+                else:
+                    logging.info("Pipeline: starting {0} ({1}).".format(
+                        name, reason))
+                    job = executor.submit(stage.function, self.c,
+                                          overwrite=overwrite)
+                    running[job] = (stage, stage_hash, start)
+
+            if not running:
+                # Stages depending on failed stages cannot be run.
+                self.cancel(waiting, failed)
+                if waiting and not any(set(waiting[n].depends) <= finished
+                                       for n in waiting):
+                    raise ValueError("Circular dependencies: {0}".format(
+                        list(waiting)))
+                continue
+
+            done, _ = futures.wait(list(running),
+                                   return_when=futures.FIRST_COMPLETED)
+            for job in done:
+                stage, stage_hash, start = running.pop(job)
+                if job.exception() is not None:
+                    logging.error("Pipeline: {0} failed: {1}".format(
+                        stage.name, job.exception()))
+                    self.finish(stage, stage_hash, 'failed', start)
+                    failed.append(stage.name)
+                else:
+                    self.finish(stage, stage_hash, 'done', start)
+                    finished.add(stage.name)
+
+            # Stages depending on failed stages cannot be run.
+            self.cancel(waiting, failed)
+
+        if executor is not None:
+            executor.shutdown()
+
+        self.report.to_csv(os.path.join(self.c.paths['messages'],
+                                        'pipeline_report.csv'))
+        logging.info("Pipeline report:\n{0}".format(
+            self.report[['status', 'duration']]))
+        if failed:
+            raise RuntimeError("Pipeline stages failed: {0}".format(failed))
+        return self.report
@@ -97,37 +97,57 @@ def convert_utm_code(df):
     return df
 
 
+def postcode_centroids(c, overwrite=False):
+    """
+    Get the centroid (lon, lat) of each postcode polygon.
+
+    The table is cached next to the postcode geometry file and recreated if
+    the geometry file is newer than the cache.
+    """
+    geo_file = os.path.join(c.paths['geometry'], c.files['postcode'])
+    cache_file = os.path.splitext(geo_file)[0] + '_centroid.csv'
+    if (os.path.isfile(cache_file) and not overwrite and
+            os.path.getmtime(cache_file) >= os.path.getmtime(geo_file)):
+        return pd.read_csv(cache_file, index_col='zip_code')
+
+    pstc = pd.read_csv(geo_file, index_col='zip_code')
+    centroids = pstc.iloc[:, 0].apply(lambda x: wkt_loads(x).centroid)
+    centroids = pd.DataFrame({'lon': centroids.apply(lambda x: x.x),
+                              'lat': centroids.apply(lambda x: x.y)},
+                             columns=['lon', 'lat'])
+    centroids = centroids.groupby(level=0).first()
+    centroids.to_csv(cache_file)
+    logging.info("Postcode centroids stored to {0}".format(cache_file))
+    return centroids
+
+
 def guess_coordinates_by_postcode(c, df):
     # *** Use postcode ***
     if 'postcode' in df:
         df_pstc = df.loc[(df.lon.isnull() & df.postcode.notnull())]
         if len(df_pstc) > 0:
-            pstc = pd.read_csv(os.path.join(c.paths['geometry'],
-                                            c.files['postcode']),
-                               index_col='zip_code')
-        for idx, val in df_pstc.iterrows():
-            try:
-                # If the postcode is not number the integer conversion will
-                # raise a ValueError. Some postcode look like this '123XX'.
-                # It would be possible to add the mayor regions to the postcode
-                # map in order to search for the first two/three digits.
-                postcode = int(val.postcode)
-                if postcode in pstc.index:
-                    df.loc[df.id == val.id, 'lon'] = wkt_loads(
-                        pstc.loc[postcode].values[0]).centroid.x
-                    df.loc[df.id == val.id, 'lat'] = wkt_loads(
-                        pstc.loc[postcode].values[0]).centroid.y
-                # Replace the last number with a zero and try again.
-                elif round(postcode / 10) * 10 in pstc.index:
-                    postcode = round(postcode / 10) * 10
-                    df.loc[df.id == val.id, 'lon'] = wkt_loads(
-                        pstc.loc[postcode].values[0]).centroid.x
-                    df.loc[df.id == val.id, 'lat'] = wkt_loads(
-                        pstc.loc[postcode].values[0]).centroid.y
-                else:
-                    logging.debug("Cannot find postcode {0}.".format(postcode))
-            except ValueError:
-                logging.debug("Cannot find postcode {0}.".format(val.postcode))
+            centroids = postcode_centroids(c)
+
+            # If the postcode is not number the conversion will return NaN.
+            # Some postcode look like this '123XX'. It would be possible to
+            # add the mayor regions to the postcode map in order to search for
+            # the first two/three digits.
+            codes = pd.to_numeric(df_pstc.postcode, errors='coerce')
+            postcode = codes.where(codes.isin(centroids.index))
+
+            # Round to the next ten and try again.
+            rounded = np.round(codes / 10) * 10
+            postcode = postcode.fillna(
+                rounded.where(rounded.isin(centroids.index)))
+
+            found = postcode.notnull()
+            df.loc[found.index[found], 'lon'] = postcode[found].map(
+                centroids.lon)
+            df.loc[found.index[found], 'lat'] = postcode[found].map(
+                centroids.lat)
+            if (~found).any():
+                logging.debug("Cannot find postcodes: {0}".format(
+                    list(df_pstc.postcode[~found])))
     return df
 
 
@@ -280,53 +300,162 @@ def group_conventional_power_plants(c, overwrite=False):
     cpp = cpp[cpp.region != 'LU']
     cpp = cpp[cpp.region != 'CH']
 
-    # Create an empty MultiIndex DataFrame to take the values.
-    my_idx = pd.MultiIndex(levels=[[], [], []], labels=[[], [], []],
-                           names=['fuel', 'year', 'region'])
-    df = pd.DataFrame(index=my_idx, columns=['capacity', 'efficiency'])
-
     # Calculate maximal input capacity using the maximal output and the
     # efficiency.
     cpp['max_in'] = cpp['capacity_net_bnetza'] / cpp['efficiency_estimate']
 
-    cpp_by_region_fuel = cpp.groupby(['fuel', 'region', 'commissioned',
-                                      'shutdown'])
-    cpp_g = cpp_by_region_fuel[['capacity_net_bnetza', 'max_in']].sum()
-
-    cpp_g['efficiency_avg'] = 0
-
     if os.path.isfile(filepath_grp) and not overwrite:
-        type_fuel = list()
-        years = list()
         logging.warning(
             "File exists. Skip grouping of conventional power plants.")
         logging.warning("Will not overwrite existing file: {0}".format(
             c.pattern['grouped'].format(cat='conventional')))
         logging.warning("Set overwrite to True to change this behaviour.")
-    else:
-        type_fuel = cpp_g.index.get_level_values(0).unique()
-        years = sorted(cpp_g.index.get_level_values(2).unique())
-        logging.info("Grouping conventional power plants...")
+        return
 
-    for t in type_fuel:
-        logging.info(t)
-        regions = cpp_g.loc[t].index.get_level_values(0).unique()
-        for r in regions:
-            for y in years:
-                sub = cpp_g.loc[(t, r)]
-                tmp = sub.loc[((sub.index.get_level_values(0) <= y) &
-                              (sub.index.get_level_values(1) >= y))].sum(axis=0)
-                if tmp['max_in'] != 0:
-                    tmp['efficiency_avg'] = (tmp['capacity_net_bnetza'] /
-                                             tmp['max_in'])
-                else:
-                    tmp['efficiency_avg'] = np.nan
-                df.loc[(t, y, r)] = tuple(
-                    tmp[['capacity_net_bnetza', 'efficiency_avg']])
+    logging.info("Grouping conventional power plants...")
+    df = conventional_capacity_by_year(cpp)
+    df = df.sort_index()
+    df.to_csv(filepath_grp)
 
-    if not os.path.isfile(filepath_grp) or overwrite:
-        df = df.sort_index()
-        df.to_csv(filepath_grp)
+
+def conventional_capacity_by_year(cpp):
+    """
+    Sum up the active capacity and the input capacity by fuel, region and
+    year and calculate the average efficiency.
+
+    A plant is active from the year of commissioning until the year of
+    shutdown (including both). Each plant adds its capacity in the year of
+    commissioning and removes it in the first year after its shutdown. The
+    cumulative sum of these events over the years is the active capacity.
+    The years are the years of commissioning of all plants. Plants without
+    fuel, region, commissioning or shutdown year are ignored.
+    """
+    cols = ['capacity_net_bnetza', 'max_in']
+    cpp = cpp.dropna(subset=['fuel', 'region', 'commissioned', 'shutdown'])
+    years = np.array(sorted(cpp.commissioned.unique()))
+    regions = cpp.groupby(['fuel', 'region']).size().index
+
+    # Plants shut down before their commissioning are never active.
+    cpp = cpp.loc[cpp.shutdown >= cpp.commissioned]
+
+    # Event table: + at commissioning, - in the first year after shutdown
+    on = cpp[['fuel', 'region'] + cols].copy()
+    on['year'] = cpp.commissioned
+    pos = np.searchsorted(years, cpp.shutdown.values, side='right')
+    off = cpp.loc[pos < len(years), ['fuel', 'region'] + cols]
+    off[cols] = -off[cols]
+    off['year'] = years[pos[pos < len(years)]]
+    events = pd.concat([on, off]).groupby(['fuel', 'region', 'year'])[
+        cols].sum()
+
+    active = dict()
+    for col in cols:
+        active[col] = events[col].unstack('year').reindex(
+            index=regions, columns=years).fillna(0).cumsum(axis=1)
+        # Remove rounding errors of the cumulative sum
+        active[col][active[col].abs() < 1e-6] = 0
+
+    efficiency = (active['capacity_net_bnetza'] /
+                  active['max_in'].replace(0, np.nan))
+
+    df = pd.DataFrame({
+        'capacity': active['capacity_net_bnetza'].stack(),
+        'efficiency': efficiency.stack(dropna=False)},
+        columns=['capacity', 'efficiency'])
+    df.index.names = ['fuel', 'region', 'year']
+    return df.reorder_levels(['fuel', 'year', 'region'])
+
+
+def capacity_timeline(capacity, years):
+    """
+    Calculate the installed capacity of each group for the given years.
+
+    A plant is active between its commissioning and decommissioning date. The
+    capacity of a year is the capacity at the beginning of the year if it
+    does not change until the next year. Otherwise the changes at the
+    beginning of each month are weighted by the remaining months of the year.
+
+    All groups and dates are searched at once in the sorted cumulative
+    commissioning and decommissioning curves of all groups.
+
+    Parameters
+    ----------
+    capacity : pandas.Series
+        Capacity with a MultiIndex. The last two levels have to be the
+        commissioning and the decommissioning date. All other levels define
+        the groups.
+    years : iterable
+        Years to calculate.
+
+    Returns
+    -------
+    pandas.DataFrame : Capacity with one row for each group and one column
+        for each year.
+    """
+    years = np.asarray(sorted(years))
+    levels = list(range(capacity.index.nlevels - 2))
+    if len(levels) == 1:
+        groups = capacity.index.get_level_values(0)
+    else:
+        groups = capacity.index.droplevel([-2, -1])
+    codes, uniques = pd.factorize(groups)
+
+    # Dates as seconds (commissioning rounded down, decommissioning rounded
+    # up) shifted to positive values, combined with the code of the group.
+    # Sorting this key sorts by group and date.
+    step = 10 ** 11
+    shift = 5 * 10 ** 9
+    comm = (pd.DatetimeIndex(capacity.index.get_level_values(-2)).asi8 //
+            10 ** 9 + shift)
+    decomm = (-(-pd.DatetimeIndex(capacity.index.get_level_values(-1)).asi8 //
+                10 ** 9) + shift)
+    values = capacity.values.astype(float)
+
+    # Plants decommissioned before their commissioning are never active.
+    active = decomm > comm
+    codes, comm, decomm, values = (codes[active], comm[active],
+                                   decomm[active], values[active])
+
+    curves = dict()
+    for name, dates in (('comm', comm), ('decomm', decomm)):
+        key = codes * step + dates
+        order = np.argsort(key, kind='mergesort')
+        curves[name] = (key[order],
+                        np.concatenate(([0], np.cumsum(values[order]))))
+
+    # Dates: 1st of January of each year, 1st of each month (February to
+    # December) and the 1st of January of the following year.
+    dates = [[pd.datetime(y, 1, 1)] +
+             [pd.datetime(y, m, 1) for m in range(2, 13)] +
+             [pd.datetime(y + 1, 1, 1)] for y in years]
+    dates = (pd.DatetimeIndex(np.ravel(dates)).asi8 // 10 ** 9 + shift)
+    dates = dates.reshape(len(years), 13)
+
+    group = np.arange(len(uniques))[:, np.newaxis, np.newaxis]
+    query = group * step + dates[np.newaxis, :, :]
+    first = group * step
+
+    def cumulated(name, side):
+        key, cum = curves[name]
+        return (cum[np.searchsorted(key, query, side=side)] -
+                cum[np.searchsorted(key, first, side='left')])
+
+    # Capacity commissioned before and not decommissioned until the date.
+    cap = cumulated('comm', 'left') - cumulated('decomm', 'right')
+
+    start = cap[:, :, 0]
+    next_y = cap[:, :, 12]
+    weighted = start.copy()
+    for m in range(11):
+        weighted += (cap[:, :, m + 1] - weighted) * ((11 - m) / 12)
+    result = np.where(next_y == start, next_y, weighted)
+
+    if len(levels) == 1:
+        index = pd.Index(uniques, name=capacity.index.names[0])
+    else:
+        index = pd.MultiIndex.from_tuples(list(uniques),
+                                          names=capacity.index.names[:-2])
+    return pd.DataFrame(result, index=index, columns=years)
 
 
 def group_re_powerplants(c, overwrite=False, keep_files=False):
@@ -402,44 +531,17 @@ def group_re_powerplants(c, overwrite=False, keep_files=False):
 
     # Loop over list with non existing files or all files if overwrite=True
     for t in re_source_new:
-        regions = repp_g.loc[t].index.get_level_values(0).unique()
-        for r in regions:
-            logging.info('{0}: {1}'.format(t, r))
-            if t in ['Wind', 'Solar']:
-                coastdat_ids = repp_gc.loc[t, r].index.get_level_values(
-                    0).unique()
-            else:
-                coastdat_ids = list(('0000000',))
-            for ci in coastdat_ids:
-                logging.debug('{0}: {1} - {2}'.format(t, r, ci))
-                if t in ['Wind', 'Solar']:
-                    sub = repp_gc.loc[(t, r, ci)]
-                else:
-                    sub = repp_g.loc[(t, r,)]
-                for y in years:
-                    start = sub[
-                        (sub.index.get_level_values(0) < pd.datetime(y, 1, 1)) &
-                        (sub.index.get_level_values(1) > pd.datetime(y, 1, 1))
-                        ].sum()
-                    next_y = sub[
-                        (sub.index.get_level_values(0) < pd.datetime(y + 1, 1,
-                                                                     1)) &
-                        (sub.index.get_level_values(1) > pd.datetime(y + 1, 1,
-                                                                     1))
-                        ].sum()
-                    if next_y == start:
-                        df.loc[(t, y, r, ci)] = next_y
-                    else:
-                        cap = start
-                        for m in range(11):
-                            cap += (sub[
-                                        (sub.index.get_level_values(0) <
-                                         pd.datetime(y, m + 2, 1)) &
-                                        (sub.index.get_level_values(1) >
-                                         pd.datetime(y, m + 2,
-                                                     1))].sum() - cap) * (
-                                       (11 - m) / 12)
-                        df.loc[(t, y, r, ci)] = cap
+        logging.info('Grouping {0}...'.format(t))
+        if t in ['Wind', 'Solar']:
+            timeline = capacity_timeline(repp_gc.loc[[t]], years)
+        else:
+            timeline = capacity_timeline(repp_g.loc[[t]], years)
+            timeline['coastdat'] = '0000000'
+            timeline.set_index('coastdat', append=True, inplace=True)
+        timeline.index.names = ['source', 'region', 'coastdat']
+        timeline.columns.name = 'year'
+        df = pd.DataFrame(timeline.stack(), columns=['capacity'])
+        df = df.reorder_levels(['source', 'year', 'region', 'coastdat'])
 
         # Store DataFrame to csv-file
         df = df.sort_index()
@@ -492,13 +594,13 @@ def prepare_conventional_power_plants(c, overwrite=False):
 
         # Add region column (DE01 - DE21)
         geo_file = os.path.join(c.paths['geometry'], c.files['region_polygons'])
-        gcpp = tools.add_spatial_name(c, gcpp, geo_file, 'region', category,
+        gcpp = tools.add_spatial_name(gcpp, geo_file, 'region', category,
                                       time=start)
 
         # Add column with name of the federal state (Bayern, Berlin,...)
         geo_file = os.path.join(c.paths['geometry'],
                                 c.files['federal_states_polygon'])
-        gcpp = tools.add_spatial_name(c, gcpp, geo_file, 'federal_state',
+        gcpp = tools.add_spatial_name(gcpp, geo_file, 'federal_state',
                                       category, time=start, icol='iso')
 
         # fix region by country code
@@ -557,13 +659,13 @@ def prepare_re_power_plants(c, overwrite=False):
 
         # Add region column (DE01 - DE21)
         gee = tools.add_spatial_name(
-            c, gee, os.path.join(c.paths['geometry'],
+            gee, os.path.join(c.paths['geometry'],
                                  c.files['region_polygons']),
             'region', category, time=start)
 
         # Add column with coastdat id
         gee = tools.add_spatial_name(
-            c, gee, os.path.join(c.paths['geometry'],
+            gee, os.path.join(c.paths['geometry'],
                                  c.files['coastdatgrid_polygons']),
             'coastdat_id', category, time=start)
 
@@ -618,13 +720,13 @@ def create_patch_offshore_wind(c):
 
     # Add column with region id
     gee = tools.add_spatial_name(
-        c, gee, os.path.join(c.paths['geometry'],
+        gee, os.path.join(c.paths['geometry'],
                              c.files['region_polygons']),
         'region', 'offshore')
 
     # Add column with coastdat id
     gee = tools.add_spatial_name(
-        c, gee, os.path.join(c.paths['geometry'],
+        gee, os.path.join(c.paths['geometry'],
                              c.files['coastdatgrid_polygons']),
         'coastdat_id', 'offshore')
 
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Rolling horizon solve mode for solph energy systems.
+
+The nodes are created once for the full time index. The model is then
+solved for overlapping windows. Before each window the sequences of all
+nodes and flows are cut to the window and the storage levels at the end of
+the previous window (without the overlap) are used as initial levels. The
+results of the windows without the overlap are stitched together.
+
+This module does not depend on the de21 scenario tools and can be used for
+any solph energy system (e.g. the de21 scenarios or the berlin_hp model).
+"""
+
+__copyright__ = "Uwe Krien"
+__license__ = "GPLv3"
+
+import logging
+import datetime
+import resource
+from concurrent import futures
+
+import pandas as pd
+
+from oemof.solph import OperationalModel
+from oemof.solph.network import Storage
+from oemof.outputlib import ResultsDataFrame
+
+
+def windows(length, window=168, overlap=24):
+    """
+    Split a time index into overlapping windows.
+
+    Parameters
+    ----------
+    length : int
+        Number of time steps of the full time index.
+    window : int
+        Number of time steps that are kept of each window.
+    overlap : int
+        Number of additional time steps that are solved but not kept.
+
+    Returns
+    -------
+    list of tuples : (start, stop, keep) of each window. The steps start to
+        stop are solved, the first keep steps of them are kept.
+    """
+    if window < 1 or overlap < 0:
+        raise ValueError("Window must be positive, overlap not negative.")
+    return [(start, min(start + window + overlap, length),
+             min(window, length - start))
+            for start in range(0, length, window)]
+
+
+def timeindex_attribute(es):
+    """Name of the time index attribute of the energy system (older versions
+    of oemof use 'time_idx')."""
+    if hasattr(es, 'timeindex'):
+        return 'timeindex'
+    return 'time_idx'
+
+
+def energy_system_nodes(es):
+    """All nodes of an energy system."""
+    return getattr(es, 'nodes', None) or es.entities
+
+
+def sequence_attributes(es):
+    """
+    Find all sequences of the nodes and flows of an energy system.
+
+    An attribute is a sequence if it is iterable (but not a string or a
+    dictionary) and has the length of the time index. Dictionaries (e.g. the
+    conversion_factors) are searched one level deep.
+
+    Returns
+    -------
+    dict : The full sequences with (object, attribute, key) as key. The key
+        is None if the attribute itself is the sequence.
+    """
+    length = len(getattr(es, timeindex_attribute(es)))
+    objects = list()
+    for node in energy_system_nodes(es):
+        objects.append(node)
+        objects.extend(node.outputs.values())
+
+    def is_sequence(value):
+        return (hasattr(value, '__len__') and
+                not isinstance(value, (str, dict)) and len(value) == length)
+
+    sequences = dict()
+    for obj in objects:
+        for attr, value in vars(obj).items():
+            if isinstance(value, dict):
+                for key, sub_value in value.items():
+                    if is_sequence(sub_value):
+                        sequences[obj, attr, key] = list(sub_value)
+            elif is_sequence(value):
+                sequences[obj, attr, None] = list(value)
+    return sequences
+
+
+def set_window(es, sequences, timeindex, start, stop):
+    """Cut the time index and all sequences of the energy system to the time
+    steps start to stop (sequences see sequence_attributes)."""
+    setattr(es, timeindex_attribute(es), timeindex[start:stop])
+    for (obj, attr, key), full in sequences.items():
+        if key is None:
+            setattr(obj, attr, full[start:stop])
+        else:
+            getattr(obj, attr)[key] = full[start:stop]
+
+
+def storages(es):
+    return [node for node in energy_system_nodes(es)
+            if isinstance(node, Storage)]
+
+
+def storage_levels(om, step):
+    """Absolute level of each storage at the given step of the model."""
+    return {node: om.Storage.capacity[node, step].value
+            for node in storages(om.es)}
+
+
+def set_storage_levels(levels):
+    """Use the given absolute levels as initial levels of the storages
+    (initial_capacity is relative to the nominal capacity)."""
+    for node, level in levels.items():
+        if node.nominal_capacity:
+            node.initial_capacity = level / node.nominal_capacity
+
+
+def variable_costs(om, steps):
+    """Variable costs of the first steps of a solved model."""
+    costs = 0
+    for (i, o), flow in om.flows.items():
+        if flow.variable_costs[0] is None:
+            continue
+        costs += sum(om.flow[i, o, t].value * flow.variable_costs[t]
+                     for t in range(steps))
+    return costs
+
+
+def solve_model(es, solver, solve_kwargs=None, cmdline_options=None):
+    """Create an OperationalModel of the energy system and solve it."""
+    om = OperationalModel(es)
+    om.receive_duals()
+    om.solve(solver=solver, solve_kwargs=solve_kwargs or dict(),
+             cmdline_options=cmdline_options or dict())
+    return om
+
+
+def solve_full(es, solver, solve_kwargs=None, cmdline_options=None):
+    """
+    Solve the energy system over the full time index.
+
+    Returns
+    -------
+    tuple : Results (see oemof.outputlib.ResultsDataFrame) and variable
+        costs.
+    """
+    om = solve_model(es, solver, solve_kwargs, cmdline_options)
+    results = pd.DataFrame(ResultsDataFrame(energy_system=es))
+    return results, variable_costs(om, len(
+        getattr(es, timeindex_attribute(es))))
+
+
+def solve_rolling_horizon(es, solver, window=168, overlap=24,
+                          solve_kwargs=None, cmdline_options=None):
+    """
+    Solve the energy system in overlapping windows.
+
+    The nodes of the energy system have to be created for the full time
+    index. The storage levels at the last kept step of each window are the
+    initial levels of the next window. The time index, the sequences and the
+    initial levels of the storages are restored afterwards.
+
+    Parameters
+    ----------
+    es : oemof.solph.EnergySystem
+    solver : str
+        Name of the solver.
+    window : int
+        Number of time steps that are kept of each window (default: one week
+        of hourly steps).
+    overlap : int
+        Number of additional time steps of each window (default: one day).
+    solve_kwargs : dict
+    cmdline_options : dict
+
+    Returns
+    -------
+    tuple : Results of all windows in one table (see
+        oemof.outputlib.ResultsDataFrame) and variable costs of the kept
+        steps.
+    """
+    attr = timeindex_attribute(es)
+    timeindex = getattr(es, attr)
+    sequences = sequence_attributes(es)
+    initial = {node: node.initial_capacity for node in storages(es)}
+    parts = list()
+    costs = 0
+    try:
+        for start, stop, keep in windows(len(timeindex), window, overlap):
+            logging.info("Rolling horizon: solving {0} to {1}.".format(
+                timeindex[start], timeindex[stop - 1]))
+            set_window(es, sequences, timeindex, start, stop)
+            om = solve_model(es, solver, solve_kwargs, cmdline_options)
+            results = pd.DataFrame(ResultsDataFrame(energy_system=es))
+            kept = results.index.get_level_values('datetime').isin(
+                timeindex[start:start + keep])
+            parts.append(results.loc[kept])
+            costs += variable_costs(om, keep)
+            set_storage_levels(storage_levels(om, keep - 1))
+    finally:
+        set_window(es, sequences, timeindex, 0, len(timeindex))
+        for node, initial_capacity in initial.items():
+            node.initial_capacity = initial_capacity
+    return pd.concat(parts).sort_index(), costs
+
+
+def benchmark_run(build, solver, window=None, overlap=24):
+    """Worker of benchmark. Returns the variable costs, the solving time and
+    the peak memory."""
+    es = build()
+    start = datetime.datetime.now()
+    if window is None:
+        results, costs = solve_full(es, solver)
+    else:
+        results, costs = solve_rolling_horizon(es, solver, window, overlap)
+    duration = (datetime.datetime.now() - start).total_seconds()
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return costs, duration, max_rss
+
+
+def benchmark(build, solver, window=168, overlap=24):
+    """
+    Compare the rolling horizon solve with the full solve.
+
+    Each solve is run in a separate process, so that the peak memory of the
+    processes can be compared. The objective values of the windows include
+    the overlap and cannot be summed up. Therefore the variable costs of the
+    kept time steps (see variable_costs) are compared instead of the
+    objective.
+
+    Parameters
+    ----------
+    build : callable
+        Function without arguments that returns the energy system with its
+        nodes (has to be picklable, e.g. a module function or a
+        functools.partial of it).
+    solver : str
+    window : int
+    overlap : int
+
+    Returns
+    -------
+    pandas.DataFrame : Variable costs, solving time [s] and peak memory [MB]
+        of both modes and the deviation of the variable costs [%].
+    """
+    report = pd.DataFrame(columns=['variable_costs', 'duration', 'max_rss'])
+    for mode, win in (('full', None), ('rolling', window)):
+        with futures.ProcessPoolExecutor(max_workers=1) as executor:
+            report.loc[mode] = executor.submit(
+                benchmark_run, build, solver, win, overlap).result()
+    full = report.variable_costs['full']
+    report['variable_costs_deviation'] = (
+        (report.variable_costs - full) / full * 100)
+    logging.info("Rolling horizon benchmark (window: {0}, overlap: {1}):"
+                 "\n{2}".format(window, overlap, report))
+    return report
@@ -217,8 +217,14 @@ def prepare_transmission_lines(c):
 
 
 def prepare_demand(c):
-    logging.info('Prepare demand...({0})'.format(c.general['demand_year']))
-    elec_demand = demand.get_demand_by_region(c.general['demand_year'], c)
+    logging.info('Prepare demand...({0}, {1})'.format(
+        c.general['demand_year'], c.general['demand_kind']))
+    elec_demand = demand.get_de21_profile(c.general['demand_year'],
+                                          c.general['demand_kind'],
+                                          c.general['annual_demand'])
+    if elec_demand is None:
+        raise ValueError("Unknown demand kind: {0}".format(
+            c.general['demand_kind']))
     if len(elec_demand) < 8760:
         logging.error("Cannot prepare electrical demand for {0}".format(
             c.general['year']))
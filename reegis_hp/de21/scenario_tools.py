@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
 
 import pandas as pd
+import numpy as np
+import json
 import os
+import shutil
+import tempfile
+from collections import OrderedDict
 import os.path as path
 import logging
+from scipy.cluster import hierarchy
 from oemof import network
 from oemof.solph import EnergySystem
 from oemof.solph.options import BinaryFlow, Investment
@@ -21,6 +27,124 @@ PARAMETER = (
 INDEX = ('class', 'label', 'source', 'target')
 
 
+BINARY_EXTENSION = '.npy'
+
+
+def binary_meta_file(filename):
+    """Name of the meta data file of a binary sequence table."""
+    return path.splitext(filename)[0] + '.json'
+
+
+def csv_column_label(label, position, level):
+    """Label of a column level as read from a csv file: empty labels are
+    named by pandas ('Unnamed: <position>_level_<level>'), all others are
+    strings."""
+    if label is None or label == '' or (
+            not isinstance(label, str) and pd.isnull(label)):
+        return 'Unnamed: {0}_level_{1}'.format(position, level)
+    return str(label)
+
+
+def write_binary_sequence_table(seq, filename):
+    """
+    Write a sequence table into a binary file.
+
+    The values are stored column by column (fortran order) as a numpy file so
+    that single columns can be read from a memory map. The column MultiIndex
+    and the time index are stored in a json file with the same name. Labels
+    and time index are normalised as by the csv reader (see
+    read_sequence_table), so that both formats give the same table (see
+    check_binary_sequence_table).
+    """
+    values = np.lib.format.open_memmap(
+        filename, mode='w+', dtype=np.float64, shape=seq.shape,
+        fortran_order=True)
+    values[:] = seq.values.astype(np.float64)
+    values.flush()
+    del values
+
+    # The csv reader returns the time steps in UTC without time zone and
+    # counts the positions of the columns including the index column.
+    index = pd.DatetimeIndex(seq.index)
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    meta = {'columns': [[csv_column_label(label, pos + 1, level)
+                         for level, label in enumerate(col)]
+                        for pos, col in enumerate(seq.columns)],
+            'names': list(seq.columns.names),
+            'index': index.asi8.tolist(),
+            'index_name': index.name}
+    with open(binary_meta_file(filename), 'w') as f:
+        json.dump(meta, f)
+
+
+def check_binary_sequence_table(seq):
+    """
+    Write the sequence table in both formats (csv and binary), read them
+    again (see SolphScenario.read_sequence_table) and raise an
+    AssertionError if the tables differ.
+
+    Parameters
+    ----------
+    seq : pandas.DataFrame
+        Sequence table.
+    """
+    tmp_path = tempfile.mkdtemp()
+    try:
+        scenario = SolphScenario(timeindex=seq.index, sequences=seq)
+        tables = dict()
+        for extension in ('.csv', BINARY_EXTENSION):
+            filename = path.join(tmp_path, 'seq' + extension)
+            scenario.s = seq
+            scenario.write_sequence_table(filename)
+            scenario.read_sequence_table(filename)
+            tables[extension] = scenario.s
+    finally:
+        shutil.rmtree(tmp_path)
+    pd.util.testing.assert_frame_equal(tables[BINARY_EXTENSION],
+                                       tables['.csv'])
+
+
+class BinarySequenceTable(object):
+    """
+    Memory mapped sequence table (see write_binary_sequence_table). Columns
+    are only loaded on access.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the binary file ('.npy').
+    """
+    def __init__(self, filename):
+        with open(binary_meta_file(filename)) as f:
+            meta = json.load(f)
+        self.values = np.load(filename, mmap_mode='r')
+        self.columns = pd.MultiIndex.from_tuples(
+            [tuple(col) for col in meta['columns']], names=meta['names'])
+        self.index = pd.DatetimeIndex(meta['index'], name=meta['index_name'])
+        self.shape = self.values.shape
+
+    def __getitem__(self, columns):
+        """Load the given columns (list of tuples) as DataFrame or a single
+        column (tuple) as Series."""
+        if isinstance(columns, tuple):
+            return pd.Series(
+                np.array(self.values[:, self.columns.get_loc(columns)]),
+                index=self.index, name=columns)
+        pos = self.columns.get_indexer(pd.MultiIndex.from_tuples(
+            columns, names=self.columns.names))
+        if (pos < 0).any():
+            raise KeyError("Columns not in sequence table: {0}".format(
+                [col for col, p in zip(columns, pos) if p < 0]))
+        return pd.DataFrame(np.array(self.values[:, pos]), index=self.index,
+                            columns=self.columns[pos])
+
+    def load(self):
+        """Load the full table as DataFrame."""
+        return pd.DataFrame(np.array(self.values), index=self.index,
+                            columns=self.columns)
+
+
 class SolphScenario(EnergySystem):
 
     def __init__(self, **kwargs):
@@ -29,6 +153,8 @@ class SolphScenario(EnergySystem):
         self.s = kwargs.get('sequences')
         self.path = kwargs.get('path', path.dirname(path.realpath(__file__)))
         self.name = kwargs.get('name')
+        self.staged_parameters = OrderedDict()
+        self.staged_sequences = OrderedDict()
 
     def create_parameter_table(self, additional_parameter=None):
         """Create an empty parameter table."""
@@ -65,17 +191,27 @@ class SolphScenario(EnergySystem):
             filename = path.join(self.path, self.name + '.csv')
         self.p = pd.read_csv(filename, index_col=[0, 1, 2, 3])
 
-    def read_sequence_table(self, filename=None):
-        """Read existing parameter table from file."""
+    def read_sequence_table(self, filename=None, lazy=False):
+        """Read existing sequence table from file.
+
+        Files with the extension '.npy' are read as binary sequence tables
+        (see write_binary_sequence_table). If lazy is True the binary table
+        is memory mapped and the columns are only loaded on access.
+        """
         if filename is None:
             filename = path.join(self.path, self.name + '_seq.csv')
-        self.s = pd.read_csv(filename, header=[0, 1, 2, 3, 4], parse_dates=True,
-                             index_col=0)
+        if filename.endswith(BINARY_EXTENSION):
+            self.s = BinarySequenceTable(filename)
+            if not lazy:
+                self.s = self.s.load()
+        else:
+            self.s = pd.read_csv(filename, header=[0, 1, 2, 3, 4],
+                                 parse_dates=True, index_col=0)
 
-    def read_tables(self, parameterfile=None, sequencefile=None):
+    def read_tables(self, parameterfile=None, sequencefile=None, lazy=False):
         """Read existing scenario tables (parameter and sequence)"""
         self.read_parameter_table(parameterfile)
-        self.read_sequence_table(sequencefile)
+        self.read_sequence_table(sequencefile, lazy=lazy)
 
     def write_parameter_table(self, filename=None):
         """Write parameter table to file."""
@@ -85,10 +221,14 @@ class SolphScenario(EnergySystem):
         self.p.fillna('').to_csv(filename)
 
     def write_sequence_table(self, filename=None):
-        """Write sequence table to file."""
+        """Write sequence table to file. The binary format is used if the
+        filename ends with '.npy'."""
         if filename is None:
             filename = path.join(self.path, self.name + '_seq.csv')
-        self.s.to_csv(filename)
+        if filename.endswith(BINARY_EXTENSION):
+            write_binary_sequence_table(self.s, filename)
+        else:
+            self.s.to_csv(filename)
 
     def write_tables(self, parameterfile=None, sequencefile=None):
         """Write scenario tables into two separate files."""
@@ -101,22 +241,28 @@ class SolphScenario(EnergySystem):
 
         Notes
         -----
-        At the moment the nodes_from_csv function does not accept Multiindex
-        DataFrames therefore the DataFrames need to be reshaped.
+        If the sequence table is a lazy binary table, only the sequences of
+        the attributes marked with 'seq' in the parameter table are loaded.
         """
-        tmp1 = pd.DataFrame(
-            index=self.s.columns).reset_index().transpose().reset_index()
-        tmp2 = self.s.reset_index()
-        for n in range(len(tmp2.columns.levels) - 1):
-            tmp2.columns = tmp2.columns.droplevel(0)
-        length = len(tmp1.columns)
-        tmp1.columns = list(range(length))
-        tmp2.columns = list(range(length))
-
-        return nodes_from_csv(
-            nodes_flows=self.p.reset_index(),
-            nodes_flows_seq=pd.DataFrame(pd.concat([tmp1, tmp2],
-                                                   ignore_index=True)))
+        if isinstance(self.s, BinarySequenceTable):
+            seq = self.s[self.needed_sequences()]
+        else:
+            seq = self.s
+
+        return nodes_from_csv(nodes_flows=self.p.reset_index(),
+                              sequences=seq)
+
+    def needed_sequences(self):
+        """Columns of the sequence table referenced by a 'seq' entry in the
+        parameter table (matched by class, label and attribute)."""
+        marked = self.p.reset_index().melt(
+            id_vars=['class', 'label'], value_vars=list(self.p.columns),
+            var_name='attributes')
+        marked = marked.loc[marked.value == 'seq']
+        keys = set(zip(marked['class'], marked['label'],
+                       marked['attributes']))
+        return [col for col in self.s.columns
+                if (col[0], col[1], col[4]) in keys]
 
     def add_parameters(self, idx, columns, values):
         self.p.loc[idx, columns] = values
@@ -130,9 +276,275 @@ class SolphScenario(EnergySystem):
                    'sort_index'] = sort_entry
         self.p = self.p.sortlevel()
 
+    def stage_parameters(self, idx, columns, values):
+        """Stage parameters (same arguments as add_parameters). The staged
+        entries are added to the parameter table by commit()."""
+        if isinstance(columns, str):
+            columns = [columns]
+        if isinstance(values, str) or not hasattr(values, '__iter__'):
+            values = [values] * len(columns)
+        self.staged_parameters.setdefault(tuple(idx), dict()).update(
+            zip(columns, values))
+
+    def stage_sequences(self, idx, seq):
+        """Stage a sequence (same arguments as add_sequences). The staged
+        sequences are added to the sequence table by commit()."""
+        self.staged_sequences[tuple(idx)] = seq
+
+    def stage_comment_line(self, comment, sort_entry):
+        """Stage a comment line (same arguments as add_comment_line)."""
+        self.stage_parameters(('### {0}'.format(comment), '', '', ''),
+                              'sort_index', sort_entry)
+
+    def commit(self):
+        """Add all staged parameters and sequences to the scenario tables.
+
+        The tables are concatenated and sorted only once. Staged values
+        replace existing entries with the same index (as add_parameters and
+        add_sequences). Sequences without an index (lists, arrays) are
+        assigned by position.
+        """
+        if len(self.staged_parameters) > 0:
+            new = pd.DataFrame.from_dict(self.staged_parameters,
+                                         orient='index')
+            staged = pd.DataFrame.from_dict(
+                {idx: dict.fromkeys(values, True)
+                 for idx, values in self.staged_parameters.items()},
+                orient='index')
+            new.index = staged.index = pd.MultiIndex.from_tuples(
+                list(new.index), names=self.p.index.names)
+            columns = list(self.p.columns) + [
+                col for col in new.columns if col not in self.p.columns]
+            index = self.p.index.append(new.index[~new.index.isin(
+                self.p.index)])
+            staged = staged.reindex(index=index, columns=columns).fillna(
+                False).astype(bool)
+            new = new.reindex(index=index, columns=columns)
+            # Staged cells (even NaN) replace the existing values.
+            self.p = self.p.reindex(index=index, columns=columns).where(
+                ~staged, new).sort_index()
+            self.staged_parameters = OrderedDict()
+
+        if len(self.staged_sequences) > 0:
+            new = pd.concat(
+                [seq.reindex(self.s.index) if isinstance(seq, pd.Series)
+                 else pd.Series(seq, index=self.s.index)
+                 for seq in self.staged_sequences.values()], axis=1)
+            new.columns = pd.MultiIndex.from_tuples(
+                list(self.staged_sequences.keys()), names=self.s.columns.names)
+            old = self.s.loc[:, ~self.s.columns.isin(new.columns)]
+            self.s = pd.concat([old, new], axis=1)
+            self.staged_sequences = OrderedDict()
+
+    def aggregate(self, n_periods, period_length=24, columns=None,
+                  extreme_columns=None):
+        """
+        Create a scenario of typical periods (see typical_periods).
+
+        Variable costs are multiplied with the weight of each time step so
+        that the objective represents the full time index. The summed_max
+        values are scaled with the ratio of the number of time steps. This is
+        an approximation: solph limits the unweighted sum of the aggregated
+        flow, while the flow of the full time index is the weighted sum. Both
+        limits are only equal if all weights are the same. Storages are
+        balanced over the chained typical periods.
+
+        Parameters
+        ----------
+        n_periods : int
+            Number of typical periods.
+        period_length : int
+            Number of time steps of one period (24: days, 168: weeks).
+        columns : list of tuples
+            Sequence columns used for the clustering. By default all
+            'actual_value' sequences (demand, wind, solar, hydro...).
+        extreme_columns : list of tuples
+            The period with the maximum of each of these columns is kept
+            as an additional typical period (e.g. the peak demand).
+
+        Returns
+        -------
+        SolphScenario : Scenario of the typical periods. The weight of each
+            time step is stored in the attribute 'weights', the mapping of
+            the full time index to the time steps of the typical periods in
+            'step_map' (see expand_results).
+        """
+        if isinstance(self.s, BinarySequenceTable):
+            seq = self.s.load()
+        else:
+            seq = self.s
+
+        typical, weights, step_map = typical_periods(
+            seq, n_periods, period_length, columns=columns,
+            extreme_columns=extreme_columns)
+
+        name = self.name
+        if name is not None:
+            name = '{0}_{1}x{2}'.format(name, n_periods, period_length)
+        scenario = SolphScenario(timeindex=typical.index, path=self.path,
+                                 name=name, parameters=self.p.copy(),
+                                 sequences=typical.copy())
+        scenario.weights = weights
+        scenario.step_map = step_map
+
+        for idx, costs in self.p['variable_costs'].items():
+            if costs == 'seq':
+                col = tuple(idx) + ('variable_costs',)
+                scenario.stage_sequences(col, typical[col] * weights)
+            elif pd.notnull(costs) and costs != '':
+                scenario.stage_sequences(tuple(idx) + ('variable_costs',),
+                                         float(costs) * weights)
+                scenario.stage_parameters(idx, 'variable_costs', 'seq')
+        scenario.commit()
+
+        # Approximation, see above (exact only for equal weights).
+        summed_max = pd.to_numeric(scenario.p['summed_max'], errors='coerce')
+        scenario.p.loc[summed_max.notnull(), 'summed_max'] = (
+            summed_max[summed_max.notnull()] * len(typical) / len(seq))
+        return scenario
+
+
+def typical_periods(seq, n_periods, period_length=24, columns=None,
+                    extreme_columns=None):
+    """
+    Select typical periods (e.g. days or weeks) of a sequence table.
+
+    The periods are clustered by the joint profile of the given columns
+    (normalised to the range 0..1) using hierarchical clustering (ward). The
+    period closest to the centre of each cluster is used as typical period,
+    so that the correlation between the sequences (e.g. demand and feedin)
+    is kept. Remaining time steps at the end of the table (less than a
+    period) are mapped to the most similar beginning of a typical period.
+    Missing values are interpolated for the clustering, columns without any
+    value are not used.
+
+    Parameters
+    ----------
+    seq : pandas.DataFrame
+        Sequence table.
+    n_periods : int
+        Number of typical periods (including the extreme periods).
+    period_length : int
+        Number of time steps of one period.
+    columns : list of tuples
+        Columns used for the clustering. By default all 'actual_value'
+        columns.
+    extreme_columns : list of tuples
+        The period with the maximum of each of these columns is kept as
+        additional typical period.
+
+    Returns
+    -------
+    tuple : Sequence table of the typical periods with a continuous time
+        index, the weight of each of its time steps (pandas.Series) and the
+        position of the time step in this table for each step of the full
+        time index (pandas.Series).
+    """
+    if columns is None:
+        columns = [col for col in seq.columns if col[-1] == 'actual_value']
+    if extreme_columns is None:
+        extreme_columns = list()
+
+    data = seq[columns].astype(float)
+    empty = data.columns[data.isnull().all().values]
+    if len(empty) > 0:
+        logging.warning("Columns without values are not used for the "
+                        "clustering: {0}".format(list(empty)))
+        data = data.drop(empty, axis=1)
+        columns = list(data.columns)
+    if len(columns) == 0:
+        raise ValueError("No columns with values to cluster the periods.")
+    # Single missing values are interpolated (hierarchy.linkage fails on NaN).
+    data = data.interpolate().fillna(method='bfill')
+    spread = data.max() - data.min()
+    data = (data - data.min()) / spread.where(spread > 0, 1)
+    values = data.values
+
+    n_full = len(values) // period_length
+    periods = values[:n_full * period_length].reshape(n_full, -1)
+
+    extreme = sorted(set(
+        int(data[col].values[:n_full * period_length].argmax()) //
+        period_length for col in extreme_columns))
+    n_clusters = n_periods - len(extreme)
+    if n_clusters < 1 or n_periods > n_full:
+        raise ValueError(
+            "Number of periods must be between {0} and {1}.".format(
+                len(extreme) + 1, n_full))
+
+    others = np.setdiff1d(np.arange(n_full), extreme)
+    if n_clusters < len(others):
+        labels = hierarchy.fcluster(
+            hierarchy.linkage(periods[others], method='ward'),
+            n_clusters, criterion='maxclust')
+        labels = np.unique(labels, return_inverse=True)[1]
+    else:
+        labels = np.arange(len(others))
+
+    representatives = list(extreme)
+    period_map = np.empty(n_full, dtype=int)
+    period_map[extreme] = np.arange(len(extreme))
+    for cluster in range(labels.max() + 1):
+        members = others[labels == cluster]
+        centre = periods[members].mean(axis=0)
+        medoid = members[((periods[members] - centre) ** 2).sum(
+            axis=1).argmin()]
+        period_map[members] = len(representatives)
+        representatives.append(medoid)
+    representatives = np.array(representatives)
+
+    steps = np.arange(period_length)
+    step_map = (period_map[:, np.newaxis] * period_length + steps).ravel()
+    rest = len(values) - n_full * period_length
+    if rest > 0:
+        tail = values[n_full * period_length:].ravel()
+        heads = np.array([values[p * period_length:p * period_length + rest]
+                          .ravel() for p in representatives])
+        nearest = ((heads - tail) ** 2).sum(axis=1).argmin()
+        step_map = np.concatenate(
+            [step_map, nearest * period_length + steps[:rest]])
+
+    rows = (representatives[:, np.newaxis] * period_length + steps).ravel()
+    freq = seq.index.freq or pd.infer_freq(seq.index)
+    typical = seq.iloc[rows].copy()
+    typical.index = pd.date_range(seq.index[0], periods=len(rows), freq=freq,
+                                  name=seq.index.name)
+    weights = pd.Series(np.bincount(step_map, minlength=len(rows)),
+                        index=typical.index, name='weight')
+    logging.info("Aggregated {0} time steps to {1} typical periods ({2} "
+                 "time steps).".format(len(seq), len(representatives),
+                                       len(rows)))
+    return typical, weights, pd.Series(step_map, index=seq.index,
+                                       name='step')
+
+
+def expand_results(results, step_map):
+    """
+    Expand the results of an aggregated scenario to the full time index.
+
+    Parameters
+    ----------
+    results : pandas.DataFrame
+        Results with a 'datetime' level in the index (see
+        oemof.outputlib.ResultsDataFrame).
+    step_map : pandas.Series
+        Position of the aggregated time step for each step of the full time
+        index (see SolphScenario.aggregate).
+
+    Returns
+    -------
+    pandas.DataFrame : Results over the full time index.
+    """
+    expanded = dict()
+    for col in results.columns:
+        table = results[col].unstack('datetime')
+        table = table.iloc[:, step_map.values]
+        table.columns = step_map.index.rename('datetime')
+        expanded[col] = table.stack()
+    return pd.DataFrame(expanded, columns=results.columns)
+
 
-def function1(row, nodes, classes, flow_attrs, seq_attributes, nodes_flows_seq,
-              i):
+def function1(row, nodes, classes, flow_attrs, seq_attributes, sequences, i):
     """
     create node if not existent and set attributes
     (attributes must be placed either in the first line or in all
@@ -175,16 +587,10 @@ def function1(row, nodes, classes, flow_attrs, seq_attributes, nodes_flows_seq,
                             setattr(node, attr, row[attr])
 
                     else:
-                        seq = nodes_flows_seq.loc[row['class'],
-                                                  row['label'],
-                                                  row['source'],
-                                                  row['target'],
-                                                  attr]
+                        seq = sequences[row['class'], row['label'],
+                                        row['source'], row['target'], attr]
                         if attr in seq_attributes:
-                            seq = [i for i in seq]
                             seq = sequence(seq)
-                        else:
-                            seq = [i for i in seq.values]
                         setattr(node, attr, seq)
     except:
         print('Error with node creation in line', i+2, 'in csv file.')
@@ -193,7 +599,7 @@ def function1(row, nodes, classes, flow_attrs, seq_attributes, nodes_flows_seq,
     return node
 
 
-def function2(row, node, flow_attrs, seq_attributes, nodes_flows_seq, i):
+def function2(row, node, flow_attrs, seq_attributes, sequences, i):
     """create flow and set attributes
     """
     try:
@@ -205,16 +611,10 @@ def function2(row, node, flow_attrs, seq_attributes, nodes_flows_seq, i):
                         row[attr] = sequence(float(row[attr]))
                     setattr(flow, attr, row[attr])
                 if row[attr] == 'seq':
-                    seq = nodes_flows_seq.loc[row['class'],
-                                              row['label'],
-                                              row['source'],
-                                              row['target'],
-                                              attr]
+                    seq = sequences[row['class'], row['label'],
+                                    row['source'], row['target'], attr]
                     if attr in seq_attributes:
-                        seq = [i for i in seq]
                         seq = sequence(seq)
-                    else:
-                        seq = [i for i in seq.values]
                     setattr(flow, attr, seq)
                 # this block is only for binary flows!
                 if attr == 'binary' and row[attr] is True:
@@ -267,19 +667,15 @@ def function3(row, nodes, flow, bus_attrs, type1, type2, i):
     return tmp
 
 
-def function4(row, nodes, nodes_flows_seq, i):
+def function4(row, nodes, sequences, i):
     """create a conversion_factor entry for the current lin
     """
     try:
         if row['target'] and 'conversion_factors' in row:
             if row['conversion_factors'] == 'seq':
-                seq = nodes_flows_seq.loc[row['class'],
-                                          row['label'],
-                                          row['source'],
-                                          row['target'],
-                                          'conversion_factors']
-                seq = [i for i in seq]
-                seq = sequence(seq)
+                seq = sequence(sequences[row['class'], row['label'],
+                                         row['source'], row['target'],
+                                         'conversion_factors'])
                 conversion_factors = {nodes[row['target']]: seq}
             else:
                 conversion_factors = {
@@ -300,10 +696,54 @@ def NodesFromCSV(file_nodes_flows, file_nodes_flows_sequences, **kwargs):
     nodes_from_csv(file_nodes_flows, file_nodes_flows_sequences, **kwargs)
 
 
+def sequence_lookup(nodes_flows, table, keys_in_columns=False):
+    """
+    Get the sequences of all attributes marked with 'seq' in one indexed
+    selection.
+
+    Parameters
+    ----------
+    nodes_flows : pandas.DataFrame
+        Parameter table with the columns 'class', 'label', 'source', 'target'
+        and one column for each attribute.
+    table : pandas.DataFrame
+        Sequence table with one row for each (class, label, source, target,
+        attribute) and one column for each time step.
+    keys_in_columns : boolean
+        Set to True if the table has one column for each (class, label,
+        source, target, attribute) and one row for each time step.
+
+    Returns
+    -------
+    dict : One numpy array for each (class, label, source, target,
+        attribute).
+    """
+    marked = nodes_flows.melt(
+        id_vars=['class', 'label', 'source', 'target'],
+        value_vars=[col for col in nodes_flows.columns
+                    if col not in INDEX], var_name='attributes')
+    marked = marked.loc[marked.value == 'seq']
+    keys = list(zip(marked['class'], marked['label'], marked['source'],
+                    marked['target'], marked['attributes']))
+    if len(keys) == 0:
+        return dict()
+    if keys_in_columns:
+        values = table.reindex(
+            columns=pd.MultiIndex.from_tuples(keys)).transpose()
+    else:
+        values = table.reindex(pd.MultiIndex.from_tuples(keys))
+    missing = values.isnull().all(axis=1).values
+    if missing.any():
+        raise KeyError("Sequences not found: {0}".format(
+            [key for key, m in zip(keys, missing) if m]))
+    values = np.ascontiguousarray(values.values, dtype=np.float64)
+    return {key: values[n] for n, key in enumerate(keys)}
+
+
 def nodes_from_csv(file_nodes_flows=None, file_nodes_flows_sequences=None,
                    nodes_flows=None, nodes_flows_seq=None, delimiter=',',
                    additional_classes=None, additional_seq_attributes=None,
-                   additional_flow_attributes=None):
+                   additional_flow_attributes=None, sequences=None):
     """ Creates nodes with their respective flows and sequences from
     a pre-defined CSV structure. An example has been provided in the
     development examples
@@ -311,7 +751,12 @@ def nodes_from_csv(file_nodes_flows=None, file_nodes_flows_sequences=None,
     Parameters
     ----------
     nodes_flows_seq : pandas.DataFrame
+        Sequences in the raw csv format (see file_nodes_flows_sequences).
     nodes_flows : pandas.DataFrame
+    sequences : pandas.DataFrame
+        Sequence table with a MultiIndex (class, label, source, target,
+        attribute) as columns (see SolphScenario). Used instead of
+        nodes_flows_seq if given.
     file_nodes_flows : string
         Name of CSV file with nodes and flows
     file_nodes_flows_sequences : string
@@ -341,15 +786,19 @@ def nodes_from_csv(file_nodes_flows=None, file_nodes_flows_sequences=None,
     if nodes_flows is None:
         nodes_flows = pd.read_csv(file_nodes_flows, sep=delimiter)
 
-    if nodes_flows_seq is None:
-        nodes_flows_seq = pd.read_csv(file_nodes_flows_sequences, sep=delimiter,
-                                      header=None)
-    nodes_flows_seq.dropna(axis=0, how='all', inplace=True)
-    nodes_flows_seq.drop(0, axis=1, inplace=True)
-    nodes_flows_seq = nodes_flows_seq.transpose()
-    nodes_flows_seq.set_index([0, 1, 2, 3, 4], inplace=True)
-    nodes_flows_seq.columns = range(0, len(nodes_flows_seq.columns))
-    nodes_flows_seq = nodes_flows_seq.astype(float)
+    if sequences is None:
+        if nodes_flows_seq is None:
+            nodes_flows_seq = pd.read_csv(file_nodes_flows_sequences,
+                                          sep=delimiter, header=None)
+        nodes_flows_seq.dropna(axis=0, how='all', inplace=True)
+        nodes_flows_seq.drop(0, axis=1, inplace=True)
+        nodes_flows_seq = nodes_flows_seq.transpose()
+        nodes_flows_seq.set_index([0, 1, 2, 3, 4], inplace=True)
+        nodes_flows_seq.columns = range(0, len(nodes_flows_seq.columns))
+        sequences = sequence_lookup(nodes_flows, nodes_flows_seq)
+    else:
+        sequences = sequence_lookup(nodes_flows, sequences,
+                                    keys_in_columns=True)
 
     # class dictionary for dynamic instantiation
     classes = {'Source': Source, 'Sink': Sink,
@@ -368,53 +817,49 @@ def nodes_from_csv(file_nodes_flows=None, file_nodes_flows_sequences=None,
     flow_attrs = list(vars(Flow()).keys()) + additional_flow_attributes
     bus_attrs = vars(Bus()).keys()
 
-    # iteration over dataframe rows to create objects
+    # Only lines with valid data are used. Blank lines or lines that contain
+    # data explanations are skipped.
+    valid = nodes_flows.loc[nodes_flows['class'].isin(list(classes.keys()))]
+
+    # iteration over the lines in file order to create objects
     nodes = {}
-    for i, r in nodes_flows.iterrows():
-        # check if current line holds valid data or is just for visual purposes
-        # e.g. a blank line or a line that contains data explanations
-        if isinstance(r['class'], str) and r['class'] in classes.keys():
-
-            # drop NaN values from series
-            r = r.dropna()
-            # save column labels and row values in dict
-            row = dict(zip(r.index.values, r.values))
-
-            # function1
-            node = function1(row, nodes, classes, flow_attrs, seq_attributes,
-                             nodes_flows_seq, i)
-
-            # create flow and set attributes
-            flow = function2(row, node, flow_attrs, seq_attributes,
-                             nodes_flows_seq, i)
-
-            # inputs, outputs and conversion_factors
-            inputs = function3(row, nodes, flow, bus_attrs, 'target', 'source',
-                               i)
-
-            outputs = function3(row, nodes, flow, bus_attrs, 'source', 'target',
-                                i)
-
-            conversion_factors = function4(row, nodes, nodes_flows_seq, i)
-
-            # add node to dict and assign attributes depending on
-            # if there are multiple lines per node or not
-            try:
-                for source, f in inputs.items():
-                    network.flow[source, node] = f
-                for target, f in outputs.items():
-                    network.flow[node, target] = f
-                if node.label in nodes.keys():
-                    if not isinstance(node, Bus):
-                        node.conversion_factors.update(conversion_factors)
-                else:
-                    if not isinstance(node, Bus):
-                        node.conversion_factors = conversion_factors
-                        nodes[node.label] = node
-            except:
-                print('Error adding node to dict in line', i+2, 'in csv file.')
-                print('Label:', row['label'])
-                raise
+    for i, r in zip(valid.index, valid.to_dict('records')):
+        # save column labels and row values (without NaN) in dict
+        row = {k: v for k, v in r.items() if not pd.isnull(v)}
+
+        # function1
+        node = function1(row, nodes, classes, flow_attrs, seq_attributes,
+                         sequences, i)
+
+        # create flow and set attributes
+        flow = function2(row, node, flow_attrs, seq_attributes, sequences, i)
+
+        # inputs, outputs and conversion_factors
+        inputs = function3(row, nodes, flow, bus_attrs, 'target', 'source', i)
+
+        outputs = function3(row, nodes, flow, bus_attrs, 'source', 'target',
+                            i)
+
+        conversion_factors = function4(row, nodes, sequences, i)
+
+        # add node to dict and assign attributes depending on
+        # if there are multiple lines per node or not
+        try:
+            for source, f in inputs.items():
+                network.flow[source, node] = f
+            for target, f in outputs.items():
+                network.flow[node, target] = f
+            if node.label in nodes.keys():
+                if not isinstance(node, Bus):
+                    node.conversion_factors.update(conversion_factors)
+            else:
+                if not isinstance(node, Bus):
+                    node.conversion_factors = conversion_factors
+                    nodes[node.label] = node
+        except:
+            print('Error adding node to dict in line', i+2, 'in csv file.')
+            print('Label:', row['label'])
+            raise
 
     return nodes
 
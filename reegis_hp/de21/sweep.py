@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+
+import os
+import logging
+import itertools
+import functools
+import datetime
+from concurrent import futures
+
+import pandas as pd
+
+from oemof.tools import logger
+
+import config as cfg
+import configuration as config
+import scenario_tools as sc
+import create_scenario
+import scenario_data_generation as sdg
+import demand
+import rolling_horizon
+
+
+# Overrides that do not change the scenario tables.
+SOLVE_KEYS = (('general', 'solver'),)
+
+# Overrides that change the scenario data. All entries of the 'pv' attribute
+# (fractions of the pv sets) are allowed as well. The demand kind is one of
+# demand.PROFILE_KINDS.
+SCENARIO_KEYS = (('general', 'year'), ('general', 'weather_year'),
+                 ('general', 'demand_year'), ('general', 'demand_kind'),
+                 ('general', 'optimisation_target'),
+                 ('general', 'local_sources'))
+
+# Name of the thread option of the solvers.
+SOLVER_THREADS = {'gurobi': 'threads', 'cbc': 'threads', 'cplex': 'threads'}
+
+
+def expand_grid(grid):
+    """
+    Create one variant for each combination of the given overrides.
+
+    Parameters
+    ----------
+    grid : dict
+        Lists of values with the (attribute, key) of the configuration
+        object as key e.g. {('general', 'year'): [2013, 2014],
+        ('pv', 'LG290G3_ABB_tlt34_az180_alb02'): [0.3, 0.5]}.
+
+    Returns
+    -------
+    pandas.DataFrame : One row for each variant and one column for each
+        override.
+    """
+    keys = list(grid.keys())
+    unknown = [key for key in keys if key not in SOLVE_KEYS + SCENARIO_KEYS and
+               key[0] != 'pv']
+    if unknown:
+        raise ValueError(
+            "The overrides {0} do not change the scenario. Allowed are {1} "
+            "and the pv sets.".format(unknown, SOLVE_KEYS + SCENARIO_KEYS))
+    variants = pd.DataFrame(list(itertools.product(*grid.values())),
+                            columns=pd.MultiIndex.from_tuples(keys))
+    variants.index = ['v{0:03d}'.format(n) for n in range(len(variants))]
+    variants.index.name = 'variant'
+    return variants
+
+
+def apply_overrides(overrides):
+    """Create a configuration object and apply the overrides to it. The
+    weather and demand year follow an overridden year unless they are
+    overridden themselves."""
+    c = config.get_configuration()
+    for (attribute, key), value in overrides.items():
+        getattr(c, attribute)[key] = value
+    if ('general', 'year') in overrides:
+        for key in ('weather_year', 'demand_year'):
+            if ('general', key) not in overrides:
+                c.general[key] = overrides[('general', 'year')]
+    return c
+
+
+def check_demand_kind(c):
+    """Raise a ValueError if the demand kind is unknown."""
+    if c.general['demand_kind'] not in demand.PROFILE_KINDS:
+        raise ValueError("Unknown demand kind {0}. Allowed are {1}.".format(
+            c.general['demand_kind'], demand.PROFILE_KINDS))
+
+
+def generate_scenario(overrides, path, name):
+    """
+    Create the scenario data and the scenario tables of one set of
+    overrides. The scenario data (see scenario_data_generation) is written
+    to '<path>/<name>_data', the tables to the given path (binary sequence
+    table). Weather and demand sequences of another year are moved to the
+    scenario year (see create_scenario.move_to_year).
+    """
+    c = apply_overrides(overrides)
+    check_demand_kind(c)
+    c.paths['scenario_path'] = os.path.join(path, name + '_data')
+    if not os.path.isdir(c.paths['scenario_path']):
+        os.makedirs(c.paths['scenario_path'])
+
+    sdg.prepare_transformer(c)
+    sdg.prepare_sources(c)
+    sdg.prepare_storages(c)
+    sdg.prepare_demand(c)
+    sdg.prepare_transmission_lines(c)
+    sdg.prepare_commodity_sources(c)
+
+    de21 = create_scenario.create_scenario_tables(c, name, path, write=False)
+    parameterfile = os.path.join(path, name + '.csv')
+    sequencefile = os.path.join(path, name + '_seq' + sc.BINARY_EXTENSION)
+    de21.write_tables(parameterfile, sequencefile)
+    return parameterfile, sequencefile
+
+
+def load_scenario(parameterfile, sequencefile):
+    """Read the scenario tables and create the nodes."""
+    timeindex = sc.BinarySequenceTable(sequencefile).index
+    es = sc.SolphScenario(timeindex=timeindex)
+    es.read_tables(parameterfile, sequencefile, lazy=True)
+    es.create_nodes()
+    return es
+
+
+def solve_scenario(parameterfile, sequencefile, solver, threads=None,
+                   window=None, overlap=24):
+    """
+    Read the scenario tables, create the model and solve it.
+
+    Parameters
+    ----------
+    parameterfile : str
+    sequencefile : str
+    solver : str
+        Name of the solver.
+    threads : int
+        Maximal number of threads of the solver (if supported).
+    window : int
+        Number of time steps of each window of the rolling horizon solve
+        (see rolling_horizon.solve_rolling_horizon). The full time index is
+        solved at once if None.
+    overlap : int
+        Number of overlapping time steps of the windows.
+
+    Returns
+    -------
+    pandas.DataFrame : Results (see oemof.outputlib.ResultsDataFrame).
+    """
+    es = load_scenario(parameterfile, sequencefile)
+
+    cmdline_options = dict()
+    if threads is not None and solver in SOLVER_THREADS:
+        cmdline_options[SOLVER_THREADS[solver]] = threads
+    if window is None:
+        results, _ = rolling_horizon.solve_full(
+            es, solver, cmdline_options=cmdline_options)
+    else:
+        results, _ = rolling_horizon.solve_rolling_horizon(
+            es, solver, window, overlap, cmdline_options=cmdline_options)
+    return results
+
+
+def solve_variant(parameterfile, sequencefile, solver, threads=None,
+                  window=None, overlap=24):
+    """Worker of run_sweep. Returns the results and the solving time."""
+    start = datetime.datetime.now()
+    results = solve_scenario(parameterfile, sequencefile, solver, threads,
+                             window, overlap)
+    return results, str(datetime.datetime.now() - start)
+
+
+def run_sweep(grid, path=None, results_file=None, workers=None, threads=1,
+              window=None, overlap=24):
+    """
+    Create and solve one scenario for each combination of the overrides.
+
+    The scenario tables are created once for each combination of the
+    overrides that change the tables (all but SOLVE_KEYS). The variants are
+    solved in a process pool with a limited number of solver threads per
+    worker. All results are stored in one hdf5 file: the table 'variants'
+    holds the overrides of each variant, the results of each variant are
+    stored under 'results/<variant>'.
+
+    Parameters
+    ----------
+    grid : dict
+        Lists of values for each override (see expand_grid).
+    path : str
+        Path for the scenario tables and the results.
+    results_file : str
+        Name of the results file.
+    workers : int
+        Number of processes. Taken from the configuration ([sweep] workers)
+        if None.
+    threads : int
+        Maximal number of solver threads of each worker.
+    window : int
+        Window length of the rolling horizon solve (full solve if None).
+    overlap : int
+        Overlap of the windows of the rolling horizon solve.
+
+    Returns
+    -------
+    pandas.DataFrame : Variants with the overrides, the status and the
+        solving time.
+    """
+    if path is None:
+        path = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                            'my_scenarios', 'sweep')
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    if results_file is None:
+        results_file = 'sweep_results.h5'
+    if workers is None:
+        workers = cfg.get_default('sweep', 'workers', 1)
+
+    variants = expand_grid(grid)
+    gen_keys = [key for key in variants.columns if key not in SOLVE_KEYS]
+
+    # Check all variants before the first scenario is created.
+    for variant, values in variants.iterrows():
+        check_demand_kind(apply_overrides(
+            {key: values[key] for key in gen_keys}))
+
+    # Create the scenario tables once for each set of generating overrides.
+    tables = dict()
+    jobs = dict()
+    for variant, values in variants.iterrows():
+        gen_values = tuple(values[key] for key in gen_keys)
+        if gen_values not in tables:
+            name = 'sweep_{0}'.format(len(tables))
+            logging.info("Creating scenario tables {0}: {1}".format(
+                name, dict(zip(gen_keys, gen_values))))
+            tables[gen_values] = generate_scenario(
+                dict(zip(gen_keys, gen_values)), path, name)
+        if ('general', 'solver') in values:
+            solver = values[('general', 'solver')]
+        else:
+            solver = cfg.get('general', 'solver')
+        jobs[variant] = tables[gen_values] + (solver,)
+
+    variants[('sweep', 'status')] = None
+    variants[('sweep', 'duration')] = None
+    store = pd.HDFStore(os.path.join(path, results_file), mode='w')
+    with futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        started = dict()
+        for variant, job in jobs.items():
+            future = executor.submit(solve_variant, *job, threads=threads,
+                                     window=window, overlap=overlap)
+            started[future] = variant
+        for future in futures.as_completed(started):
+            variant = started[future]
+            try:
+                results, duration = future.result()
+                store['results/' + variant] = results
+                variants.loc[variant, ('sweep', 'status')] = 'solved'
+                variants.loc[variant, ('sweep', 'duration')] = duration
+            except Exception as e:
+                logging.error("Variant {0} failed: {1}".format(variant, e))
+                variants.loc[variant, ('sweep', 'status')] = 'failed'
+            logging.info("Variant {0}: {1}".format(
+                variant, variants.loc[variant, ('sweep', 'status')]))
+
+    table = variants.copy()
+    table.columns = ['.'.join(col) for col in table.columns]
+    store['variants'] = table.astype(str)
+    store.close()
+    return variants
+
+
+if __name__ == "__main__":
+    logger.define_logging()
+    my_grid = {('general', 'year'): [2013, 2014],
+               ('general', 'solver'): ['cbc', 'gurobi']}
+    run_sweep(my_grid, workers=2, threads=2)
+
+    # Compare the rolling horizon solve (one week, one day overlap) with the
+    # full solve of the first scenario.
+    my_path = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                           'my_scenarios', 'sweep')
+    rolling_horizon.benchmark(
+        functools.partial(load_scenario,
+                          os.path.join(my_path, 'sweep_0.csv'),
+                          os.path.join(my_path, 'sweep_0_seq' +
+                                       sc.BINARY_EXTENSION)),
+        cfg.get('general', 'solver'), window=168, overlap=24)
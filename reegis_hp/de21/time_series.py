@@ -3,14 +3,30 @@
 import os
 import logging
 import requests
+import numpy as np
 import pandas as pd
 import config as cfg
 import configuration as config
 from oemof.tools import logger
 
 
-def read_original_timeseries_file(overwrite=False):
-    """Read file if exists."""
+LOAD_COLUMNS = ['DE_load_']
+
+RE_COLUMNS = [
+    'DE_solar_capacity', 'DE_solar_generation', 'DE_solar_profile',
+    'DE_wind_capacity', 'DE_wind_generation', 'DE_wind_profile',
+    'DE_wind_offshore_capacity', 'DE_wind_offshore_generation',
+    'DE_wind_offshore_profile', 'DE_wind_onshore_capacity',
+    'DE_wind_onshore_generation', 'DE_wind_onshore_profile']
+
+RE_SUBSET = [
+    'DE_solar_capacity', 'DE_solar_generation', 'DE_solar_profile',
+    'DE_wind_capacity', 'DE_wind_generation', 'DE_wind_profile']
+
+
+def read_original_timeseries_file(overwrite=False, columns=None):
+    """Read file if exists. If columns are given, only these columns are
+    read (as float32)."""
 
     orig_csv_file = os.path.join(cfg.get('paths', 'time_series'),
                                  cfg.get('time_series', 'original_file'))
@@ -38,11 +54,85 @@ def read_original_timeseries_file(overwrite=False):
         with open(json, 'wb') as fout:
             fout.write(req.content)
 
-    orig = pd.read_csv(orig_csv_file, index_col=[0], parse_dates=True)
+    if columns is None:
+        orig = pd.read_csv(orig_csv_file, index_col=[0], parse_dates=True)
+    else:
+        first = pd.read_csv(orig_csv_file, nrows=0).columns[0]
+        orig = pd.read_csv(orig_csv_file, index_col=[0], parse_dates=True,
+                           usecols=[first] + list(columns),
+                           dtype={col: np.float32 for col in columns})
     orig = orig.tz_localize('UTC').tz_convert('Europe/Berlin')
     return orig
 
 
+def store_file():
+    return os.path.join(cfg.get('paths', 'time_series'),
+                        cfg.get_default('time_series', 'store_file',
+                                        'time_series_de.h5'))
+
+
+def convert_timeseries_file(overwrite=False):
+    """
+    Convert the original csv file into a binary store (hdf5) with one table
+    for each year. Only the columns used by de21 (LOAD_COLUMNS and
+    RE_COLUMNS) are stored as float32. The table 'years' holds the first and
+    last time step and the number of rows of each year.
+    """
+    filename = store_file()
+    if os.path.isfile(filename) and not overwrite:
+        return filename
+
+    ts = read_original_timeseries_file(overwrite,
+                                       columns=LOAD_COLUMNS + RE_COLUMNS)
+    years = pd.DataFrame(columns=['first', 'last', 'rows'])
+    store = pd.HDFStore(filename + '.tmp', mode='w')
+    for year, table in ts.groupby(ts.index.year):
+        store['y{0}'.format(year)] = table
+        years.loc[year] = (str(table.index[0]), str(table.index[-1]),
+                           len(table))
+    years.index.name = 'year'
+    store['years'] = years
+    store.close()
+    os.replace(filename + '.tmp', filename)
+    logging.info("Time series stored in {0} ({1} years).".format(
+        filename, len(years)))
+    return filename
+
+
+def get_years(overwrite=False):
+    """Years of the time series store with their first and last time step
+    and the number of rows."""
+    return pd.read_hdf(convert_timeseries_file(overwrite), 'years')
+
+
+def get_year(year, columns=None, overwrite=False):
+    """
+    Read one year of the time series store (see convert_timeseries_file).
+
+    Parameters
+    ----------
+    year : int
+    columns : list of str
+        Columns to read. All columns by default.
+    overwrite : bool
+        Recreate the store from the original file.
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    filename = convert_timeseries_file(overwrite)
+    with pd.HDFStore(filename, mode='r') as store:
+        key = 'y{0}'.format(year)
+        if key not in store:
+            raise ValueError("Year {0} not in time series store {1}.".format(
+                year, filename))
+        table = store[key]
+    if columns is not None:
+        table = table[columns]
+    return table
+
+
 def prepare_de_file(overwrite=False):
     """Convert demand file. CET index and Germany's load only."""
     de_file = os.path.join(cfg.get('paths', 'time_series'),
@@ -58,26 +148,16 @@ def prepare_de_file(overwrite=False):
 
 def split_timeseries_file(overwrite=False):
     path_pattern = os.path.join(cfg.get('paths', 'time_series'), '{0}')
-    de_file = path_pattern.format(cfg.get('time_series', 'de_file'))
 
-    if not os.path.isfile(de_file) or overwrite:
-        prepare_de_file(overwrite)
-    de_ts = pd.read_csv(de_file, index_col='cet')
+    filename = convert_timeseries_file(overwrite)
+    with pd.HDFStore(filename, mode='r') as store:
+        de_ts = pd.concat([store['y{0}'.format(year)]
+                           for year in store['years'].index])
 
     load = pd.DataFrame(de_ts[pd.notnull(de_ts['DE_load_'])]['DE_load_'],
                         columns=['DE_load_'])
 
-    re_columns = [
-        'DE_solar_capacity', 'DE_solar_generation', 'DE_solar_profile',
-        'DE_wind_capacity', 'DE_wind_generation', 'DE_wind_profile',
-        'DE_wind_offshore_capacity', 'DE_wind_offshore_generation',
-        'DE_wind_offshore_profile', 'DE_wind_onshore_capacity',
-        'DE_wind_onshore_generation', 'DE_wind_onshore_profile']
-    re_subset = [
-        'DE_solar_capacity', 'DE_solar_generation', 'DE_solar_profile',
-        'DE_wind_capacity', 'DE_wind_generation', 'DE_wind_profile']
-
-    renewables = de_ts.dropna(subset=re_subset, how='any')[re_columns]
+    renewables = de_ts.dropna(subset=RE_SUBSET, how='any')[RE_COLUMNS]
 
     load_file = path_pattern.format(cfg.get('time_series', 'load_file'))
     if not os.path.isfile(load_file) or overwrite:
@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 from matplotlib import pyplot as plt
 from oemof.tools import logger
 import os
@@ -6,6 +7,7 @@ import calendar
 import logging
 import requests
 from shapely.geometry import Point
+from shapely.strtree import STRtree
 import datetime
 from shapely.wkt import loads as wkt_loads
 import geopandas as gpd
@@ -77,9 +79,51 @@ def create_geo_df(df, wkt_column=None, time=None, keep_wkt=False):
     return gpd.GeoDataFrame(df, crs='epsg:4326', geometry='geom')
 
 
+def spatial_join_loop(gdf, spatial_df, name):
+    """Pass the name (index) of the intersecting polygon to the column 'name'
+    by testing all points against one polygon after another.
+    """
+    length = len(spatial_df.index)
+    for i, v in spatial_df.geom.iteritems():
+        length -= 1
+        logging.info("Remains: {0}".format(str(length)))
+        gdf.loc[gdf.intersects(wkt_loads(v)), name] = i
+    return gdf
+
+
+def spatial_join_strtree(gdf, spatial_df, name, batch_size=100000):
+    """Pass the name (index) of the intersecting polygon to the column 'name'
+    using a STR-tree of the polygons.
+
+    The points are queried in batches. If a point intersects with more than
+    one polygon, the last polygon of the spatial_df wins (same result as
+    spatial_join_loop).
+    """
+    polygons = [wkt_loads(v) for v in spatial_df.geom]
+    tree = STRtree(polygons)
+    points = np.asarray(gdf.geometry.values, dtype=object)
+
+    assigned = np.full(len(points), -1)
+    for n in range(0, len(points), batch_size):
+        pidx, gidx = tree.query(points[n:n + batch_size],
+                                predicate='intersects')
+        np.maximum.at(assigned, pidx + n, gidx)
+
+    found = assigned >= 0
+    gdf.loc[found, name] = spatial_df.index[assigned[found]]
+    return gdf
+
+
 def add_spatial_name(gdf, path_spatial_file, name, category, icol='gid',
-                     time=None, ignore_invalid=False):
-    """Add name of containing region to new column for all points."""
+                     time=None, ignore_invalid=False, method='strtree',
+                     nearest=True):
+    """Add name of containing region to new column for all points.
+
+    The method 'strtree' uses a spatial index of the polygons, 'loop' tests
+    all points against one polygon after another. Points outside all regions
+    are assigned to the nearest region if nearest is True, otherwise the
+    point is buffered until it intersects with a region.
+    """
     logging.info("Add spatial name for column: {0}".format(name))
     if time is None:
         time = datetime.datetime.now()
@@ -87,9 +131,6 @@ def add_spatial_name(gdf, path_spatial_file, name, category, icol='gid',
     # Read spatial file (with polygons).
     spatial_df = pd.read_csv(path_spatial_file, index_col=icol)
 
-    # Use the length to create an output.
-    length = len(spatial_df.index)
-
     # Write datasets without coordinates to a file for later analyses.
     gdf_invalid = gdf.loc[~gdf.is_valid].copy()
 
@@ -108,10 +149,17 @@ def add_spatial_name(gdf, path_spatial_file, name, category, icol='gid',
     # Find points that intersect with polygon and pass name of the polygon to
     # a new column (name of the new column is defined by 'name' parameter.
     gdf_valid = gdf.loc[gdf.is_valid].copy()
-    for i, v in spatial_df.geom.iteritems():
-        length -= 1
-        logging.info("Remains: {0}".format(str(length)))
-        gdf_valid.loc[gdf_valid.intersects(wkt_loads(v)), name] = i
+    if name not in gdf_valid:
+        gdf_valid[name] = None
+    join_start = datetime.datetime.now()
+    if method == 'strtree':
+        gdf_valid = spatial_join_strtree(gdf_valid, spatial_df, name)
+    elif method == 'loop':
+        gdf_valid = spatial_join_loop(gdf_valid, spatial_df, name)
+    else:
+        raise ValueError("Unknown spatial join method: {0}".format(method))
+    logging.info("Spatial join ({0}) for {1}: {2}".format(
+        method, name, str(datetime.datetime.now() - join_start)))
     logging.info("Spatial name added to {0}: {1}".format(name,
                  str(datetime.datetime.now() - time)))
 
@@ -121,12 +169,58 @@ def add_spatial_name(gdf, path_spatial_file, name, category, icol='gid',
         logging.info("Some points do not intersect. Buffering {0}...".format(
             name
         ))
-        gdf_valid = find_intersection_with_buffer(gdf_valid, spatial_df, name)
+        if nearest:
+            gdf_valid = find_nearest_region(gdf_valid, spatial_df, name,
+                                            category)
+        else:
+            gdf_valid = find_intersection_with_buffer(gdf_valid, spatial_df,
+                                                      name)
     else:
         logging.info("All points intersect. No buffering necessary.")
     return gdf_valid
 
 
+def find_nearest_region(gdf, spatial_df, column, category=None,
+                        max_distance=5):
+    """Assign points outside the regions to the nearest region.
+
+    All points without a region are queried at once using a STR-tree of the
+    polygons. The distances (in the unit of the coordinates) are written to
+    the messages folder. Points farther away than max_distance (same limit as
+    the 500 buffer steps of find_intersection_with_buffer) are not assigned.
+    """
+    missing = gdf.loc[gdf[column].isnull()]
+    polygons = [wkt_loads(v) for v in spatial_df.geom]
+    tree = STRtree(polygons)
+    points = np.asarray(missing.geometry.values, dtype=object)
+    (pidx, gidx), distance = tree.query_nearest(
+        points, max_distance=max_distance, return_distance=True,
+        all_matches=False)
+
+    nearest = pd.DataFrame(index=missing.index)
+    if 'id' in missing:
+        nearest['id'] = missing['id']
+    nearest[column] = None
+    nearest['distance'] = np.nan
+    nearest.iloc[pidx, nearest.columns.get_loc(column)] = (
+        spatial_df.index[gidx])
+    nearest.iloc[pidx, nearest.columns.get_loc('distance')] = distance
+    found = nearest[column].notnull()
+    gdf.loc[nearest.index[found], column] = nearest.loc[found, column]
+
+    path = os.path.join(cfg.get('paths', 'messages'),
+                        '{0}_{1}_nearest.csv'.format(category, column))
+    nearest.to_csv(path)
+    for row in nearest.loc[~found].iterrows():
+        warnings.warn(
+            "{0} does not intersect with any region. Please check".format(
+                gdf.loc[row[0]]))
+    logging.warning("{0} points outside the regions assigned to the nearest "
+                    "region (max. distance: {1:.4f}). See '{2}'.".format(
+                        found.sum(), nearest['distance'].max(), path))
+    return gdf
+
+
 def find_intersection_with_buffer(gdf, spatial_df, column):
     """Find intersection of points outside the regions by buffering the point
     until the buffered point intersects with a region.
@@ -2,6 +2,9 @@ __copyright__ = "Uwe Krien"
 __license__ = "GPLv3"
 
 import pandas as pd
+import numpy as np
+from scipy import special
+import tables
 import os
 import calendar
 import logging
@@ -18,13 +21,63 @@ except ImportError:
     sqlalchemy = None
 
 
+def get_wind_speed_block(weather_path, in_file_pattern, year,
+                         columns_pattern=None):
+    """
+    Read the wind speed of all cells of one year as one block (time x cell).
+
+    The columnar weather file is used if it exists, otherwise the wind speed
+    is collected from the hdf5 file. Surplus entries at the end of the year
+    are removed.
+
+    Parameters
+    ----------
+    weather_path : str
+        Path to folder that contains all needed files.
+    in_file_pattern : str
+        Name of the hdf5 weather files with one wildcard for the year.
+    year : int
+        Year of the weather data.
+    columns_pattern : str
+        Name of the columnar weather files with one wildcard for the year.
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    if calendar.isleap(year):
+        h_max = 8784
+    else:
+        h_max = 8760
+
+    if columns_pattern is not None:
+        filename = os.path.join(weather_path,
+                                columns_pattern.format(year=year))
+        if os.path.isfile(filename):
+            return get_weather_columns(filename, 'v_wind').iloc[:h_max]
+
+    store = pd.HDFStore(os.path.join(
+        weather_path, in_file_pattern.format(year=year)), mode='r')
+    block = pd.DataFrame({int(key[2:]): store[key]['v_wind'].iloc[:h_max]
+                          for key in store.keys()})
+    store.close()
+    return block
+
+
 def get_average_wind_speed(weather_path, grid_geometry_file, geometry_path,
-                           in_file_pattern, out_file, overwrite=False):
+                           in_file_pattern, out_file, overwrite=False,
+                           columns_pattern=None, percentiles=(10, 50, 90),
+                           bin_width=0.1):
     """
     Get average wind speed over all years for each coastdat region. This can be
     used to select the appropriate wind turbine for each region
     (strong/low wind turbines).
-    
+
+    The years are read one after another and only running sums and a
+    histogram of the wind speed are kept for each region. Besides the average
+    the given percentiles and the parameters of a Weibull distribution (shape
+    'weibull_k', scale 'weibull_c') are calculated in the same pass.
+
     Parameters
     ----------
     overwrite : boolean
@@ -32,7 +85,7 @@ def get_average_wind_speed(weather_path, grid_geometry_file, geometry_path,
     weather_path : str
         Path to folder that contains all needed files.
     geometry_path : str
-        Path to folder that contains geometry files.   
+        Path to folder that contains geometry files.
     grid_geometry_file : str
         Name of the geometry file of the weather data grid.
     in_file_pattern : str
@@ -40,6 +93,13 @@ def get_average_wind_speed(weather_path, grid_geometry_file, geometry_path,
         weather_data_{0}.h5
     out_file : str
         Name of the results file (csv)
+    columns_pattern : str
+        Name of the columnar weather files with one wildcard for the year. The
+        columnar files are used if they exist.
+    percentiles : tuple
+        Percentiles of the wind speed to calculate.
+    bin_width : float
+        Width of the histogram bins [m/s] used for the percentiles.
     """
     if not os.path.isfile(os.path.join(weather_path, out_file)) or overwrite:
         logging.info("Calculating the average wind speed...")
@@ -57,47 +117,46 @@ def get_average_wind_speed(weather_path, grid_geometry_file, geometry_path,
         polygons = pd.DataFrame(tools.postgis2shapely(polygons_wkt.geom),
                                 index=polygons_wkt.gid, columns=['geom'])
 
-        # Opening all weather files
-        store = dict()
-
-        # open hdf files
+        edges = np.arange(0, 60 + bin_width, bin_width)
+        cells = None
         for year in years:
-            store[year] = pd.HDFStore(os.path.join(
-                weather_path, in_file_pattern.format(year=year)), mode='r')
-        logging.info("Files loaded.")
-
-        keys = store[years[0]].keys()
-        logging.info("Keys loaded.")
-
-        n = len(list(keys))
-        logging.info("Remaining: {0}".format(n))
-        for key in keys:
-            wind_speed_avg = pd.Series()
-            n -= 1
-            if n % 100 == 0:
-                logging.info("Remaining: {0}".format(n))
-            weather_id = int(key[2:])
-            for year in years:
-                # Remove entries if year has to many entries.
-                if calendar.isleap(year):
-                    h_max = 8784
-                else:
-                    h_max = 8760
-                ws = store[year][key]['v_wind']
-                surplus = h_max - len(ws)
-                if surplus < 0:
-                    ws = ws.ix[:surplus]
-
-                # add wind speed time series
-                wind_speed_avg = wind_speed_avg.append(
-                    ws, verify_integrity=True)
-
-            # calculate the average wind speed for one grid item
-            polygons.loc[weather_id, 'v_wind_avg'] = wind_speed_avg.mean()
-
-        # Close hdf files
-        for year in years:
-            store[year].close()
+            logging.info("Reading wind speed of {0}.".format(year))
+            block = get_wind_speed_block(weather_path, in_file_pattern, year,
+                                         columns_pattern)
+            if cells is None:
+                cells = block.columns
+                count = np.zeros(len(cells))
+                v_sum = np.zeros(len(cells))
+                v2_sum = np.zeros(len(cells))
+                hist = np.zeros((len(cells), len(edges) + 1))
+            ws = block.reindex(columns=cells).values
+            valid = ~np.isnan(ws)
+            count += valid.sum(axis=0)
+            v_sum += np.nansum(ws, axis=0)
+            v2_sum += np.nansum(ws ** 2, axis=0)
+
+            # Histogram of each cell (bin 0: < 0, bin -1: > max)
+            bins = (np.searchsorted(edges, np.where(valid, ws, 0),
+                                    side='right') +
+                    np.arange(len(cells)) * hist.shape[1])
+            hist += np.bincount(bins[valid], minlength=hist.size).reshape(
+                hist.shape)
+
+        mean = v_sum / count
+        std = np.sqrt(np.maximum(v2_sum / count - mean ** 2, 0))
+        polygons.loc[cells, 'v_wind_avg'] = mean
+
+        # Percentiles (upper edge of the bin that reaches the percentile)
+        cum = hist.cumsum(axis=1) / count[:, np.newaxis]
+        upper = np.append(edges, np.inf)
+        for perc in percentiles:
+            pos = (cum < perc / 100).sum(axis=1)
+            polygons.loc[cells, 'v_wind_p{0}'.format(perc)] = upper[pos]
+
+        # Weibull parameters (empirical method of Justus)
+        k = (std / mean) ** -1.086
+        polygons.loc[cells, 'weibull_k'] = k
+        polygons.loc[cells, 'weibull_c'] = mean / special.gamma(1 + 1 / k)
 
         # write results to csv file
         polygons.to_csv(os.path.join(weather_path, out_file))
@@ -161,6 +220,146 @@ def fetch_coastdat2_year_from_db(weather_path, geometry_path, out_file_pattern,
             logging.info("Weather data for {0} exists. Skipping.".format(year))
 
 
+COASTDAT2_VARIABLES = ['dhi', 'dirhi', 'pressure', 'temp_air', 'v_wind', 'Z0']
+
+
+def convert_coastdat2_to_columns(weather_path, in_file_pattern,
+                                 out_file_pattern, years=None, overwrite=False,
+                                 chunk_cells=64, complevel=5):
+    """Convert the yearly coastDat2 hdf5 files (one node per cell) into
+    columnar files.
+
+    Each variable is stored as one compressed and chunked array (time x cell)
+    together with the time index ('times') and the cell ids ('cells'). Each
+    chunk holds the full year of 'chunk_cells' cells, so reading one variable
+    for many cells needs only a few chunk reads.
+
+    Parameters
+    ----------
+    weather_path : str
+        Path to folder that contains all needed files.
+    in_file_pattern : str
+        Name of the hdf5 weather files with one wildcard for the year e.g.
+        weather_data_{year}.h5
+    out_file_pattern : str
+        Name of the columnar weather files with one wildcard for the year.
+    years : list of integer
+        Years to convert. All existing weather files are converted if None.
+    overwrite : boolean
+        Skip existing files if set to False.
+    chunk_cells : int
+        Number of cells in one chunk.
+    complevel : int
+        Compression level (0-9) of the blosc compressor.
+    """
+    if years is None:
+        years = range(1970, 2020)
+
+    filters = tables.Filters(complevel=complevel, complib='blosc')
+    for year in years:
+        in_file = os.path.join(weather_path, in_file_pattern.format(year=year))
+        out_file = os.path.join(weather_path,
+                                out_file_pattern.format(year=year))
+        if not os.path.isfile(in_file):
+            continue
+        if os.path.isfile(out_file) and not overwrite:
+            logging.info("Columnar weather file for {0} exists. "
+                         "Skipping.".format(year))
+            continue
+        logging.info("Converting weather data of {0}.".format(year))
+
+        store = pd.HDFStore(in_file, mode='r')
+        keys = store.keys()
+        gids = np.array([int(key[2:]) for key in keys])
+
+        # Remove entries if year has to many entries.
+        if calendar.isleap(year):
+            h_max = 8784
+        else:
+            h_max = 8760
+        times = store[keys[0]].index[:h_max]
+
+        h5 = tables.open_file(out_file + '.tmp', mode='w')
+        h5.create_array('/', 'times', times.asi8)
+        h5.create_array('/', 'cells', gids)
+        h5.root._v_attrs.tz = str(times.tz)
+        h5.root._v_attrs.year = year
+        arrays = dict()
+        for var in COASTDAT2_VARIABLES:
+            arrays[var] = h5.create_carray(
+                '/', var, atom=tables.Float64Atom(dflt=np.nan),
+                shape=(len(times), len(gids)), filters=filters,
+                chunkshape=(len(times), min(chunk_cells, len(gids))))
+
+        reindexed = 0
+        for n in range(0, len(keys), chunk_cells):
+            frames = list()
+            for key in keys[n:n + chunk_cells]:
+                w = store[key]
+                if not w.index.equals(times):
+                    w = w.reindex(times)
+                    reindexed += 1
+                frames.append(w)
+            for var in COASTDAT2_VARIABLES:
+                arrays[var][:, n:n + chunk_cells] = np.column_stack(
+                    [w[var].values for w in frames])
+        store.close()
+        h5.close()
+        os.replace(out_file + '.tmp', out_file)
+        if reindexed > 0:
+            logging.warning("{0} cells of {1} adapted to the common time "
+                            "index.".format(reindexed, year))
+
+
+def get_weather_cells(filename):
+    """Get the cell ids of a columnar weather file in stored order."""
+    h5 = tables.open_file(filename, mode='r')
+    cells = h5.root.cells.read()
+    h5.close()
+    return pd.Index(cells, name='gid')
+
+
+def get_weather_columns(filename, variable, cells=None):
+    """Read one variable for many cells from a columnar weather file.
+
+    Parameters
+    ----------
+    filename : str
+        Full path of the columnar weather file.
+    variable : str
+        Name of the weather variable e.g. 'v_wind'.
+    cells : list of integer
+        Cell ids (gid) to read. All cells are read if None.
+
+    Returns
+    -------
+    pandas.DataFrame : One column (gid) for each cell and the time as index.
+        The data is stored in one single array (see DataFrame.values).
+    """
+    h5 = tables.open_file(filename, mode='r')
+    stored = pd.Index(h5.root.cells.read())
+    times = pd.DatetimeIndex(h5.root.times.read())
+    tz = h5.root._v_attrs.tz
+    node = h5.get_node('/', variable)
+    if cells is None:
+        data = node.read()
+        cells = stored
+    else:
+        cells = pd.Index(cells)
+        pos = stored.get_indexer(cells)
+        if (pos < 0).any():
+            h5.close()
+            raise KeyError("Cells not in {0}: {1}".format(
+                filename, list(cells[pos < 0])))
+        # Fancy selection needs increasing positions without duplicates.
+        unique_pos, inverse = np.unique(pos, return_inverse=True)
+        data = node[:, unique_pos.tolist()][:, inverse]
+    h5.close()
+    if tz != 'None':
+        times = times.tz_localize('UTC').tz_convert(tz)
+    return pd.DataFrame(data, index=times, columns=pd.Index(cells, name='gid'))
+
+
 def coastdat_id2coord():
     """
     Creating a file with the latitude and longitude for all coastdat2 data sets.
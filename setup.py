@@ -13,10 +13,11 @@ setup(name='reegis_hp',
                         'demandlib',
                         'tables',
                         'matplotlib',
-                        'shapely',
+                        'shapely >= 2.0',
                         'windpowerlib',
                         'pvlib',
                         'tables',
                         'geopandas',
+                        'scipy',
                         'requests']
       )